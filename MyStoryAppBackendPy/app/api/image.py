@@ -2,11 +2,14 @@
 图片扩展 API
 """
 
+import asyncio
+
 from fastapi import APIRouter, UploadFile, File, Form, HTTPException
 from typing import Optional
 
 from app.models.schemas import ImageExpandResponse
 from app.services.bailian_image import bailian_image_service
+from app.services.expansion_cache import expansion_cache
 from app.core.logger import logger
 
 router = APIRouter()
@@ -63,3 +66,9 @@ async def validate_image_format(mimetype: str):
     """验证图片格式是否支持"""
     is_valid = bailian_image_service.validate_image(mimetype)
     return {"success": True, "data": {"valid": is_valid}}
+
+
+@router.get("/cache/stats")
+async def get_cache_stats():
+    """图片扩展缓存命中统计"""
+    return {"success": True, "data": await asyncio.to_thread(expansion_cache.stats)}
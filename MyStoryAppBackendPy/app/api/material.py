@@ -151,7 +151,7 @@ async def upload_material(
         file_size=file_size,
         file_format=file_ext.lower(),
         tags=tags,
-        metadata="{}"
+        meta_data="{}"
     )
     
     db.add(material)
@@ -217,7 +217,7 @@ async def list_materials(
             MaterialResponse(
                 **{k: v for k, v in m.__dict__.items() if k in MaterialResponse.model_fields},
                 tags=m.tags.split(",") if m.tags else [],
-                metadata=json.loads(m.metadata) if m.metadata else {}
+                metadata=json.loads(m.meta_data) if m.meta_data else {}
             )
             for m in materials
         ],
@@ -253,7 +253,7 @@ async def get_material(
     return MaterialResponse(
         **{k: v for k, v in material.__dict__.items() if k in MaterialResponse.model_fields},
         tags=material.tags.split(",") if material.tags else [],
-        metadata=json.loads(material.metadata) if material.metadata else {}
+        metadata=json.loads(material.meta_data) if material.meta_data else {}
     )
 
 
@@ -297,7 +297,7 @@ async def update_material(
     return MaterialResponse(
         **{k: v for k, v in material.__dict__.items() if k in MaterialResponse.model_fields},
         tags=material.tags.split(",") if material.tags else [],
-        metadata=json.loads(material.metadata) if material.metadata else {}
+        metadata=json.loads(material.meta_data) if material.meta_data else {}
     )
 
 
@@ -2,10 +2,13 @@
 语音合成 API
 """
 
+import asyncio
+
 from fastapi import APIRouter, HTTPException
 
 from app.models.schemas import TTSRequest, TTSResponse, VoiceListResponse, VoiceInfo
 from app.services.bailian_tts import bailian_tts_service
+from app.services.tts_cache import tts_cache
 from app.core.logger import logger
 
 router = APIRouter()
@@ -19,6 +22,8 @@ async def generate_speech(request: TTSRequest):
     - **text**: 要合成的文字 (1-5000字)
     - **voice_type**: 语音类型
     - **speed**: 语速 (0.5-2.0)
+    
+    相同的文本、语音类型与语速直接返回缓存的音频
     """
     try:
         result = await bailian_tts_service.generate_speech(
@@ -47,3 +52,9 @@ async def list_voices():
     voice_list = [VoiceInfo(**v) for v in voices]
     
     return VoiceListResponse(success=True, data=voice_list)
+
+
+@router.get("/cache/stats")
+async def get_cache_stats():
+    """配音缓存命中统计"""
+    return {"success": True, "data": await asyncio.to_thread(tts_cache.stats)}
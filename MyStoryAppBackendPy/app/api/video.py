@@ -2,119 +2,361 @@
 视频生成 API
 """
 
+import asyncio
+import json
 import uuid
-from fastapi import APIRouter, HTTPException, BackgroundTasks
+from typing import Optional
+from fastapi import APIRouter, HTTPException, BackgroundTasks, Depends, Header, Request
+from fastapi.responses import StreamingResponse
 from celery.result import AsyncResult
 
 from app.models.schemas import (
     VideoCreateRequest, VideoCreateResponse, VideoStatusResponse
 )
-from app.tasks.video_tasks import generate_video_task
-from app.tasks import celery_app
+from app.config import settings
+from app.tasks.scheduler import fair_scheduler, preview_job_id
+from app.tasks.metrics import queue_metrics
+from app.services.task_status import TERMINAL_STATUSES, task_status_store, stream_events
+from app.services.cancellation import request_cancel
+from app.services.eta import JobFeatures, eta_estimator
+from app.services.dedup import job_deduplicator
+from app.auth.utils import get_optional_user
+from app.db.database import AsyncSessionLocal
+from app.db.material import VideoTaskDB
+from app.db.models import User
 from app.core.logger import logger
 
 router = APIRouter()
 
 
+def _slides_payload(request: VideoCreateRequest) -> list:
+    """转换为任务使用的幻灯片数据（补充幻灯片ID）"""
+    return [
+        {"id": str(i), **slide.model_dump()}
+        for i, slide in enumerate(request.slides)
+    ]
+
+
+async def _save_task(task_id: str, request: VideoCreateRequest, user: User):
+    """
+    记录视频任务（登录用户），之后的进度由 Worker 批量更新
+    
+    写入失败不影响任务提交
+    """
+    try:
+        async with AsyncSessionLocal() as session:
+            session.add(VideoTaskDB(
+                user_id=user.id,
+                task_id=task_id,
+                title=request.title,
+                description=request.description,
+                status="pending",
+                message="排队中...",
+                duration=sum(slide.duration for slide in request.slides),
+                resolution=request.config.resolution.value,
+                config_snapshot=json.dumps(request.config.model_dump(mode="json"), ensure_ascii=False),
+                slides_count=len(request.slides)
+            ))
+            await session.commit()
+    except Exception as e:
+        logger.warning(f"记录视频任务失败: {task_id}, {e}")
+
+
+def _user_key(http_request: Request, user: Optional[User]) -> str:
+    """公平调度使用的用户标识，匿名请求按客户端地址区分"""
+    if user:
+        return f"user:{user.id}"
+    client = http_request.client
+    return f"ip:{client.host}" if client else "anon"
+
+
+def _queue_data(queued: Optional[tuple]) -> dict:
+    """排队位置与预计等待时间（已提交给 Worker 时均为 0）"""
+    ahead, wait = queued or (0, 0.0)
+    return {"queue_position": ahead, "estimated_wait": round(wait)}
+
+
+def _existing_task_data(task_id: str, record: Optional[dict]) -> dict:
+    """重复请求返回已有任务的信息"""
+    record = record or {}
+    data = {
+        "task_id": task_id,
+        "celery_task_id": record.get("celery_task_id"),
+        "status": record.get("status", "pending"),
+        "progress": record.get("progress", 0.0),
+        "deduplicated": True
+    }
+    for field in ("output_url", "preview_url"):
+        if record.get(field):
+            data[field] = record[field]
+    return data
+
+
 @router.post("/create", response_model=VideoCreateResponse)
-async def create_video(request: VideoCreateRequest):
+async def create_video(
+    request: VideoCreateRequest,
+    http_request: Request,
+    current_user: Optional[User] = Depends(get_optional_user),
+    idempotency_key: Optional[str] = Header(default=None, alias="Idempotency-Key", max_length=200)
+):
     """
     创建视频生成任务
     
-    异步任务，返回 task_id 用于查询进度
+    异步任务，返回 task_id 用于查询进度；携带 Token 时任务记录到用户的任务列表。
+    登录用户的相同请求（Idempotency-Key 相同，或未提供时幻灯片、配置与 preview 完全相同）
+    在进行中或已完成时直接返回原任务，响应中 deduplicated 为 true；
+    匿名请求只按 Idempotency-Key（同一客户端地址内）去重。
+    任务按用户公平调度，响应中的 queue_position / estimated_wait（秒）为排队位置与预计等待时间，
+    estimated_time（秒）为按历史任务耗时预估的处理时间
     """
+    task_id = str(uuid.uuid4())
+    dedup_key = None
+    
+    if settings.VIDEO_DEDUP_ENABLED:
+        client = http_request.client
+        dedup_key = job_deduplicator.make_key(
+            request,
+            idempotency_key,
+            current_user.id if current_user else None,
+            client.host if client else None
+        )
+    
+    if dedup_key:
+        existing_id = await asyncio.to_thread(job_deduplicator.claim, dedup_key, task_id)
+        if existing_id:
+            record = await task_status_store.aget(existing_id)
+            # 记录尚未写入说明原请求正在提交，同样视为进行中
+            if record is None or record.get("status") not in ("failed", "cancelled"):
+                logger.info(f"重复的视频请求，返回已有任务: {existing_id}")
+                return VideoCreateResponse(success=True, data=_existing_task_data(existing_id, record))
+            # 原任务失败或已取消，重新提交
+            await asyncio.to_thread(job_deduplicator.replace, dedup_key, task_id)
+    
     try:
-        task_id = str(uuid.uuid4())
-        
         # 准备任务数据
-        slides_data = [slide.model_dump() for slide in request.slides]
+        slides_data = _slides_payload(request)
         config_data = request.config.model_dump()
         
-        # 提交 Celery 任务
-        task = generate_video_task.delay(task_id, slides_data, config_data)
+        # 先写入任务记录，保证 Worker 的进度更新能找到这一行
+        if current_user:
+            await _save_task(task_id, request, current_user)
+        # 按历史耗时样本预估处理时间（不含排队）
+        estimated_time = round(await asyncio.to_thread(
+            eta_estimator.predict, JobFeatures.from_request(request.slides, request.config)
+        ))
+        await asyncio.to_thread(
+            task_status_store.create,
+            task_id,
+            owner_id=current_user.id if current_user else None,
+            preview_status="pending" if request.preview else None,
+            estimated_time=estimated_time
+        )
+        
+        data = {"task_id": task_id}
+        user_key = _user_key(http_request, current_user)
+        payload = {"slides_data": slides_data, "config_data": config_data}
         
-        # 估算时间 (每页约10秒)
-        estimated_time = len(request.slides) * 10
+        # 草稿预览先入队（预览通道优先调度），尽快给出第一版粗剪
+        if request.preview:
+            preview_celery_id, _ = await asyncio.to_thread(
+                fair_scheduler.submit,
+                task_id, user_key, "preview", {**payload, "standalone": False}
+            )
+            data.update({
+                "preview_celery_task_id": preview_celery_id,
+                "preview_url": f"/output/preview_{task_id}.mp4"
+            })
         
-        return VideoCreateResponse(
-            success=True,
-            data={
-                "task_id": task_id,
-                "celery_task_id": task.id,
-                "status": "pending",
-                "estimated_time": estimated_time
-            }
+        # 进入调度队列，有空闲槽位时提交 Celery 任务
+        celery_task_id, queued = await asyncio.to_thread(
+            fair_scheduler.submit, task_id, user_key, "video", payload
         )
         
+        data.update({
+            "celery_task_id": celery_task_id,
+            "status": "queued" if queued else "pending",
+            "estimated_time": estimated_time,
+            **_queue_data(queued)
+        })
+        
+        await asyncio.to_thread(task_status_store.update, task_id, celery_task_id=celery_task_id)
+        
+        return VideoCreateResponse(success=True, data=data)
+    
     except Exception as e:
         logger.exception("创建视频任务失败")
+        if dedup_key:
+            await asyncio.to_thread(job_deduplicator.release, dedup_key, task_id)
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@router.get("/status/{task_id}", response_model=VideoStatusResponse)
-async def get_video_status(task_id: str):
-    """查询视频生成任务状态"""
+@router.post("/preview", response_model=VideoCreateResponse)
+async def create_preview(
+    request: VideoCreateRequest,
+    http_request: Request,
+    current_user: Optional[User] = Depends(get_optional_user)
+):
+    """
+    按需生成草稿预览
+    
+    低分辨率、低帧率、跳过 AI 图片扩展，通常数秒内完成；走预览通道优先调度
+    """
     try:
-        # 查询 Celery 任务结果
-        # 注意：这里简化处理，实际应该通过 task_id 关联 celery_task_id
-        # 或者使用 Redis 存储任务状态
+        task_id = str(uuid.uuid4())
+        
+        slides_data = _slides_payload(request)
+        config_data = request.config.model_dump()
         
-        return VideoStatusResponse(
+        await asyncio.to_thread(
+            task_status_store.create, task_id, owner_id=current_user.id if current_user else None
+        )
+        celery_task_id, queued = await asyncio.to_thread(
+            fair_scheduler.submit,
+            task_id,
+            _user_key(http_request, current_user),
+            "preview",
+            {"slides_data": slides_data, "config_data": config_data, "standalone": True}
+        )
+        await asyncio.to_thread(task_status_store.update, task_id, celery_task_id=celery_task_id)
+        
+        return VideoCreateResponse(
             success=True,
             data={
                 "task_id": task_id,
-                "status": "processing",
-                "progress": 0.5,
-                "message": "处理中..."
+                "celery_task_id": celery_task_id,
+                "status": "queued" if queued else "pending",
+                "preview_url": f"/output/preview_{task_id}.mp4",
+                **_queue_data(queued)
             }
         )
-        
+    
+    except Exception as e:
+        logger.exception("创建预览任务失败")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/status/{task_id}", response_model=VideoStatusResponse)
+async def get_video_status(task_id: str):
+    """查询视频生成任务状态"""
+    try:
+        # Worker 更新进度时同步写入 Redis，按 task_id 直接读取
+        record = await task_status_store.aget(task_id)
     except Exception as e:
         logger.exception("查询任务状态失败")
         raise HTTPException(status_code=500, detail=str(e))
+    
+    if record is None:
+        raise HTTPException(status_code=404, detail="任务不存在或已过期")
+    
+    if record.get("status") == "queued":
+        # 排队中的任务实时计算位置（预览任务的调度ID带后缀）
+        queued = (
+            await asyncio.to_thread(fair_scheduler.position, task_id)
+            or await asyncio.to_thread(fair_scheduler.position, preview_job_id(task_id))
+        )
+        if queued:
+            record.update(_queue_data(queued))
+    
+    if record.get("status") not in TERMINAL_STATUSES:
+        # 按已用时间与当前进度修正剩余时间，排队中的任务加上等待时间
+        remaining = eta_estimator.refine(record)
+        if remaining is not None:
+            if record.get("status") == "queued":
+                remaining += record.get("estimated_wait", 0)
+            record["estimated_remaining"] = round(remaining)
+    
+    return VideoStatusResponse(success=True, data={"task_id": task_id, **record})
+
+
+@router.get("/events/{task_id}")
+async def stream_video_events(task_id: str):
+    """
+    订阅任务进度（Server-Sent Events）
+    
+    连接后先推送一次当前状态，之后每次进度变化推送 status 事件（只包含变化的字段），
+    任务完成或失败后服务端关闭连接
+    """
+    return StreamingResponse(
+        stream_events(task_id),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            # 关闭 nginx 缓冲，事件立即送达
+            "X-Accel-Buffering": "no"
+        }
+    )
 
 
 @router.get("/result/{task_id}")
 async def get_video_result(task_id: str):
     """获取视频结果"""
-    # TODO: 从存储中查询结果
+    record = await task_status_store.aget(task_id)
+    if record is None:
+        raise HTTPException(status_code=404, detail="任务不存在或已过期")
+    
     return {
         "success": True,
         "data": {
             "task_id": task_id,
-            "status": "completed",
-            "video_url": f"/output/video_{task_id}.mp4"
+            "status": record.get("status"),
+            "video_url": record.get("output_url")
         }
     }
 
 
+def _cancel_task(task_id: str):
+    """
+    写入取消标记并移出调度队列
+    
+    已提交的 Celery 任务不撤销：撤销会跳过它们的取消分支（分布式工作流的合并任务、
+    拆分执行的合成任务负责清理上传的片段、临时文件、检查点和工作流进度），
+    这些任务开始或检测到取消标记时立即退出并清理
+    """
+    request_cancel(task_id)
+    fair_scheduler.cancel(task_id)
+    task_status_store.update(task_id, "cancelled", message="任务已取消")
+
+
+@router.delete("/{task_id}")
+async def cancel_video(task_id: str, current_user: Optional[User] = Depends(get_optional_user)):
+    """
+    取消视频任务
+    
+    登录用户创建的任务只能由本人取消；匿名任务凭 task_id 取消。
+    排队中的任务直接移出队列；已提交的任务由 Worker 检测到取消标记后
+    终止 ffmpeg 与百炼轮询并清理中间文件，尚未开始的任务开始时直接退出并清理。
+    槽位立即释放给下一个排队的任务
+    """
+    record = await task_status_store.aget(task_id)
+    if record is None:
+        raise HTTPException(status_code=404, detail="任务不存在或已过期")
+    owner_id = record.get("owner_id")
+    if owner_id is not None and (current_user is None or str(current_user.id) != owner_id):
+        raise HTTPException(status_code=403, detail="无权取消该任务")
+    if record.get("status") in TERMINAL_STATUSES:
+        raise HTTPException(status_code=409, detail=f"任务已结束: {record.get('status')}")
+    
+    try:
+        await asyncio.to_thread(_cancel_task, task_id)
+    except Exception as e:
+        logger.exception(f"取消任务失败: {task_id}")
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    logger.info(f"任务已取消: {task_id}")
+    return {"success": True, "data": {"task_id": task_id, "status": "cancelled"}}
+
+
 @router.get("/queue-status")
 async def get_queue_status():
-    """获取队列状态"""
+    """
+    获取队列状态
+    
+    后台定时汇总的缓存结果，可以频繁调用（自动扩缩容）：
+    queues 为各 Celery 队列的 Broker 积压、Worker 数、并发与运行中的任务数、
+    预计清空积压的秒数（backlog_seconds）；scheduler 为公平调度器中等待的任务
+    """
     try:
-        # 使用 Celery Inspect 获取队列信息
-        inspect = celery_app.control.inspect()
-        
-        active = inspect.active() or {}
-        scheduled = inspect.scheduled() or {}
-        reserved = inspect.reserved() or {}
-        
-        return {
-            "success": True,
-            "data": {
-                "active": len(list(active.values())[0]) if active else 0,
-                "waiting": len(list(scheduled.values())[0]) if scheduled else 0,
-                "reserved": len(list(reserved.values())[0]) if reserved else 0
-            }
-        }
-        
+        return {"success": True, "data": await queue_metrics.get()}
     except Exception as e:
         logger.warning(f"获取队列状态失败: {e}")
-        return {
-            "success": True,
-            "data": {
-                "active": 0,
-                "waiting": 0,
-                "reserved": 0
-            }
-        }
+        raise HTTPException(status_code=503, detail="队列状态暂不可用")
@@ -24,6 +24,7 @@ ACCESS_TOKEN_EXPIRE_DAYS = 7
 
 # Bearer Token 认证
 security = HTTPBearer()
+optional_security = HTTPBearer(auto_error=False)
 
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
@@ -79,6 +80,15 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
         return user
 
 
+async def get_optional_user(
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(optional_security)
+) -> Optional[User]:
+    """获取当前登录用户（可选），未携带 Token 时返回 None"""
+    if credentials is None:
+        return None
+    return await get_current_user(credentials)
+
+
 async def get_current_active_user(current_user: User = Depends(get_current_user)) -> User:
     """获取当前活跃用户"""
     return current_user
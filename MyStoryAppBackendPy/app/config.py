@@ -22,11 +22,111 @@ class Settings(BaseSettings):
     # Redis
     REDIS_URL: str = "redis://localhost:6379/0"
     
+    # Celery 队列（I/O 与 CPU 任务分开消费，外部 API 等待不占用 ffmpeg 进程）
+    CELERY_IO_QUEUE: str = "io"
+    CELERY_CPU_QUEUE: str = "cpu"
+    CELERY_IO_POOL: str = "threads"  # threads or gevent；任务内部使用 asyncio，推荐 threads
+    CELERY_IO_CONCURRENCY: int = 32
+    CELERY_CPU_CONCURRENCY: int = 0  # 0 表示按 CPU 核数和单任务 ffmpeg 并发数自动计算
+    
     # 存储
     STORAGE_TYPE: str = "local"  # local or s3
     UPLOAD_DIR: str = "./uploads"
     OUTPUT_DIR: str = "./output"
     
+    # 视频渲染
+    VIDEO_RENDER_CONCURRENCY: int = 0  # 单个 Worker 同时运行的 ffmpeg 数量，0 表示按 CPU 核数自动计算
+    VIDEO_RENDER_ENGINE: str = "segments"  # segments (逐页片段+合并) or filtergraph (单次编码)
+    VIDEO_ENCODE_MODE: str = "standard"  # standard or still (静态幻灯片优化: stillimage 调优 + 可变帧率 + 长 GOP)
+    PROGRESS_MIN_INTERVAL: float = 1.0  # 进度回调最小间隔（秒），避免频繁写入 Redis
+    VIDEO_PIPELINE: str = "dag"  # dag (按幻灯片流水线调度) or staged (扩展/配音/合成逐阶段执行)
+    # split (I/O Worker 扩展图片、生成配音后由 CPU Worker 合成) / single (单个 CPU Worker 完成整个视频)
+    # / fanout (按幻灯片拆分子任务，多 Worker 并行)
+    VIDEO_WORKFLOW: str = "split"
+    IMAGE_DOWNLOAD_CONCURRENCY: int = 8  # 单个任务内同时下载的图片数
+    
+    # AI 图片扩展并发数（单个任务内）
+    IMAGE_EXPANSION_CONCURRENCY: int = 4
+    
+    # 配音合成并发数（单个任务内，设为 1 即逐段串行）
+    TTS_CONCURRENCY: int = 4
+    
+    # 任务检查点保留时间（秒），覆盖 Celery 重试间隔
+    CHECKPOINT_TTL: int = 24 * 3600
+    
+    # DashScope 共享 HTTP 连接池
+    DASHSCOPE_MAX_CONNECTIONS: int = 20
+    DASHSCOPE_MAX_KEEPALIVE: int = 10
+    DASHSCOPE_KEEPALIVE_EXPIRY: float = 30.0  # 空闲连接保留时间（秒）
+    DASHSCOPE_HTTP2: bool = False  # 需要安装 h2
+    DASHSCOPE_TIMEOUT: float = 30.0
+    
+    # 百炼异步任务轮询（图片扩展、长文本配音）
+    DASHSCOPE_POLL_MIN_INTERVAL: float = 2.0  # 最短查询间隔（秒）
+    DASHSCOPE_POLL_MAX_INTERVAL: float = 15.0  # 最长查询间隔（秒）
+    DASHSCOPE_POLL_TIMEOUT: float = 120.0  # 提交后等待结果的最长时间（秒）
+    DASHSCOPE_POLL_BATCH_SIZE: int = 10  # 同时进行的查询数
+    
+    # 百炼限流（所有 API 与 Worker 进程通过 Redis 共享）
+    # 格式：端点[/模型]=每秒请求数:并发数（并发数 0 为不限），端点为 image / tts / tts-async / tasks
+    DASHSCOPE_RATE_LIMIT_ENABLED: bool = True
+    DASHSCOPE_RATE_LIMITS: str = (
+        "image/wanx-v1=2:2,tts/sambert-zhimao-v1=10:10,tts-async/sambert-zhimao-v1=5:5,tasks=20:0"
+    )
+    DASHSCOPE_RATE_LIMIT_RETRIES: int = 3  # 收到 429 后重新排队的次数
+    DASHSCOPE_RATE_LIMIT_RECOVERY: float = 0.02  # 429 降速后每秒恢复的速率比例
+    DASHSCOPE_SLOT_TTL: int = 300  # 并发槽位租约（秒），进程异常退出后自动释放
+    
+    # 队列指标：Worker 心跳间隔与 API 后台刷新间隔（秒）
+    WORKER_HEARTBEAT_INTERVAL: float = 10.0
+    QUEUE_METRICS_INTERVAL: float = 5.0
+    
+    # Worker 检查任务取消标记的间隔（秒）
+    CANCEL_CHECK_INTERVAL: float = 0.5
+    
+    # 任务状态记录保留时间（秒）与 SSE 心跳间隔
+    TASK_STATUS_TTL: int = 7 * 24 * 3600
+    SSE_HEARTBEAT_INTERVAL: float = 15.0
+    TASK_PERSIST_INTERVAL: float = 5.0  # Worker 批量写入 video_tasks 的间隔（秒）
+    
+    # 重复请求去重（相同请求在该时间内直接返回已有任务）
+    VIDEO_DEDUP_ENABLED: bool = True
+    VIDEO_DEDUP_TTL: int = 24 * 3600
+    
+    # 公平调度（按用户轮询 + 优先级通道，有空闲槽位时才提交给 Celery）
+    SCHED_ENABLED: bool = True
+    SCHED_MAX_ACTIVE: int = 8  # 全局同时运行的任务数，与 CPU Worker 总并发一致
+    SCHED_USER_MAX_ACTIVE: int = 2  # 单个用户同时运行的任务数
+    SCHED_LANE_WEIGHTS: str = "preview:4,paid:2,standard:1"
+    SCHED_PAID_USER_IDS: str = ""  # 付费用户ID，逗号分隔
+    SCHED_LEASE_SECONDS: int = 3600  # 槽位租约，Worker 异常退出未释放时到期自动回收
+    SCHED_TICK_INTERVAL: float = 5.0  # API 进程定时调度的间隔（秒）
+    
+    # 草稿预览
+    PREVIEW_RESOLUTION: str = "480p"
+    PREVIEW_FRAME_RATE: int = 10
+    PREVIEW_PRESET: str = "ultrafast"
+    
+    # 幻灯片片段缓存（多个 Worker 共享同一目录）
+    SEGMENT_CACHE_ENABLED: bool = True
+    SEGMENT_CACHE_DIR: str = "./cache/segments"
+    SEGMENT_CACHE_MAX_BYTES: int = 5 * 1024 ** 3  # 5GB
+    
+    # 图片预处理缓存（原图解码缩放后的中间图）
+    IMAGE_NORMALIZE_ENABLED: bool = True
+    IMAGE_CACHE_DIR: str = "./cache/images"
+    IMAGE_CACHE_MAX_BYTES: int = 2 * 1024 ** 3  # 2GB
+    
+    # 图片扩展结果缓存（相同原图与风格只扩展一次，结果保存在存储中）
+    IMAGE_EXPANSION_CACHE_ENABLED: bool = True
+    IMAGE_EXPANSION_CACHE_TTL: int = 30 * 24 * 3600  # 缓存索引的保留时间（秒）
+    
+    # 配音缓存（相同文本、音色、语速、模型只合成一次）
+    TTS_CACHE_ENABLED: bool = True
+    TTS_CACHE_DIR: str = "./cache/tts"
+    TTS_CACHE_MAX_BYTES: int = 1024 ** 3  # 1GB
+    TTS_CACHE_STORAGE_TTL: int = 30 * 24 * 3600  # 共享存储中缓存索引的保留时间（秒）
+    
     # 日志
     LOG_LEVEL: str = "info"
     
@@ -0,0 +1,22 @@
+"""
+Redis 客户端
+"""
+
+from functools import lru_cache
+
+import redis
+import redis.asyncio as aioredis
+
+from app.config import settings
+
+
+@lru_cache()
+def get_redis() -> redis.Redis:
+    """获取 Redis 客户端（缓存，连接池线程安全）"""
+    return redis.Redis.from_url(settings.REDIS_URL, decode_responses=True)
+
+
+@lru_cache()
+def get_async_redis() -> aioredis.Redis:
+    """获取异步 Redis 客户端（缓存，仅在 API 进程的事件循环中使用）"""
+    return aioredis.Redis.from_url(settings.REDIS_URL, decode_responses=True)
@@ -37,7 +37,8 @@ class Material(Base):
     file_format = Column(String(20), default="")  # jpg/png/mp3/mp4等
     
     # 元数据（JSON格式存储）
-    metadata = Column(Text, default="{}")  # 宽度、高度、时长等
+    # metadata 是 Declarative 保留属性名，列名保持不变
+    meta_data = Column("metadata", Text, default="{}")  # 宽度、高度、时长等
     
     # 标签（逗号分隔）
     tags = Column(String(500), default="")
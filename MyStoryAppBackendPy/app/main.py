@@ -7,10 +7,18 @@ from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from contextlib import asynccontextmanager
+import asyncio
 
 from app.config import settings
 from app.api import auth, image, tts, video, material
 from app.db.database import init_db
+from app.services.task_status import event_broadcaster, task_status_store
+from app.services.task_recorder import task_recorder
+from app.services.dashscope_poller import dashscope_poller
+from app.services.http_client import dashscope_http
+from app.services.rate_limiter import dashscope_limiter
+from app.tasks.scheduler import run_scheduler_loop
+from app.tasks.metrics import queue_metrics
 from app.core.logger import logger
 
 
@@ -26,7 +34,24 @@ async def lifespan(app: FastAPI):
     await init_db()
     logger.info("✅ 数据库初始化完成")
     
+    # API 进程写入的状态（排队中、排队时取消）同样持久化到 video_tasks
+    task_status_store.add_listener(task_recorder.record)
+    
+    # 公平调度定时器（回收过期槽位后补发等待中的任务）
+    scheduler_task = None
+    if settings.SCHED_ENABLED:
+        scheduler_task = asyncio.create_task(run_scheduler_loop(settings.SCHED_TICK_INTERVAL))
+    
+    # 队列指标后台刷新
+    metrics_task = asyncio.create_task(queue_metrics.run())
+    
     yield
+    metrics_task.cancel()
+    if scheduler_task:
+        scheduler_task.cancel()
+    await event_broadcaster.close()
+    await asyncio.to_thread(task_recorder.close)
+    await dashscope_http.aclose()
     logger.info("🛑 应用关闭")
 
 
@@ -65,7 +90,10 @@ async def health_check():
         "status": "ok",
         "version": "1.0.0",
         "language": "python",
-        "framework": "fastapi"
+        "framework": "fastapi",
+        "dashscope_http": dashscope_http.stats(),
+        "dashscope_poller": dashscope_poller.stats(),
+        "dashscope_limiter": await asyncio.to_thread(dashscope_limiter.stats)
     }
 
 
@@ -74,6 +74,7 @@ class VideoCreateRequest(BaseModel):
     description: str = Field(default="")
     slides: List[SlideRequest] = Field(..., min_length=1, max_length=20)
     config: VideoConfigRequest
+    preview: bool = Field(default=False, description="先生成低清草稿预览")
 
 
 class TTSRequest(BaseModel):
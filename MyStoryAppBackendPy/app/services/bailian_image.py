@@ -2,18 +2,25 @@
 百炼图片扩展服务
 """
 
-import httpx
 import asyncio
+from functools import partial
 from pathlib import Path
-from typing import Optional
+from typing import Dict, Optional
 import uuid
 
 from app.config import settings
 from app.core.logger import logger
+from app.services.dashscope_poller import dashscope_poller
+from app.services.disk_cache import hash_file
+from app.services.expansion_cache import expansion_cache
+from app.services.http_client import dashscope_http
+from app.services.rate_limiter import dashscope_limiter
 
 
 BAILIAN_BASE_URL = "https://dashscope.aliyuncs.com/api/v1"
 
+EXPAND_MODEL = "wanx-v1"
+
 STYLE_PROMPTS = {
     "cinematic": "电影感，专业调色，电影质感，16:9宽屏比例",
     "anime": "动漫风格，鲜艳色彩，二次元画风，16:9宽屏比例",
@@ -33,90 +40,103 @@ class BailianImageService:
             "Authorization": f"Bearer {self.api_key}",
             "Content-Type": "application/json"
         }
+        # 正在扩展的缓存键 -> 扩展任务
+        self._inflight: Dict[str, asyncio.Task] = {}
     
     async def expand_image(self, image_path: str, style: str = "cinematic") -> str:
         """
         扩展图片为 16:9 宽屏
         
+        同一张图片以相同风格扩展过时直接返回缓存的结果
+        
         Args:
             image_path: 本地图片路径
             style: 扩展风格
             
         Returns:
-            扩展后图片的 URL
+            扩展后图片在存储中的 URL
         """
-        logger.info(f"[百炼] 扩展图片: {image_path}, 风格: {style}")
+        style_prompt = STYLE_PROMPTS.get(style, STYLE_PROMPTS["cinematic"])
+        image_hash = await asyncio.to_thread(hash_file, image_path)
+        cache_key = expansion_cache.make_key(image_hash, style_prompt, EXPAND_MODEL)
+        
+        cached_url = await asyncio.to_thread(expansion_cache.get, cache_key)
+        if cached_url:
+            return cached_url
+        
+        # 任务绑定在事件循环上，只合并同一事件循环中的并发请求（同一视频中的重复图片）
+        task = self._inflight.get(cache_key)
+        if task is None or task.get_loop() is not asyncio.get_running_loop():
+            task = asyncio.ensure_future(self._expand(cache_key, image_path, style_prompt))
+            self._inflight[cache_key] = task
+            task.add_done_callback(partial(self._forget, cache_key))
+        return await task
+    
+    def _forget(self, cache_key: str, task: asyncio.Task):
+        if self._inflight.get(cache_key) is task:
+            del self._inflight[cache_key]
+    
+    async def _expand(self, cache_key: str, image_path: str, style_prompt: str) -> str:
+        """调用百炼扩展图片，并把结果保存到存储"""
+        logger.info(f"[百炼] 扩展图片: {image_path}, 风格: {style_prompt}")
         
         # 读取图片并转为 base64
         image_data = Path(image_path).read_bytes()
         import base64
         base64_image = base64.b64encode(image_data).decode('utf-8')
         
-        style_prompt = STYLE_PROMPTS.get(style, STYLE_PROMPTS["cinematic"])
+        # 并发槽位覆盖提交与等待结果（百炼按同时运行的任务数限制）
+        result_url = await dashscope_limiter.run("image", EXPAND_MODEL, self._create_task, base64_image, style_prompt)
+        
+        # 百炼的结果 URL 会过期，下载后保存到自己的存储
+        client = dashscope_http.get()
+        response = await client.get(result_url, timeout=30.0)
+        response.raise_for_status()
+        content_type = response.headers.get("content-type", "image/png").split(";")[0]
+        image_url = await expansion_cache.put(cache_key, response.content, content_type)
         
-        # 调用百炼图像生成 API
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                f"{BAILIAN_BASE_URL}/services/aigc/text2image/image-synthesis",
-                headers={**self.headers, "X-DashScope-Async": "enable"},
-                json={
-                    "model": "wanx-v1",
-                    "input": {
-                        "prompt": f"基于参考图创建16:9宽屏版本，保持主体内容完整。风格：{style_prompt}",
-                        "ref_image": base64_image,
-                        "size": "1280*720",
-                        "n": 1
-                    },
-                    "parameters": {
-                        "style": "<auto>",
-                        "seed": uuid.uuid4().int % 1000000
-                    }
+        logger.info(f"[百炼] 图片扩展成功: {image_url}")
+        return image_url
+    
+    async def _create_task(self, base64_image: str, style_prompt: str) -> str:
+        """提交扩展任务并等待完成，返回百炼的结果 URL"""
+        client = dashscope_http.get()
+        response = await client.post(
+            f"{BAILIAN_BASE_URL}/services/aigc/text2image/image-synthesis",
+            headers={**self.headers, "X-DashScope-Async": "enable"},
+            json={
+                "model": EXPAND_MODEL,
+                "input": {
+                    "prompt": f"基于参考图创建16:9宽屏版本，保持主体内容完整。风格：{style_prompt}",
+                    "ref_image": base64_image,
+                    "size": "1280*720",
+                    "n": 1
                 },
-                timeout=30.0
-            )
-            
-            response.raise_for_status()
-            result = response.json()
-            
-            task_id = result.get("output", {}).get("task_id")
-            if not task_id:
-                raise ValueError("未获取到 task_id")
-            
-            # 轮询获取结果
-            image_url = await self._poll_task_result(task_id)
-            
-            logger.info(f"[百炼] 图片扩展成功: {image_url}")
-            return image_url
+                "parameters": {
+                    "style": "<auto>",
+                    "seed": uuid.uuid4().int % 1000000
+                }
+            },
+            timeout=30.0
+        )
+        
+        response.raise_for_status()
+        result = response.json()
+        
+        task_id = result.get("output", {}).get("task_id")
+        if not task_id:
+            raise ValueError("未获取到 task_id")
+        
+        # 轮询获取结果
+        return await self._poll_task_result(task_id)
     
-    async def _poll_task_result(self, task_id: str, max_attempts: int = 30) -> str:
-        """轮询任务结果"""
-        async with httpx.AsyncClient() as client:
-            for i in range(max_attempts):
-                await asyncio.sleep(2)
-                
-                response = await client.get(
-                    f"{BAILIAN_BASE_URL}/tasks/{task_id}",
-                    headers=self.headers,
-                    timeout=10.0
-                )
-                response.raise_for_status()
-                result = response.json()
-                
-                task_status = result.get("output", {}).get("task_status")
-                
-                if task_status == "SUCCEEDED":
-                    results = result.get("output", {}).get("results", [])
-                    if results and len(results) > 0:
-                        return results[0].get("url")
-                    raise ValueError("结果中没有图片 URL")
-                
-                elif task_status == "FAILED":
-                    error_msg = result.get("output", {}).get("message", "未知错误")
-                    raise RuntimeError(f"任务失败: {error_msg}")
-                
-                logger.info(f"[百炼] 任务 {task_id} 状态: {task_status}, 第 {i+1} 次查询...")
-            
-            raise TimeoutError("轮询超时")
+    async def _poll_task_result(self, task_id: str) -> str:
+        """等待任务结果（由轮询器统一查询）"""
+        output = await dashscope_poller.wait(task_id, "image")
+        results = output.get("results", [])
+        if results and len(results) > 0:
+            return results[0].get("url")
+        raise ValueError("结果中没有图片 URL")
     
     def validate_image(self, mimetype: str) -> bool:
         """验证图片格式"""
@@ -2,17 +2,22 @@
 百炼语音合成服务
 """
 
-import httpx
-import uuid
-from pathlib import Path
-from typing import Optional
+import asyncio
+from functools import partial
+from typing import Dict, Optional
 
 from app.config import settings
 from app.core.logger import logger
+from app.services.dashscope_poller import dashscope_poller
+from app.services.http_client import dashscope_http
+from app.services.rate_limiter import dashscope_limiter
+from app.services.tts_cache import tts_cache
 
 
 BAILIAN_BASE_URL = "https://dashscope.aliyuncs.com/api/v1"
 
+TTS_MODEL = "sambert-zhimao-v1"
+
 # 语音映射
 VOICE_MAP = {
     "standardFemale": "zhitian",  # 知甜-温柔女声
@@ -33,6 +38,8 @@ class BailianTTSService:
             "Authorization": f"Bearer {self.api_key}",
             "Content-Type": "application/json"
         }
+        # 正在合成的缓存键 -> 合成任务（同一个视频中重复的文本只合成一次）
+        self._inflight: Dict[str, asyncio.Task] = {}
     
     async def generate_speech(
         self,
@@ -49,138 +56,120 @@ class BailianTTSService:
             speed: 语速 (0.5-2.0)
             
         Returns:
-            包含 url 和 duration 的字典
+            包含 url（配音缓存中的音频 URL）、path（对应的本地路径）和 duration 的字典
         """
-        logger.info(f"[百炼] 生成语音: {text[:30]}...")
-        
         voice = VOICE_MAP.get(voice_type, VOICE_MAP["standardFemale"])
+        # 估算时长 (中文字符约每秒5个)
+        duration = len(text) / 5
+        
+        # 相同文本/音色/语速/模型已合成过时直接使用缓存
+        cache_key = tts_cache.make_key(text, voice, speed, TTS_MODEL)
+        cached_url = await tts_cache.get(cache_key)
+        if cached_url:
+            return {"url": cached_url, "path": tts_cache.local_path(cached_url), "duration": duration}
+        
+        # 任务绑定在事件循环上，只合并同一事件循环中的并发请求
+        task = self._inflight.get(cache_key)
+        if task is None or task.get_loop() is not asyncio.get_running_loop():
+            task = asyncio.ensure_future(self._synthesize(cache_key, text, voice, speed))
+            self._inflight[cache_key] = task
+            task.add_done_callback(partial(self._forget, cache_key))
+        
+        url = await task
+        logger.info(f"[百炼] 语音生成成功: {url}, 预估时长: {duration:.1f}s")
+        
+        return {
+            "url": url,
+            "path": tts_cache.local_path(url),
+            "duration": duration
+        }
+    
+    def _forget(self, cache_key: str, task: asyncio.Task):
+        if self._inflight.get(cache_key) is task:
+            del self._inflight[cache_key]
+    
+    async def _synthesize(self, cache_key: str, text: str, voice: str, speed: float) -> str:
+        """调用 DashScope 合成并写入缓存，返回音频 URL"""
+        logger.info(f"[百炼] 生成语音: {text[:30]}...")
         
         # 短文本直接同步请求
         if len(text) <= 300:
-            return await self._sync_tts(text, voice, speed)
+            audio_data = await dashscope_limiter.run("tts", TTS_MODEL, self._sync_tts, text, voice, speed)
         else:
             # 长文本使用异步接口
-            return await self._async_tts(text, voice, speed)
+            audio_data = await dashscope_limiter.run("tts-async", TTS_MODEL, self._async_tts, text, voice, speed)
+        
+        return await tts_cache.put(cache_key, audio_data)
     
-    async def _sync_tts(self, text: str, voice: str, speed: float) -> dict:
-        """同步 TTS"""
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                f"{BAILIAN_BASE_URL}/services/aigc/tts",
-                headers=self.headers,
-                json={
-                    "model": "sambert-zhimao-v1",
-                    "input": {"text": text},
-                    "parameters": {
-                        "voice": voice,
-                        "speech_rate": speed,
-                        "pitch_rate": 1.0,
-                        "volume": 50,
-                        "format": "mp3"
-                    }
-                },
-                timeout=60.0
-            )
-            
-            response.raise_for_status()
-            
-            # 保存音频文件
-            audio_data = response.content
-            filename = f"tts_{uuid.uuid4()}.mp3"
-            output_path = Path(settings.OUTPUT_DIR) / filename
-            output_path.parent.mkdir(parents=True, exist_ok=True)
-            output_path.write_bytes(audio_data)
-            
-            # 估算时长 (中文字符约每秒5个)
-            duration = len(text) / 5
-            
-            logger.info(f"[百炼] 语音生成成功: {filename}, 预估时长: {duration:.1f}s")
-            
-            return {
-                "url": f"/output/{filename}",
-                "duration": duration
-            }
+    async def _sync_tts(self, text: str, voice: str, speed: float) -> bytes:
+        """同步 TTS，返回音频数据"""
+        client = dashscope_http.get()
+        response = await client.post(
+            f"{BAILIAN_BASE_URL}/services/aigc/tts",
+            headers=self.headers,
+            json={
+                "model": TTS_MODEL,
+                "input": {"text": text},
+                "parameters": {
+                    "voice": voice,
+                    "speech_rate": speed,
+                    "pitch_rate": 1.0,
+                    "volume": 50,
+                    "format": "mp3"
+                }
+            },
+            timeout=60.0
+        )
+        
+        response.raise_for_status()
+        return response.content
     
-    async def _async_tts(self, text: str, voice: str, speed: float) -> dict:
-        """异步 TTS（长文本）"""
-        async with httpx.AsyncClient() as client:
-            # 提交任务
-            response = await client.post(
-                f"{BAILIAN_BASE_URL}/services/aigc/tts/async",
-                headers=self.headers,
-                json={
-                    "model": "sambert-zhimao-v1",
-                    "input": {"text": text},
-                    "parameters": {
-                        "voice": voice,
-                        "speech_rate": speed,
-                        "format": "mp3"
-                    }
-                },
-                timeout=30.0
-            )
-            
-            response.raise_for_status()
-            result = response.json()
-            
-            task_id = result.get("output", {}).get("task_id")
-            if not task_id:
-                raise ValueError("未获取到 task_id")
-            
-            # 轮询结果
-            audio_url = await self._poll_tts_result(task_id)
-            
-            # 下载音频
-            audio_data = await self._download_audio(audio_url)
-            
-            filename = f"tts_{uuid.uuid4()}.mp3"
-            output_path = Path(settings.OUTPUT_DIR) / filename
-            output_path.parent.mkdir(parents=True, exist_ok=True)
-            output_path.write_bytes(audio_data)
-            
-            duration = len(text) / 5
-            
-            return {
-                "url": f"/output/{filename}",
-                "duration": duration
-            }
+    async def _async_tts(self, text: str, voice: str, speed: float) -> bytes:
+        """异步 TTS（长文本），返回音频数据"""
+        client = dashscope_http.get()
+        # 提交任务
+        response = await client.post(
+            f"{BAILIAN_BASE_URL}/services/aigc/tts/async",
+            headers=self.headers,
+            json={
+                "model": TTS_MODEL,
+                "input": {"text": text},
+                "parameters": {
+                    "voice": voice,
+                    "speech_rate": speed,
+                    "format": "mp3"
+                }
+            },
+            timeout=30.0
+        )
+        
+        response.raise_for_status()
+        result = response.json()
+        
+        task_id = result.get("output", {}).get("task_id")
+        if not task_id:
+            raise ValueError("未获取到 task_id")
+        
+        # 轮询结果
+        audio_url = await self._poll_tts_result(task_id)
+        
+        # 下载音频
+        return await self._download_audio(audio_url)
     
-    async def _poll_tts_result(self, task_id: str, max_attempts: int = 30) -> str:
-        """轮询 TTS 任务结果"""
-        async with httpx.AsyncClient() as client:
-            for i in range(max_attempts):
-                await asyncio.sleep(2)
-                
-                response = await client.get(
-                    f"{BAILIAN_BASE_URL}/tasks/{task_id}",
-                    headers=self.headers,
-                    timeout=10.0
-                )
-                response.raise_for_status()
-                result = response.json()
-                
-                task_status = result.get("output", {}).get("task_status")
-                
-                if task_status == "SUCCEEDED":
-                    audio_url = result.get("output", {}).get("audio_address")
-                    if audio_url:
-                        return audio_url
-                    raise ValueError("结果中没有音频 URL")
-                
-                elif task_status == "FAILED":
-                    error_msg = result.get("output", {}).get("message", "未知错误")
-                    raise RuntimeError(f"任务失败: {error_msg}")
-                
-                logger.info(f"[百炼] TTS 任务 {task_id} 状态: {task_status}, 第 {i+1} 次查询...")
-            
-            raise TimeoutError("轮询超时")
+    async def _poll_tts_result(self, task_id: str) -> str:
+        """等待 TTS 任务结果（由轮询器统一查询）"""
+        output = await dashscope_poller.wait(task_id, "tts")
+        audio_url = output.get("audio_address")
+        if audio_url:
+            return audio_url
+        raise ValueError("结果中没有音频 URL")
     
     async def _download_audio(self, url: str) -> bytes:
         """下载音频文件"""
-        async with httpx.AsyncClient() as client:
-            response = await client.get(url, timeout=30.0)
-            response.raise_for_status()
-            return response.content
+        client = dashscope_http.get()
+        response = await client.get(url, timeout=30.0)
+        response.raise_for_status()
+        return response.content
     
     def get_voices(self) -> list:
         """获取支持的语音列表"""
@@ -194,7 +183,5 @@ class BailianTTSService:
         ]
 
 
-import asyncio
-
 # 单例
 bailian_tts_service = BailianTTSService()
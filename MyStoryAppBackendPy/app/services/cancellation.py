@@ -0,0 +1,107 @@
+"""
+视频任务取消
+API 在 Redis 中写入取消标记 video:cancel:{task_id}，Worker 运行任务协程的同时
+定时检查该标记：发现取消后取消整个协程树，正在运行的 ffmpeg 子进程随之被终止
+（见 ffmpeg_runner），等待百炼结果的轮询协程也一并退出，之后清理中间文件
+"""
+
+import asyncio
+from pathlib import Path
+from typing import Awaitable, Callable, TypeVar
+
+from redis import RedisError
+
+from app.config import settings
+from app.core.logger import logger
+from app.core.redis import get_redis
+from app.services.checkpoint import JobCheckpoint
+from app.services.storage import get_storage
+
+
+CANCEL_KEY_PREFIX = "video:cancel:"
+
+T = TypeVar("T")
+
+
+class JobCancelled(Exception):
+    """任务已被用户取消"""
+    
+    def __init__(self, task_id: str):
+        super().__init__(f"任务已取消: {task_id}")
+        self.task_id = task_id
+
+
+def request_cancel(task_id: str):
+    """写入取消标记"""
+    get_redis().set(CANCEL_KEY_PREFIX + task_id, 1, ex=settings.TASK_STATUS_TTL)
+
+
+def is_cancelled(task_id: str) -> bool:
+    """任务是否已被取消（Redis 不可用时视为未取消）"""
+    try:
+        return bool(get_redis().exists(CANCEL_KEY_PREFIX + task_id))
+    except RedisError as e:
+        logger.warning(f"[取消] 检查取消标记失败: {task_id}, {e}")
+        return False
+
+
+async def _wait_cancelled(task_id: str):
+    """定时检查取消标记，发现取消后返回"""
+    while not await asyncio.to_thread(is_cancelled, task_id):
+        await asyncio.sleep(settings.CANCEL_CHECK_INTERVAL)
+
+
+async def run_cancellable(task_id: str, func: Callable[..., Awaitable[T]], *args, **kwargs) -> T:
+    """
+    运行可被取消的任务协程
+    
+    Raises:
+        JobCancelled: 任务在开始前或运行中被取消
+    """
+    if await asyncio.to_thread(is_cancelled, task_id):
+        raise JobCancelled(task_id)
+    
+    main = asyncio.ensure_future(func(*args, **kwargs))
+    watcher = asyncio.ensure_future(_wait_cancelled(task_id))
+    try:
+        await asyncio.wait({main, watcher}, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        watcher.cancel()
+    
+    if main.done():
+        return main.result()
+    
+    # 取消协程树：run_ffmpeg 在 CancelledError 时终止子进程
+    main.cancel()
+    await asyncio.gather(main, return_exceptions=True)
+    logger.info(f"[取消] 任务已中止: {task_id}")
+    raise JobCancelled(task_id)
+
+
+async def cleanup_task_files(task_id: str):
+    """
+    清理已取消任务的中间产物
+    
+    包括输出目录中的 temp_{task_id}_* 临时文件，以及检查点中记录的本任务片段/配音
+    （单机模式的本地片段直接删除，拆分模式上传到共享存储的片段/配音通过存储服务删除）
+    """
+    removed = 0
+    for path in Path(settings.OUTPUT_DIR).glob(f"temp_{task_id}_*"):
+        path.unlink(missing_ok=True)
+        removed += 1
+    
+    checkpoint = JobCheckpoint(task_id).load()
+    storage = get_storage()
+    for path in checkpoint.items(JobCheckpoint.SEGMENT).values():
+        Path(path).unlink(missing_ok=True)
+        removed += 1
+    for kind in (JobCheckpoint.SEGMENT_URL, JobCheckpoint.VOICE):
+        for url in checkpoint.items(kind).values():
+            # 配音缓存中的音频由多个任务共用，只删除本任务上传的文件
+            if task_id not in url:
+                continue
+            await storage.delete_file(url)
+            removed += 1
+    checkpoint.clear()
+    
+    logger.info(f"[取消] 已清理任务 {task_id} 的 {removed} 个中间文件")
@@ -0,0 +1,89 @@
+"""
+视频任务检查点
+记录每个阶段已完成的中间结果（扩展图片 URL、配音 URL、视频片段路径或 URL），
+Celery 重试或 Worker 重启后从上次完成的位置继续
+"""
+
+from typing import Dict, Optional
+
+from redis import RedisError
+
+from app.config import settings
+from app.core.logger import logger
+from app.core.redis import get_redis
+
+
+class JobCheckpoint:
+    """
+    任务检查点
+    
+    保存在 Redis hash video:checkpoint:{task_id} 中，字段为 {kind}:{index}，
+    例如 expanded:0、voice:3、segment:5。Redis 不可用时只记录警告，不影响任务本身
+    
+    单机模式的片段是本地路径（SEGMENT），拆分模式的片段上传在共享存储中（SEGMENT_URL），
+    分开记录以免清理时把其中一种当成另一种
+    
+    拆分执行（split）时 I/O 队列的准备任务把扩展、配音的阶段耗时（JSON）记在 MEDIA_TIMINGS:0，
+    由合成任务汇总后记录 ETA 样本
+    """
+    
+    EXPANDED = "expanded"
+    VOICE = "voice"
+    SEGMENT = "segment"
+    SEGMENT_URL = "segment_url"
+    MEDIA_TIMINGS = "media_timings"
+    
+    def __init__(self, task_id: str):
+        self.task_id = task_id
+        self.key = f"video:checkpoint:{task_id}"
+        self._data: Dict[str, str] = {}
+    
+    def load(self) -> "JobCheckpoint":
+        """从 Redis 加载已有检查点"""
+        try:
+            self._data = get_redis().hgetall(self.key)
+        except RedisError as e:
+            logger.warning(f"[检查点] 加载失败: {self.task_id}, {e}")
+            self._data = {}
+        
+        if self._data:
+            logger.info(f"[检查点] 恢复任务 {self.task_id}: {len(self._data)} 个已完成结果")
+        return self
+    
+    def get(self, kind: str, index: int) -> Optional[str]:
+        """获取已完成的结果"""
+        return self._data.get(f"{kind}:{index}")
+    
+    def items(self, kind: str) -> Dict[int, str]:
+        """某类已完成结果 {序号: 结果}"""
+        prefix = f"{kind}:"
+        return {
+            int(field[len(prefix):]): value
+            for field, value in self._data.items()
+            if field.startswith(prefix)
+        }
+    
+    def count(self, kind: str) -> int:
+        """统计某类已完成结果的数量"""
+        prefix = f"{kind}:"
+        return sum(1 for field in self._data if field.startswith(prefix))
+    
+    def save(self, kind: str, index: int, value: str):
+        """记录一个已完成的结果"""
+        field = f"{kind}:{index}"
+        self._data[field] = value
+        try:
+            pipe = get_redis().pipeline()
+            pipe.hset(self.key, field, value)
+            pipe.expire(self.key, settings.CHECKPOINT_TTL)
+            pipe.execute()
+        except RedisError as e:
+            logger.warning(f"[检查点] 保存失败: {self.task_id} {field}, {e}")
+    
+    def clear(self):
+        """任务完成后删除检查点"""
+        self._data = {}
+        try:
+            get_redis().delete(self.key)
+        except RedisError as e:
+            logger.warning(f"[检查点] 删除失败: {self.task_id}, {e}")
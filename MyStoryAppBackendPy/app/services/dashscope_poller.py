@@ -0,0 +1,303 @@
+"""
+百炼（DashScope）异步任务轮询
+图片扩展、长文本配音提交后得到 task_id，原来每个调用各自每 2 秒查询一次；
+现在统一登记到轮询器，由一个后台协程按到期时间批量查询并唤醒等待者。
+查询间隔按同类任务实际完成耗时的分布自适应：在下一个分位点附近查询，
+超过历史耗时后按指数退避
+"""
+
+import asyncio
+import concurrent.futures
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Deque, Dict, List, Optional
+
+from app.config import settings
+from app.core.logger import logger
+from app.services.http_client import dashscope_http
+from app.services.rate_limiter import dashscope_limiter
+
+
+BAILIAN_TASKS_URL = "https://dashscope.aliyuncs.com/api/v1/tasks"
+
+# 查询时间点对应的完成耗时分位数
+POLL_QUANTILES = (0.1, 0.25, 0.5, 0.75, 0.9, 0.95, 0.99)
+
+# 按分布调度所需的最少样本数，不足时按指数退避
+MIN_SAMPLES = 10
+
+# 每类任务保留的完成耗时样本数
+MAX_SAMPLES = 200
+
+# 指数退避系数
+BACKOFF_FACTOR = 1.5
+
+# 统计查询速率的时间窗口（秒）
+RATE_WINDOW = 60.0
+
+
+@dataclass
+class _PendingTask:
+    """等待结果的百炼任务"""
+    task_id: str
+    kind: str
+    future: concurrent.futures.Future
+    loop: Optional[asyncio.AbstractEventLoop]
+    submitted_at: float
+    next_poll: float
+    interval: float
+    polls: int = 0
+
+
+class DashScopePoller:
+    """
+    百炼异步任务轮询器
+    
+    每个进程一个后台轮询协程，运行在最先登记任务的事件循环上；其他事件循环
+    （例如 I/O Worker 的其他线程）中的等待者通过线程安全的 Future 取得结果。
+    该事件循环结束时，轮询协程转移到仍在等待的任务所在的事件循环上继续运行
+    """
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending: Dict[str, _PendingTask] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._runner = None
+        self._durations: Dict[str, Deque[float]] = {}
+        self._poll_times: Deque[float] = deque()
+        self._stats: Dict[str, int] = {
+            "polls": 0,
+            "errors": 0,
+            "succeeded": 0,
+            "failed": 0,
+            "timeouts": 0
+        }
+    
+    async def wait(self, task_id: str, kind: str) -> dict:
+        """
+        登记任务并等待结果
+        
+        Args:
+            task_id: 百炼任务 ID
+            kind: 任务类型（image / tts），分别统计完成耗时
+        
+        Returns:
+            任务成功时的 output
+        
+        Raises:
+            RuntimeError: 任务失败
+            TimeoutError: 超过 DASHSCOPE_POLL_TIMEOUT 仍未完成
+        """
+        now = time.monotonic()
+        pending = _PendingTask(
+            task_id=task_id,
+            kind=kind,
+            future=concurrent.futures.Future(),
+            loop=asyncio.get_running_loop(),
+            submitted_at=now,
+            next_poll=now,
+            interval=settings.DASHSCOPE_POLL_MIN_INTERVAL
+        )
+        pending.next_poll = now + self._next_delay(pending, now)
+        
+        with self._lock:
+            self._pending[task_id] = pending
+            self._ensure_runner()
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+        
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(pending.future), settings.DASHSCOPE_POLL_TIMEOUT)
+        except asyncio.TimeoutError:
+            self._stats["timeouts"] += 1
+            raise TimeoutError("轮询超时") from None
+        finally:
+            # 调用方被取消（如任务被用户取消）或超时后不再查询
+            with self._lock:
+                if self._pending.get(task_id) is pending:
+                    del self._pending[task_id]
+    
+    def _ensure_runner(self):
+        """
+        确保轮询协程在运行（持有 _lock 时调用）
+        
+        所在事件循环已经结束时改为在当前事件循环上运行
+        """
+        current = asyncio.get_running_loop()
+        if self._loop is None or self._loop.is_closed() or not self._loop.is_running():
+            self._loop = current
+            self._wakeup = asyncio.Event()
+            self._runner = None
+        
+        if self._runner is None:
+            if self._loop is current:
+                self._runner = current.create_task(self._run())
+            else:
+                self._runner = asyncio.run_coroutine_threadsafe(self._run(), self._loop)
+    
+    def _hand_off(self):
+        """
+        轮询协程所在的事件循环正在关闭：转移到其他等待者的事件循环（持有 _lock 时调用）
+        """
+        for pending in self._pending.values():
+            loop = pending.loop
+            if loop is not self._loop and loop.is_running() and not pending.future.done():
+                self._loop = loop
+                self._wakeup = asyncio.Event()
+                self._runner = asyncio.run_coroutine_threadsafe(self._run(), loop)
+                logger.info("[轮询] 事件循环已结束，轮询转移到其他事件循环")
+                return
+    
+    def _next_delay(self, pending: _PendingTask, now: float) -> float:
+        """距下一次查询的秒数"""
+        min_interval = settings.DASHSCOPE_POLL_MIN_INTERVAL
+        max_interval = settings.DASHSCOPE_POLL_MAX_INTERVAL
+        age = now - pending.submitted_at
+        
+        samples = self._samples(pending.kind)
+        if len(samples) >= MIN_SAMPLES:
+            # 在下一个尚未经过的分位点查询，完成概率最高的时间段查询更密
+            for q in POLL_QUANTILES:
+                point = samples[int(q * (len(samples) - 1))]
+                if point >= age + min_interval:
+                    return min(point - age, max_interval)
+        
+        if pending.polls:
+            pending.interval = min(pending.interval * BACKOFF_FACTOR, max_interval)
+        return pending.interval
+    
+    async def _run(self):
+        """后台轮询：查询所有到期的任务，没有待查询任务时退出"""
+        cancelled = False
+        try:
+            while True:
+                with self._lock:
+                    if not self._pending:
+                        return
+                    self._wakeup.clear()
+                    now = time.monotonic()
+                    due = [p for p in self._pending.values() if p.next_poll <= now and not p.future.done()]
+                
+                for start in range(0, len(due), settings.DASHSCOPE_POLL_BATCH_SIZE):
+                    batch = due[start:start + settings.DASHSCOPE_POLL_BATCH_SIZE]
+                    try:
+                        await asyncio.gather(*(self._poll(p) for p in batch))
+                    except Exception as e:
+                        # 单批出错不能让轮询协程退出，否则所有等待者都拿不到结果
+                        logger.exception(f"[轮询] 批量查询出错: {e}")
+                
+                with self._lock:
+                    for task_id, pending in list(self._pending.items()):
+                        if pending.future.done():
+                            del self._pending[task_id]
+                    if not self._pending:
+                        return
+                    next_poll = min(p.next_poll for p in self._pending.values())
+                
+                try:
+                    # 新任务登记时提前唤醒，重新计算下一次查询时间
+                    await asyncio.wait_for(self._wakeup.wait(), max(next_poll - time.monotonic(), 0))
+                except asyncio.TimeoutError:
+                    pass
+        except asyncio.CancelledError:
+            cancelled = True
+            raise
+        finally:
+            with self._lock:
+                self._runner = None
+                if cancelled and self._pending:
+                    self._hand_off()
+    
+    async def _poll(self, pending: _PendingTask):
+        """查询单个任务，完成时唤醒等待者，否则安排下一次查询"""
+        pending.polls += 1
+        self._count_poll()
+        try:
+            async with dashscope_limiter.limit("tasks"):
+                response = await dashscope_http.get().get(
+                    f"{BAILIAN_TASKS_URL}/{pending.task_id}",
+                    headers={"Authorization": f"Bearer {settings.BAILIAN_API_KEY}"},
+                    timeout=10.0
+                )
+                response.raise_for_status()
+            output = response.json().get("output", {})
+        except Exception as e:
+            # 查询失败（网络错误、响应无法解析）不代表任务失败，退避后重试直到等待者超时
+            self._stats["errors"] += 1
+            logger.warning(f"[轮询] 查询任务 {pending.task_id} 失败: {e}")
+            output = {}
+        
+        now = time.monotonic()
+        task_status = output.get("task_status")
+        if task_status == "SUCCEEDED":
+            if self._resolve(pending, result=output):
+                self._record_duration(pending.kind, now - pending.submitted_at)
+                self._stats["succeeded"] += 1
+        elif task_status in ("FAILED", "CANCELED", "UNKNOWN"):
+            if self._resolve(pending, error=RuntimeError(f"任务失败: {output.get('message', task_status)}")):
+                self._stats["failed"] += 1
+        else:
+            delay = self._next_delay(pending, now)
+            pending.next_poll = now + delay
+            logger.debug(
+                f"[轮询] 任务 {pending.task_id} 状态: {task_status}, 第 {pending.polls} 次查询, "
+                f"{delay:.1f}s 后再查"
+            )
+    
+    def _resolve(self, pending: _PendingTask, result: Optional[dict] = None, error: Optional[Exception] = None) -> bool:
+        """唤醒等待者；等待者已超时或被取消时返回 False"""
+        try:
+            if error is not None:
+                pending.future.set_exception(error)
+            else:
+                pending.future.set_result(result)
+            return True
+        except concurrent.futures.InvalidStateError:
+            return False
+    
+    def _samples(self, kind: str) -> List[float]:
+        """完成耗时样本（升序）"""
+        with self._lock:
+            return sorted(self._durations.get(kind, ()))
+    
+    def _record_duration(self, kind: str, seconds: float):
+        """记录完成耗时"""
+        with self._lock:
+            durations = self._durations.get(kind)
+            if durations is None:
+                durations = self._durations[kind] = deque(maxlen=MAX_SAMPLES)
+            durations.append(seconds)
+    
+    def _count_poll(self):
+        now = time.monotonic()
+        self._stats["polls"] += 1
+        self._poll_times.append(now)
+        while self._poll_times and now - self._poll_times[0] > RATE_WINDOW:
+            self._poll_times.popleft()
+    
+    def stats(self) -> dict:
+        """轮询统计（当前进程）：最近一分钟的每秒查询数、待查询任务数与完成耗时分位数"""
+        now = time.monotonic()
+        recent = sum(1 for t in list(self._poll_times) if now - t <= RATE_WINDOW)
+        
+        durations = {}
+        for kind in list(self._durations):
+            ordered = self._samples(kind)
+            durations[kind] = {
+                "samples": len(ordered),
+                "p50": round(ordered[len(ordered) // 2], 1),
+                "p90": round(ordered[int(0.9 * (len(ordered) - 1))], 1)
+            }
+        
+        return {
+            **self._stats,
+            "polls_per_second": round(recent / RATE_WINDOW, 3),
+            "pending": len(self._pending),
+            "durations": durations
+        }
+
+
+# 单例
+dashscope_poller = DashScopePoller()
@@ -0,0 +1,107 @@
+"""
+视频任务去重
+移动端网络不稳定时会重复提交同一个视频。以客户端提供的 Idempotency-Key，
+或幻灯片 + 配置的规范化哈希作为请求指纹：同一用户相同指纹的任务进行中时直接返回原任务，
+已完成时直接返回已有结果，不再提交新的 Celery 任务
+"""
+
+import hashlib
+import json
+from typing import Optional
+
+from redis import RedisError
+
+from app.config import settings
+from app.core.logger import logger
+from app.core.redis import get_redis
+from app.models.schemas import VideoCreateRequest
+
+
+DEDUP_KEY_PREFIX = "video:dedup:"
+
+
+class JobDeduplicator:
+    """
+    请求指纹 -> task_id 映射
+    
+    保存在 Redis 字符串 video:dedup:user{用户ID}:{指纹} 中，按用户隔离。
+    匿名请求只认客户端提供的 Idempotency-Key，按 video:dedup:anon:{客户端地址}:{指纹} 隔离；
+    请求内容哈希在匿名请求间无法区分客户端（返回原任务即允许读取和取消他人的任务），不使用。
+    Redis 不可用时不去重，照常提交任务
+    """
+    
+    def make_key(
+        self,
+        request: VideoCreateRequest,
+        idempotency_key: Optional[str] = None,
+        user_id: Optional[int] = None,
+        client: Optional[str] = None
+    ) -> Optional[str]:
+        """
+        生成请求指纹（客户端 Key 优先，否则为幻灯片 + 配置 + 是否预览的哈希）
+        
+        Args:
+            client: 客户端地址，匿名请求按它和 Idempotency-Key 隔离
+        
+        Returns:
+            指纹，未提供 Idempotency-Key 的匿名请求返回 None（不去重）
+        """
+        if user_id is not None:
+            scope = f"user{user_id}"
+        elif idempotency_key:
+            scope = f"anon:{client}" if client else "anon"
+        else:
+            return None
+        
+        if idempotency_key:
+            fingerprint = "key:" + hashlib.sha256(idempotency_key.encode("utf-8")).hexdigest()
+        else:
+            canonical = json.dumps(
+                {
+                    "slides": [slide.model_dump(mode="json") for slide in request.slides],
+                    "config": request.config.model_dump(mode="json"),
+                    # 带预览的请求会额外生成草稿，不能复用不带预览的任务
+                    "preview": request.preview
+                },
+                ensure_ascii=False,
+                sort_keys=True,
+                separators=(",", ":")
+            )
+            fingerprint = "body:" + hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+        return f"{DEDUP_KEY_PREFIX}{scope}:{fingerprint}"
+    
+    def claim(self, key: str, task_id: str) -> Optional[str]:
+        """
+        占用指纹
+        
+        Returns:
+            已有任务的 task_id；指纹未被占用（本次占用成功）时返回 None
+        """
+        try:
+            redis = get_redis()
+            if redis.set(key, task_id, nx=True, ex=settings.VIDEO_DEDUP_TTL):
+                return None
+            return redis.get(key)
+        except RedisError as e:
+            logger.warning(f"[去重] 查询失败，按新任务处理: {e}")
+            return None
+    
+    def replace(self, key: str, task_id: str):
+        """原任务失败或已过期时，把指纹指向新任务"""
+        try:
+            get_redis().set(key, task_id, ex=settings.VIDEO_DEDUP_TTL)
+        except RedisError as e:
+            logger.warning(f"[去重] 更新失败: {e}")
+    
+    def release(self, key: str, task_id: str):
+        """任务提交失败时释放指纹（仅当仍指向该任务）"""
+        try:
+            redis = get_redis()
+            if redis.get(key) == task_id:
+                redis.delete(key)
+        except RedisError as e:
+            logger.warning(f"[去重] 释放失败: {e}")
+
+
+# 单例
+job_deduplicator = JobDeduplicator()
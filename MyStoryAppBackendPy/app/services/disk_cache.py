@@ -0,0 +1,176 @@
+"""
+内容寻址磁盘缓存
+多个 Worker 进程可共享同一缓存目录：写入先落临时文件再原子重命名，
+按文件修改时间做 LRU 淘汰
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Optional
+
+from app.core.logger import logger
+
+
+# 残留临时文件（写入进程崩溃）的清理阈值
+STALE_TEMP_SECONDS = 3600
+
+
+def hash_file(path: str) -> str:
+    """计算文件内容的 SHA-256"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def link_or_copy(src: Path, dst: Path):
+    """硬链接文件，跨文件系统时退化为复制"""
+    dst.unlink(missing_ok=True)
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+
+class DiskCache:
+    """内容寻址磁盘缓存"""
+    
+    def __init__(self, name: str, directory: str, max_bytes: int):
+        self.name = name
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._approx_size: Optional[int] = None
+    
+    @staticmethod
+    def make_key(*parts) -> str:
+        """根据任意可 JSON 序列化的参数生成缓存键"""
+        raw = json.dumps(parts, ensure_ascii=False, separators=(",", ":"))
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+    
+    def _path(self, key: str, suffix: str) -> Path:
+        return self.directory / key[:2] / f"{key}{suffix}"
+    
+    def get(self, key: str, suffix: str) -> Optional[Path]:
+        """
+        查找缓存
+        
+        命中时刷新文件修改时间，作为 LRU 的访问时间
+        """
+        path = self._path(key, suffix)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            with self._lock:
+                self._misses += 1
+            return None
+        
+        with self._lock:
+            self._hits += 1
+        return path
+    
+    def link(self, key: str, suffix: str, dst: Path) -> bool:
+        """
+        命中时把缓存文件链接到 dst（同时刷新访问时间）
+        
+        查找后、链接前文件可能被其他进程淘汰，此时按未命中计数
+        
+        Returns:
+            是否命中
+        """
+        path = self._path(key, suffix)
+        try:
+            os.utime(path)
+            link_or_copy(path, dst)
+        except FileNotFoundError:
+            with self._lock:
+                self._misses += 1
+            return False
+        
+        with self._lock:
+            self._hits += 1
+        return True
+    
+    def temp_path(self, suffix: str) -> Path:
+        """获取一个写入用的临时文件路径（与缓存在同一文件系统）"""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        return self.directory / f".tmp_{uuid.uuid4().hex}{suffix}"
+    
+    def commit(self, temp_path: Path, key: str, suffix: str) -> Path:
+        """
+        将临时文件原子地移入缓存
+        
+        并发写入同一个键时后写入者覆盖先写入者，内容相同所以无害
+        """
+        path = self._path(key, suffix)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        size = temp_path.stat().st_size
+        os.replace(temp_path, path)
+        
+        with self._lock:
+            if self._approx_size is not None:
+                self._approx_size += size
+            need_evict = self._approx_size is None or self._approx_size > self.max_bytes
+        
+        if need_evict:
+            self.evict()
+        return path
+    
+    def evict(self):
+        """扫描缓存目录，按最近访问时间淘汰到容量上限以内"""
+        entries = []
+        total = 0
+        now = time.time()
+        
+        for path in self.directory.glob("*/*"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+            total += stat.st_size
+        
+        for path in self.directory.glob(".tmp_*"):
+            try:
+                if now - path.stat().st_mtime > STALE_TEMP_SECONDS:
+                    path.unlink(missing_ok=True)
+            except FileNotFoundError:
+                continue
+        
+        evicted = 0
+        if total > self.max_bytes:
+            entries.sort()
+            for _, size, path in entries:
+                if total <= self.max_bytes:
+                    break
+                path.unlink(missing_ok=True)
+                total -= size
+                evicted += 1
+            logger.info(f"[缓存:{self.name}] 淘汰 {evicted} 个文件, 当前大小: {total} bytes")
+        
+        with self._lock:
+            self._approx_size = total
+            self._evictions += evicted
+    
+    def stats(self) -> dict:
+        """命中统计（当前进程）"""
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": self._hits / lookups if lookups else 0.0,
+                "evictions": self._evictions,
+                "size_bytes": self._approx_size
+            }
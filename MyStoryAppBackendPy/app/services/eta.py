@@ -0,0 +1,218 @@
+"""
+任务耗时预估
+每个完成的任务按阶段记录耗时样本，换算为单位耗时（每秒视频的编码/合并秒数、
+每张图片的扩展秒数、每个字的配音秒数）后按分辨率、帧率、是否扩展、配音文本长度
+分别做指数滑动平均。预估时按新任务的参数累加各阶段耗时，再乘以同类任务
+实际总耗时与阶段耗时之和的比例（反映流水线各阶段的重叠程度）
+"""
+
+import json
+import time
+from dataclasses import asdict, dataclass
+from typing import Dict, Iterable, Optional
+
+from redis import RedisError
+
+from app.core.logger import logger
+from app.core.redis import get_redis
+from app.services.video_service import RESOLUTION_MAP
+
+
+RATES_KEY = "video:eta:rates"
+SAMPLES_KEY = "video:eta:samples"
+
+# 指数滑动平均系数
+SMOOTHING = 0.2
+
+# 保留的原始样本数（用于离线分析）
+MAX_SAMPLES = 1000
+
+# 没有样本时的默认单位耗时（720p / 30fps 基准，其他分辨率按像素数 × 帧率折算）
+DEFAULT_RATES = {
+    "encode": 0.3,  # 每秒视频的片段编码秒数
+    "concat": 0.05,  # 每秒视频的合并/配乐秒数
+    "expand": 20.0,  # 每张图片的 AI 扩展秒数
+    "voice": 0.05,  # 每个字的配音秒数
+    "overlap": 1.0  # 实际总耗时 / 各阶段耗时之和
+}
+
+# 逐阶段执行（staged）的阶段名与流水线节点类型的对应关系
+STAGE_KINDS = {
+    "expanding_images": "expand",
+    "generating_voice": "voice",
+    "composing": "encode"
+}
+
+
+@dataclass
+class JobFeatures:
+    """影响耗时的任务参数"""
+    resolution: str
+    frame_rate: int
+    expansion: bool
+    slides: int
+    video_seconds: float
+    text_chars: int
+    
+    @classmethod
+    def from_request(cls, slides: Iterable, config) -> "JobFeatures":
+        """从幻灯片与视频配置提取（SlideRequest / Slide 均可）"""
+        slides = list(slides)
+        return cls(
+            resolution=config.resolution.value,
+            frame_rate=config.frame_rate,
+            expansion=config.ai_image_expansion,
+            slides=len(slides),
+            video_seconds=float(sum(slide.duration for slide in slides)),
+            text_chars=sum(len(slide.voice_text or "") for slide in slides)
+        )
+    
+    @property
+    def text_bucket(self) -> str:
+        """配音文本长度分档"""
+        if not self.text_chars:
+            return "none"
+        return "short" if self.text_chars < 500 else "long"
+    
+    def pixel_scale(self) -> float:
+        """相对 720p / 30fps 的像素吞吐量"""
+        width, height = RESOLUTION_MAP.get(self.resolution, (1280, 720))
+        return width * height * self.frame_rate / (1280 * 720 * 30)
+
+
+class EtaEstimator:
+    """
+    耗时预估
+    
+    单位耗时保存在 Redis hash video:eta:rates 中，字段如 encode:1080p:30、
+    expand、voice、overlap:exp:long，计数字段为 n:{字段}
+    """
+    
+    def _fields(self, features: JobFeatures) -> Dict[str, str]:
+        video_key = f"{features.resolution}:{features.frame_rate}"
+        return {
+            "encode": f"encode:{video_key}",
+            "concat": f"concat:{video_key}",
+            "expand": "expand",
+            "voice": "voice",
+            "overlap": f"overlap:{'exp' if features.expansion else 'noexp'}:{features.text_bucket}"
+        }
+    
+    def _rates(self, features: JobFeatures) -> Dict[str, float]:
+        """读取单位耗时，没有样本的项使用默认值"""
+        fields = self._fields(features)
+        try:
+            values = get_redis().hmget(RATES_KEY, list(fields.values()))
+        except RedisError as e:
+            logger.warning(f"[预估] 读取耗时样本失败: {e}")
+            values = [None] * len(fields)
+        
+        rates = {}
+        for (name, _), value in zip(fields.items(), values):
+            if value is not None:
+                rates[name] = float(value)
+            elif name in ("encode", "concat"):
+                rates[name] = DEFAULT_RATES[name] * features.pixel_scale()
+            else:
+                rates[name] = DEFAULT_RATES[name]
+        return rates
+    
+    def _stage_seconds(self, features: JobFeatures, rates: Dict[str, float]) -> Dict[str, float]:
+        """按单位耗时估算各阶段耗时"""
+        return {
+            "encode": rates["encode"] * features.video_seconds,
+            "concat": rates["concat"] * features.video_seconds,
+            "expand": rates["expand"] * features.slides if features.expansion else 0.0,
+            "voice": rates["voice"] * features.text_chars
+        }
+    
+    def predict(self, features: JobFeatures) -> float:
+        """
+        预估处理耗时（秒，不含排队）
+        """
+        rates = self._rates(features)
+        return sum(self._stage_seconds(features, rates).values()) * rates["overlap"]
+    
+    def record(self, features: JobFeatures, timings: Dict[str, float]):
+        """
+        记录一个完成任务的耗时样本
+        
+        Args:
+            features: 任务参数
+            timings: 按节点类型汇总的耗时（NodeTimer.summary() 或逐阶段执行的阶段耗时），
+                wall 为总耗时
+        """
+        kinds: Dict[str, float] = {}
+        for name, seconds in timings.items():
+            kind = STAGE_KINDS.get(name, name)
+            kinds[kind] = kinds.get(kind, 0.0) + seconds
+        wall = kinds.pop("wall", None) or sum(kinds.values())
+        
+        fields = self._fields(features)
+        samples = {}
+        if features.video_seconds:
+            if "encode" in kinds:
+                samples[fields["encode"]] = kinds["encode"] / features.video_seconds
+            if "concat" in kinds:
+                samples[fields["concat"]] = kinds["concat"] / features.video_seconds
+        if features.expansion and kinds.get("expand") and features.slides:
+            samples[fields["expand"]] = kinds["expand"] / features.slides
+        if kinds.get("voice") and features.text_chars:
+            samples[fields["voice"]] = kinds["voice"] / features.text_chars
+        
+        modeled = sum(kinds.get(kind, 0.0) for kind in ("encode", "concat", "expand", "voice"))
+        if modeled and wall:
+            samples[fields["overlap"]] = wall / modeled
+        
+        try:
+            redis = get_redis()
+            current = dict(zip(samples, redis.hmget(RATES_KEY, list(samples)))) if samples else {}
+            
+            pipe = redis.pipeline()
+            for field, value in samples.items():
+                previous = current.get(field)
+                if previous is not None:
+                    value = (1 - SMOOTHING) * float(previous) + SMOOTHING * value
+                pipe.hset(RATES_KEY, field, value)
+                pipe.hincrby(RATES_KEY, f"n:{field}", 1)
+            pipe.lpush(SAMPLES_KEY, json.dumps({
+                **asdict(features),
+                "timings": timings,
+                "recorded_at": time.time()
+            }))
+            pipe.ltrim(SAMPLES_KEY, 0, MAX_SAMPLES - 1)
+            pipe.execute()
+        except RedisError as e:
+            logger.warning(f"[预估] 记录耗时样本失败: {e}")
+    
+    def refine(self, record: dict) -> Optional[float]:
+        """
+        根据任务状态实时修正剩余时间
+        
+        开始前为预估耗时；运行中按已用时间与进度推算剩余时间，
+        进度越高越倾向于实际速度
+        
+        Returns:
+            预计剩余秒数（不含排队），缺少预估时为 None
+        """
+        estimated = record.get("estimated_time")
+        if estimated is None:
+            return None
+        estimated = float(estimated)
+        
+        started_at = record.get("started_at")
+        progress = float(record.get("progress") or 0.0)
+        if not started_at:
+            return estimated
+        
+        elapsed = time.time() - float(started_at)
+        model_remaining = max(estimated - elapsed, estimated * (1 - progress))
+        if progress <= 0.05:
+            return model_remaining
+        
+        observed_remaining = elapsed * (1 - progress) / progress
+        return progress * observed_remaining + (1 - progress) * model_remaining
+
+
+# 单例
+eta_estimator = EtaEstimator()
@@ -0,0 +1,97 @@
+"""
+图片扩展结果缓存
+同一张原图（按内容哈希）以相同风格扩展过时直接返回上次的结果。百炼返回的结果 URL
+会过期，所以生成后立即把图片下载并保存到我们自己的存储中，缓存记录的是存储 URL；
+Worker 通过存储服务读取这些图片（见 video_service.download_image），不经过公共 URL
+"""
+
+import asyncio
+from typing import Optional
+
+from redis import RedisError
+
+from app.config import settings
+from app.core.logger import logger
+from app.core.redis import get_redis
+from app.services.disk_cache import DiskCache
+from app.services.storage import get_storage
+
+
+# 缓存格式版本，修改扩展参数（提示词模板、尺寸等）时递增以使旧缓存失效
+EXPANSION_CACHE_VERSION = 1
+
+CACHE_KEY_PREFIX = "image:expand:"
+STATS_KEY = "image:expand:stats"
+
+
+class ExpansionCache:
+    """图片扩展结果缓存（Redis 索引 + 共享存储）"""
+    
+    def make_key(self, image_hash: str, style_prompt: str, model: str) -> str:
+        """缓存键：原图内容哈希 + 风格提示词 + 模型"""
+        return DiskCache.make_key(EXPANSION_CACHE_VERSION, image_hash, style_prompt, model)
+    
+    def _count(self, field: str):
+        """全局命中统计"""
+        try:
+            get_redis().hincrby(STATS_KEY, field, 1)
+        except RedisError as e:
+            logger.warning(f"[扩展缓存] 更新统计失败: {e}")
+    
+    def get(self, key: str) -> Optional[str]:
+        """
+        查找缓存
+        
+        Returns:
+            命中时返回存储中的图片 URL，未命中（或 Redis 不可用）返回 None
+        """
+        if not settings.IMAGE_EXPANSION_CACHE_ENABLED:
+            return None
+        
+        try:
+            url = get_redis().get(CACHE_KEY_PREFIX + key)
+        except RedisError as e:
+            logger.warning(f"[扩展缓存] 读取失败: {key[:12]}, {e}")
+            return None
+        
+        self._count("hits" if url else "misses")
+        if url:
+            logger.info(f"[扩展缓存] 命中: {key[:12]}")
+        return url
+    
+    async def put(self, key: str, image_data: bytes, content_type: str) -> str:
+        """
+        保存扩展结果到存储并记录索引
+        
+        Returns:
+            存储中的图片 URL
+        """
+        ext = "png" if content_type == "image/png" else "jpg"
+        url = await get_storage().upload_from_bytes(image_data, f"expanded_{key[:32]}.{ext}", content_type)
+        
+        if settings.IMAGE_EXPANSION_CACHE_ENABLED:
+            try:
+                await asyncio.to_thread(
+                    get_redis().set, CACHE_KEY_PREFIX + key, url, ex=settings.IMAGE_EXPANSION_CACHE_TTL
+                )
+            except RedisError as e:
+                logger.warning(f"[扩展缓存] 写入失败: {key[:12]}, {e}")
+        return url
+    
+    def stats(self) -> dict:
+        """命中统计（所有进程累计）"""
+        try:
+            stats = {field: int(value) for field, value in get_redis().hgetall(STATS_KEY).items()}
+        except RedisError as e:
+            logger.warning(f"[扩展缓存] 读取统计失败: {e}")
+            stats = {}
+        
+        lookups = stats.get("hits", 0) + stats.get("misses", 0)
+        return {
+            **stats,
+            "hit_rate": stats.get("hits", 0) / lookups if lookups else 0.0
+        }
+
+
+# 单例
+expansion_cache = ExpansionCache()
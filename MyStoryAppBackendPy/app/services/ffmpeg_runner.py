@@ -0,0 +1,125 @@
+"""
+FFmpeg 子进程运行器
+以 asyncio 子进程方式执行 ffmpeg，避免阻塞事件循环，
+并通过 -progress pipe:1 实时解析编码进度
+"""
+
+import asyncio
+import os
+from typing import Awaitable, Callable, List, Optional
+
+import ffmpeg
+
+from app.config import settings
+from app.core.logger import logger
+
+
+def get_render_slots() -> int:
+    """
+    获取单个 Worker 进程可同时运行的 ffmpeg 数量
+
+    VIDEO_RENDER_CONCURRENCY 为 0 时按 CPU 核数自动计算：
+    libx264 本身是多线程的，每个 ffmpeg 预留 2 个核心
+    """
+    cpu_count = os.cpu_count() or 1
+    if settings.VIDEO_RENDER_CONCURRENCY > 0:
+        return min(settings.VIDEO_RENDER_CONCURRENCY, cpu_count)
+    return max(1, cpu_count // 2)
+
+
+async def run_ffmpeg(
+    cmd: List[str],
+    duration: Optional[float] = None,
+    on_progress: Optional[Callable[[float], Awaitable[None]]] = None,
+    frame_rate: Optional[float] = None
+) -> None:
+    """
+    运行 ffmpeg 命令
+
+    Args:
+        cmd: 完整命令行（含 ffmpeg 可执行文件）
+        duration: 输出时长（秒），用于把时间计数换算为进度
+        on_progress: 进度回调，参数为 0-1 的完成比例
+        frame_rate: 输出帧率，时间计数不可用时按帧数换算进度
+
+    Raises:
+        ffmpeg.Error: ffmpeg 返回非零退出码
+    """
+    track_progress = on_progress is not None and bool(duration)
+    if track_progress:
+        cmd = [cmd[0], "-progress", "pipe:1", "-nostats"] + cmd[1:]
+
+    process = await asyncio.create_subprocess_exec(
+        *cmd,
+        stdin=asyncio.subprocess.DEVNULL,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE
+    )
+
+    try:
+        if track_progress:
+            # stderr 必须同时读取，否则缓冲区写满会阻塞 ffmpeg
+            stderr_task = asyncio.ensure_future(process.stderr.read())
+            try:
+                await _read_progress(process.stdout, duration, on_progress, frame_rate)
+                stderr = await stderr_task
+            finally:
+                stderr_task.cancel()
+            stdout = b""
+            await process.wait()
+        else:
+            stdout, stderr = await process.communicate()
+    except BaseException:
+        # 协程被取消或进度回调出错时不留下孤儿进程
+        await _kill(process)
+        raise
+
+    if process.returncode != 0:
+        raise ffmpeg.Error(cmd[0], stdout, stderr)
+
+
+async def _read_progress(
+    stream: asyncio.StreamReader,
+    duration: float,
+    on_progress: Callable[[float], Awaitable[None]],
+    frame_rate: Optional[float]
+):
+    """
+    解析 -progress 输出
+
+    ffmpeg 每隔约 0.5 秒输出一组 key=value，以 progress=continue/end 结尾
+    """
+    out_time = 0.0
+    frame = 0
+
+    while True:
+        line = await stream.readline()
+        if not line:
+            break
+
+        key, _, value = line.decode(errors="ignore").strip().partition("=")
+        if key in ("out_time_us", "out_time_ms"):
+            # out_time_ms 历史上实际单位也是微秒
+            if value.isdigit():
+                out_time = int(value) / 1_000_000
+        elif key == "frame":
+            if value.isdigit():
+                frame = int(value)
+        elif key == "progress":
+            fraction = out_time / duration
+            if frame_rate:
+                fraction = max(fraction, frame / (frame_rate * duration))
+            await on_progress(min(fraction, 1.0))
+            if value == "end":
+                break
+
+
+async def _kill(process: asyncio.subprocess.Process, timeout: Optional[float] = 5.0):
+    """终止 ffmpeg 进程"""
+    if process.returncode is not None:
+        return
+    try:
+        process.kill()
+        await asyncio.wait_for(process.wait(), timeout)
+    except (ProcessLookupError, asyncio.TimeoutError) as e:
+        logger.warning(f"[FFmpeg] 终止进程失败: pid={process.pid}, {e}")
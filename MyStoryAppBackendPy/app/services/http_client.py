@@ -0,0 +1,138 @@
+"""
+百炼（DashScope）共享 HTTP 客户端
+图片扩展、语音合成的提交、轮询与结果下载共用一个长连接池，避免每次请求重新
+TCP/TLS 握手。httpx 的连接绑定在创建它的事件循环上，按事件循环各建一个客户端：
+API 进程和每个 Worker 进程（任务在进程级事件循环中运行，见 app.tasks.event_loop）
+都只有一个长期运行的事件循环，整个进程共用一个客户端，进程退出时关闭
+"""
+
+import asyncio
+import weakref
+from typing import Dict
+
+import httpx
+
+from app.config import settings
+from app.core.logger import logger
+
+# HTTP/2 支持（可选依赖）
+try:
+    import h2
+except ImportError:
+    h2 = None
+
+
+class HttpClientPool:
+    """
+    按事件循环复用的 httpx.AsyncClient
+    
+    通过 httpcore 的 trace 扩展统计新建连接与 TLS 握手次数，计算连接复用率
+    """
+    
+    def __init__(self):
+        self._clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = (
+            weakref.WeakKeyDictionary()
+        )
+        self._stats: Dict[str, int] = {
+            "requests": 0,
+            "connections": 0,
+            "tls_handshakes": 0,
+            "http2_responses": 0
+        }
+    
+    def _create_client(self) -> httpx.AsyncClient:
+        http2 = settings.DASHSCOPE_HTTP2
+        if http2 and h2 is None:
+            logger.warning("[HTTP] 未安装 h2，DashScope 请求使用 HTTP/1.1")
+            http2 = False
+        
+        return httpx.AsyncClient(
+            http2=http2,
+            timeout=settings.DASHSCOPE_TIMEOUT,
+            limits=httpx.Limits(
+                max_connections=settings.DASHSCOPE_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.DASHSCOPE_MAX_KEEPALIVE,
+                keepalive_expiry=settings.DASHSCOPE_KEEPALIVE_EXPIRY
+            ),
+            event_hooks={
+                "request": [self._on_request],
+                "response": [self._on_response]
+            }
+        )
+    
+    def get(self) -> httpx.AsyncClient:
+        """获取当前事件循环的客户端"""
+        loop = asyncio.get_running_loop()
+        client = self._clients.get(loop)
+        if client is None or client.is_closed:
+            client = self._create_client()
+            self._clients[loop] = client
+        return client
+    
+    async def _on_request(self, request: httpx.Request):
+        self._stats["requests"] += 1
+        request.extensions["trace"] = self._trace
+    
+    async def _on_response(self, response: httpx.Response):
+        if response.http_version == "HTTP/2":
+            self._stats["http2_responses"] += 1
+    
+    async def _trace(self, event_name: str, info: dict):
+        # 复用已有连接时不会触发 connect_tcp
+        if event_name == "connection.connect_tcp.complete":
+            self._stats["connections"] += 1
+        elif event_name == "connection.start_tls.complete":
+            self._stats["tls_handshakes"] += 1
+    
+    def stats(self) -> dict:
+        """连接复用统计（当前进程）"""
+        requests = self._stats["requests"]
+        reused = max(requests - self._stats["connections"], 0)
+        return {
+            **self._stats,
+            "reuse_ratio": round(reused / requests, 3) if requests else 0.0,
+            "open_clients": len(self._clients)
+        }
+    
+    async def aclose(self):
+        """
+        关闭所有客户端（API 或 Worker 进程退出时调用）
+        
+        其他事件循环的客户端提交到所属循环中关闭；所属循环已经结束时连接无法再
+        正常关闭，直接丢弃（socket 随对象回收释放）并记录数量
+        """
+        current = asyncio.get_running_loop()
+        clients = list(self._clients.items())
+        self._clients.clear()
+        
+        abandoned = 0
+        for loop, client in clients:
+            if client.is_closed:
+                continue
+            if loop is current:
+                await client.aclose()
+            elif loop.is_running():
+                future = asyncio.run_coroutine_threadsafe(client.aclose(), loop)
+                try:
+                    await asyncio.wait_for(asyncio.wrap_future(future), timeout=5)
+                except Exception as e:
+                    logger.warning(f"[HTTP] 关闭其他事件循环的客户端失败: {e}")
+            else:
+                abandoned += 1
+        
+        if abandoned:
+            logger.warning(f"[HTTP] {abandoned} 个客户端所属的事件循环已结束，直接丢弃")
+        logger.info(f"[HTTP] DashScope 连接统计: {self.stats()}")
+    
+    def reset(self):
+        """
+        丢弃所有客户端与统计（Worker 子进程 fork 后调用，
+        不继承父进程的连接）
+        """
+        self._clients = weakref.WeakKeyDictionary()
+        for key in self._stats:
+            self._stats[key] = 0
+
+
+# 单例
+dashscope_http = HttpClientPool()
@@ -0,0 +1,110 @@
+"""
+图片预处理服务
+原图只解码一次并缩放到目标分辨率，修正 EXIF 方向、统一为 RGB，
+结果按图片内容哈希 + 目标尺寸缓存，后续渲染直接使用小尺寸中间图
+"""
+
+import asyncio
+import math
+from pathlib import Path
+
+from PIL import Image, ImageOps
+
+from app.config import settings
+from app.core.logger import logger
+from app.services.disk_cache import DiskCache, hash_file, link_or_copy
+
+# HEIC 支持（可选依赖）
+try:
+    import pillow_heif
+    pillow_heif.register_heif_opener()
+except ImportError:
+    pillow_heif = None
+
+
+# 预处理参数版本，修改处理逻辑时递增以使旧缓存失效
+NORMALIZE_VERSION = 1
+
+image_cache = DiskCache(
+    "images",
+    settings.IMAGE_CACHE_DIR,
+    settings.IMAGE_CACHE_MAX_BYTES
+)
+
+
+class ImageNormalizer:
+    """图片预处理"""
+    
+    async def normalize(self, image_path: str, width: int, height: int, output_path: Path) -> str:
+        """
+        预处理图片
+        
+        缓存中的文件可能随时被其他进程淘汰，而 ffmpeg 的 -loop 1 输入在编码过程中
+        会反复读取图片，所以结果链接到调用方指定的任务临时路径，由调用方清理
+        
+        Args:
+            image_path: 原图本地路径
+            width: 目标宽度
+            height: 目标高度
+            output_path: 结果的任务临时路径
+        
+        Returns:
+            预处理后图片的本地路径（即 output_path）
+        """
+        image_hash = await asyncio.to_thread(hash_file, image_path)
+        key = DiskCache.make_key(NORMALIZE_VERSION, image_hash, width, height)
+        
+        cached_path = image_cache.get(key, ".png")
+        if cached_path:
+            try:
+                link_or_copy(cached_path, output_path)
+                return str(output_path)
+            except FileNotFoundError:
+                # 查找后被其他进程淘汰，按未命中处理
+                logger.info(f"[图片] 预处理缓存已被淘汰，重新处理: {image_path}")
+        
+        temp_path = image_cache.temp_path(".png")
+        try:
+            await asyncio.to_thread(self._normalize_sync, image_path, temp_path, width, height)
+            link_or_copy(temp_path, output_path)
+        except BaseException:
+            temp_path.unlink(missing_ok=True)
+            raise
+        
+        image_cache.commit(temp_path, key, ".png")
+        logger.info(f"[图片] 预处理完成: {image_path} -> {width}x{height}")
+        return str(output_path)
+    
+    def _normalize_sync(self, image_path: str, output_path: Path, width: int, height: int):
+        """解码、旋正、缩放并保存为 PNG"""
+        with Image.open(image_path) as image:
+            # JPEG 在 DCT 域直接降采样，避免完整解码大尺寸原图
+            # EXIF 旋转后宽高可能互换，取两种方向下较大的缩放比例
+            src_width, src_height = image.size
+            scale = max(
+                min(width / src_width, height / src_height),
+                min(width / src_height, height / src_width)
+            )
+            if scale < 1:
+                image.draft("RGB", (math.ceil(src_width * scale), math.ceil(src_height * scale)))
+            
+            image = ImageOps.exif_transpose(image)
+            
+            if image.mode in ("RGBA", "LA", "P"):
+                # 透明区域按黑色背景合成，与 ffmpeg pad 的填充色一致
+                image = image.convert("RGBA")
+                background = Image.new("RGB", image.size, (0, 0, 0))
+                background.paste(image, mask=image.getchannel("A"))
+                image = background
+            elif image.mode != "RGB":
+                image = image.convert("RGB")
+            
+            # 只缩小不放大，保持宽高比
+            image.thumbnail((width, height), Image.LANCZOS)
+            
+            # 中间文件只在本机使用，压缩级别取最快
+            image.save(output_path, "PNG", compress_level=1)
+
+
+# 单例
+image_normalizer = ImageNormalizer()
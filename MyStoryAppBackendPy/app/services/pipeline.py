@@ -0,0 +1,319 @@
+"""
+幻灯片流水线调度
+把视频任务按幻灯片拆成 下载 → AI 扩展 → 预处理 → 编码 的依赖链，配音与之并行。
+各类节点分别受自己的并发上限约束，不同幻灯片的不同阶段可以同时进行：
+第 1 张在编码时第 5 张可能还在等待扩展结果，外部 API 等待与 CPU 编码相互重叠。
+全部片段就绪后再统一合并
+"""
+
+import asyncio
+import time
+from contextlib import contextmanager
+from functools import partial
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple, Union
+
+from app.config import settings
+from app.core.logger import logger
+from app.models.schemas import Slide, VideoConfigRequest
+from app.services.bailian_image import bailian_image_service
+from app.services.bailian_tts import bailian_tts_service
+from app.services.checkpoint import JobCheckpoint
+from app.services.ffmpeg_runner import get_render_slots
+from app.services.video_service import RESOLUTION_MAP, ProgressTracker, video_service
+
+
+# 各类节点在整体进度中的权重（大致对应典型耗时）
+NODE_WEIGHTS = {
+    "download": 1,
+    "expand": 4,
+    "normalize": 1,
+    "encode": 3,
+    "voice": 2
+}
+
+NODE_LABELS = {
+    "expand": "扩展",
+    "normalize": "预处理",
+    "encode": "编码",
+    "voice": "配音"
+}
+
+# 流水线阶段占用的整体进度区间，之后为合并/单次编码
+PIPELINE_START = 0.05
+ASSEMBLE_START = {
+    "segments": 0.85,
+    "filtergraph": 0.5
+}
+
+
+class NodeTimer:
+    """
+    节点耗时记录
+    
+    每个节点记录相对流水线开始的起止时间（秒），可据此还原各阶段的重叠情况
+    """
+    
+    def __init__(self):
+        self._origin = time.perf_counter()
+        self.nodes: Dict[str, dict] = {}
+    
+    @contextmanager
+    def track(self, name: str):
+        """记录一个节点，名称形如 slide3.expand、concat"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            self.nodes[name] = {
+                "start": round(start - self._origin, 3),
+                "end": round(end - self._origin, 3),
+                "duration": round(end - start, 3)
+            }
+    
+    def summary(self) -> Dict[str, float]:
+        """按节点类型汇总累计耗时，wall 为流水线总耗时"""
+        totals: Dict[str, float] = {}
+        for name, node in self.nodes.items():
+            kind = name.rsplit(".", 1)[-1]
+            totals[kind] = round(totals.get(kind, 0.0) + node["duration"], 3)
+        totals["wall"] = round(time.perf_counter() - self._origin, 3)
+        return totals
+
+
+class SlidePipeline:
+    """
+    单个视频任务的流水线调度
+    
+    下载/扩展/配音/编码分别使用各自的信号量；节点结果写入检查点，
+    重试时已编码的幻灯片整条链路直接跳过。
+    media_prepared 为 True 时扩展与配音已由 I/O 队列完成，只使用检查点中的结果，
+    不再调用外部 API（缺少结果的幻灯片使用原图、没有配音）
+    """
+    
+    def __init__(
+        self,
+        slides: List[Slide],
+        config: VideoConfigRequest,
+        task_id: str,
+        checkpoint: JobCheckpoint,
+        progress_callback: Optional[Callable[[float, str], Awaitable[None]]] = None,
+        media_prepared: bool = False
+    ):
+        self.slides = slides
+        self.config = config
+        self.task_id = task_id
+        self.checkpoint = checkpoint
+        self.media_prepared = media_prepared
+        self.progress = ProgressTracker(progress_callback)
+        self.timer = NodeTimer()
+        
+        self.width, self.height = RESOLUTION_MAP.get(config.resolution.value, (1280, 720))
+        self.engine = settings.VIDEO_RENDER_ENGINE
+        self.assemble_start = ASSEMBLE_START.get(self.engine, ASSEMBLE_START["segments"])
+        
+        self._download_semaphore = asyncio.Semaphore(settings.IMAGE_DOWNLOAD_CONCURRENCY)
+        self._expand_semaphore = asyncio.Semaphore(settings.IMAGE_EXPANSION_CONCURRENCY)
+        self._tts_semaphore = asyncio.Semaphore(settings.TTS_CONCURRENCY)
+        self._render_semaphore = asyncio.Semaphore(get_render_slots())
+        
+        # (节点类型, 幻灯片序号) -> 完成比例
+        self._fractions: Dict[Tuple[str, int], float] = {}
+        self._downloads: List[Path] = []
+    
+    async def run(self) -> str:
+        """
+        执行流水线
+        
+        Returns:
+            输出视频的 URL
+        """
+        restored = self._plan()
+        logger.info(
+            f"[流水线] {self.task_id}: {len(self.slides)} 张幻灯片, "
+            f"节点 {len(self._fractions)} 个, 已恢复 {len(restored)} 个片段"
+        )
+        await self._report(force=True)
+        
+        tasks = [
+            asyncio.ensure_future(self._run_slide(i, restored.get(i)))
+            for i in range(len(self.slides))
+        ]
+        tasks += [
+            asyncio.ensure_future(self._run_voice(i))
+            for (kind, i), fraction in self._fractions.items()
+            if kind == "voice" and fraction < 1.0
+        ]
+        
+        try:
+            try:
+                results = await asyncio.gather(*tasks)
+            except BaseException:
+                # 任一节点失败时取消其余节点
+                for t in tasks:
+                    t.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+                raise
+            
+            outputs = results[:len(self.slides)]
+            with self.timer.track("concat"):
+                if self.engine == "filtergraph":
+                    return await video_service.assemble_video(
+                        self.slides, self.config, self.task_id, f"video_{self.task_id}.mp4",
+                        self.progress, image_paths=outputs, start=self.assemble_start
+                    )
+                return await video_service.assemble_video(
+                    self.slides, self.config, self.task_id, f"video_{self.task_id}.mp4",
+                    self.progress, slide_videos=outputs, start=self.assemble_start
+                )
+        finally:
+            for path in self._downloads:
+                path.unlink(missing_ok=True)
+    
+    def _plan(self) -> Dict[int, Path]:
+        """
+        登记所有节点，并从检查点恢复已完成的结果
+        
+        Returns:
+            已编码完成的片段 {序号: 路径}
+        """
+        restored = {}
+        for i, slide in enumerate(self.slides):
+            if slide.voice_text:
+                voice_url = self.checkpoint.get(JobCheckpoint.VOICE, i)
+                if voice_url:
+                    slide.voice_url = voice_url
+                if voice_url or not self.media_prepared:
+                    self._fractions[("voice", i)] = 1.0 if voice_url else 0.0
+            
+            segment = self.checkpoint.get(JobCheckpoint.SEGMENT, i)
+            if self.engine != "filtergraph" and segment and Path(segment).exists():
+                restored[i] = Path(segment)
+                self._fractions[("encode", i)] = 1.0
+                continue
+            
+            self._fractions[("download", i)] = 0.0
+            if self.config.ai_image_expansion:
+                self._fractions[("expand", i)] = 0.0
+            self._fractions[("normalize", i)] = 0.0
+            if self.engine != "filtergraph":
+                self._fractions[("encode", i)] = 0.0
+        return restored
+    
+    async def _run_slide(self, i: int, segment: Optional[Path]) -> Union[Path, str]:
+        """
+        单张幻灯片的图片链路
+        
+        Returns:
+            segments 引擎返回编码后的片段，filtergraph 引擎返回预处理后的图片
+        """
+        if segment:
+            return segment
+        
+        slide = self.slides[i]
+        source = await self._download(i, "download", slide.image_url, f"src_{i}")
+        await self._update("download", i, 1.0)
+        
+        image = source
+        if self.config.ai_image_expansion:
+            image = await self._expand(i, source)
+            await self._update("expand", i, 1.0)
+        
+        with self.timer.track(f"slide{i}.normalize"):
+            normalized = await video_service.normalize_image(image, self.width, self.height, self.task_id, i)
+        if normalized != image:
+            self._downloads.append(Path(normalized))
+        image = normalized
+        await self._update("normalize", i, 1.0)
+        
+        if self.engine == "filtergraph":
+            return image
+        
+        async with self._render_semaphore:
+            with self.timer.track(f"slide{i}.encode"):
+                segment = await video_service.create_slide_video(
+                    slide, self.width, self.height, self.config, i, self.task_id,
+                    on_progress=partial(self._update, "encode", i),
+                    image_path=image
+                )
+        self.checkpoint.save(JobCheckpoint.SEGMENT, i, str(segment))
+        await self._update("encode", i, 1.0)
+        return segment
+    
+    async def _download(self, i: int, node: str, url: str, name: str) -> str:
+        """下载图片到本地（本地路径直接返回），任务结束后删除"""
+        async with self._download_semaphore:
+            with self.timer.track(f"slide{i}.{node}"):
+                path = await video_service.download_image(url, self.task_id, name)
+        if path != url:
+            self._downloads.append(Path(path))
+        return path
+    
+    async def _expand(self, i: int, source: str) -> str:
+        """AI 扩展并下载结果，失败时保留原图"""
+        slide = self.slides[i]
+        expanded_url = self.checkpoint.get(JobCheckpoint.EXPANDED, i)
+        if not expanded_url and self.media_prepared:
+            return source
+        try:
+            if not expanded_url:
+                async with self._expand_semaphore:
+                    with self.timer.track(f"slide{i}.expand"):
+                        expanded_url = await bailian_image_service.expand_image(
+                            source,
+                            self.config.expansion_style.value
+                        )
+                self.checkpoint.save(JobCheckpoint.EXPANDED, i, expanded_url)
+            
+            slide.expanded_image_url = expanded_url
+            return await self._download(i, "fetch", expanded_url, f"exp_{i}")
+        except Exception as e:
+            logger.warning(f"图片扩展失败，使用原图: 幻灯片 {i}, {e}")
+            return source
+    
+    async def _run_voice(self, i: int):
+        """单张幻灯片的配音，失败不影响其他节点"""
+        slide = self.slides[i]
+        try:
+            async with self._tts_semaphore:
+                with self.timer.track(f"slide{i}.voice"):
+                    tts_result = await bailian_tts_service.generate_speech(
+                        slide.voice_text,
+                        self.config.voice_type.value,
+                        self.config.voice_speed
+                    )
+            slide.voice_url = tts_result["url"]
+            self.checkpoint.save(JobCheckpoint.VOICE, i, slide.voice_url)
+        except Exception as e:
+            logger.warning(f"配音生成失败: 幻灯片 {i}, {e}")
+        await self._update("voice", i, 1.0)
+    
+    async def _update(self, kind: str, i: int, fraction: float):
+        """更新节点进度"""
+        self._fractions[(kind, i)] = fraction
+        await self._report()
+    
+    async def _report(self, force: bool = False):
+        """按节点权重汇总整体进度，消息为各类节点的完成数"""
+        total = sum(NODE_WEIGHTS[kind] for kind, _ in self._fractions)
+        done = sum(NODE_WEIGHTS[kind] * f for (kind, _), f in self._fractions.items())
+        
+        counts: Dict[str, List[int]] = {}
+        for (kind, _), fraction in self._fractions.items():
+            if kind in NODE_LABELS:
+                count = counts.setdefault(kind, [0, 0])
+                count[0] += fraction >= 1.0
+                count[1] += 1
+        message = " · ".join(
+            f"{label} {counts[kind][0]}/{counts[kind][1]}"
+            for kind, label in NODE_LABELS.items()
+            if kind in counts
+        )
+        
+        fraction = done / total if total else 1.0
+        await self.progress.report(
+            PIPELINE_START + (self.assemble_start - PIPELINE_START) * fraction,
+            message,
+            force=force
+        )
@@ -0,0 +1,317 @@
+"""
+百炼（DashScope）限流
+所有 API 与 Worker 进程共享 Redis 中的限流状态，按端点与模型分别配置：
+令牌桶限制每秒请求数，租约槽位限制同时进行的调用数。等待者按到达顺序排队，
+只有队首可以取令牌，避免某个进程一直抢到而其他进程饿死。收到 429 时把该限流项的
+速率减半并按 Retry-After 暂停，之后随时间线性恢复
+"""
+
+import asyncio
+import time
+import uuid
+from contextlib import asynccontextmanager
+from typing import Dict, NamedTuple, Optional
+
+import httpx
+from redis import RedisError
+
+from app.config import settings
+from app.core.logger import logger
+from app.core.redis import get_redis
+
+
+KEY_PREFIX = "dashscope:limit:"
+
+# 等待者超过该时间（秒）未重试视为已退出，移出队列
+WAITER_TTL = 10
+
+# 两次尝试之间的最长等待（秒），同时保证等待者持续续期
+MAX_WAIT = 1.0
+
+# 429 后速率的下限（相对配置值）
+MIN_FACTOR = 0.1
+
+# 没有 Retry-After 时的暂停时间（秒）
+DEFAULT_RETRY_AFTER = 1.0
+
+
+# KEYS: bucket, queue, alive, slots
+# ARGV: waiter, rate, burst, concurrency, slot_ttl, waiter_ttl, recovery
+# 返回 {1, 0} 表示获取成功，{0, 毫秒} 表示建议等待的时间
+ACQUIRE_SCRIPT = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local waiter = ARGV[1]
+local rate = tonumber(ARGV[2])
+local burst = tonumber(ARGV[3])
+local concurrency = tonumber(ARGV[4])
+
+-- 清理已退出的等待者
+local dead = redis.call('ZRANGEBYSCORE', KEYS[3], '-inf', now)
+if #dead > 0 then
+    redis.call('ZREM', KEYS[3], unpack(dead))
+    redis.call('ZREM', KEYS[2], unpack(dead))
+end
+redis.call('ZADD', KEYS[3], now + tonumber(ARGV[6]), waiter)
+redis.call('ZADD', KEYS[2], 'NX', now, waiter)
+redis.call('EXPIRE', KEYS[2], 3600)
+redis.call('EXPIRE', KEYS[3], 3600)
+
+-- 只有队首可以获取
+local rank = redis.call('ZRANK', KEYS[2], waiter)
+if rank > 0 then
+    return {0, math.min(50 * rank, 1000)}
+end
+
+-- 并发槽位（清理过期租约）
+if concurrency > 0 then
+    redis.call('ZREMRANGEBYSCORE', KEYS[4], '-inf', now)
+    if redis.call('ZCARD', KEYS[4]) >= concurrency then
+        return {0, 100}
+    end
+end
+
+-- 令牌桶（factor 为 429 后的降速比例，随时间恢复）
+if rate > 0 then
+    local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts', 'factor', 'blocked_until')
+    local tokens = tonumber(state[1]) or burst
+    local ts = tonumber(state[2]) or now
+    local factor = tonumber(state[3]) or 1
+    local blocked_until = tonumber(state[4]) or 0
+    local elapsed = math.max(now - ts, 0)
+    factor = math.min(1, factor + tonumber(ARGV[7]) * elapsed)
+    tokens = math.min(burst, tokens + elapsed * rate * factor)
+    redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now, 'factor', factor)
+    redis.call('EXPIRE', KEYS[1], 3600)
+    if now < blocked_until then
+        return {0, math.ceil((blocked_until - now) * 1000)}
+    end
+    if tokens < 1 then
+        return {0, math.ceil((1 - tokens) / (rate * factor) * 1000)}
+    end
+    redis.call('HSET', KEYS[1], 'tokens', tokens - 1)
+end
+
+if concurrency > 0 then
+    redis.call('ZADD', KEYS[4], now + tonumber(ARGV[5]), waiter)
+    redis.call('EXPIRE', KEYS[4], 3600)
+end
+redis.call('ZREM', KEYS[2], waiter)
+redis.call('ZREM', KEYS[3], waiter)
+return {1, 0}
+"""
+
+# KEYS: bucket
+# ARGV: retry_after, min_factor
+PENALIZE_SCRIPT = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local factor = tonumber(redis.call('HGET', KEYS[1], 'factor')) or 1
+factor = math.max(factor / 2, tonumber(ARGV[2]))
+local blocked_until = math.max(tonumber(redis.call('HGET', KEYS[1], 'blocked_until')) or 0, now + tonumber(ARGV[1]))
+redis.call('HSET', KEYS[1], 'factor', factor, 'tokens', 0, 'ts', now, 'blocked_until', blocked_until)
+redis.call('EXPIRE', KEYS[1], 3600)
+return tostring(factor)
+"""
+
+
+class RateLimit(NamedTuple):
+    """一个限流项：每秒请求数与并发数（0 表示不限）"""
+    name: str
+    rate: float
+    concurrency: int
+
+
+def _parse_limits(raw: str) -> Dict[str, RateLimit]:
+    """解析限流配置，如 image/wanx-v1=2:2,tasks=20:0"""
+    limits = {}
+    for item in raw.split(","):
+        name, _, value = item.strip().partition("=")
+        rate, _, concurrency = value.partition(":")
+        try:
+            limits[name.strip()] = RateLimit(name.strip(), float(rate), int(concurrency or 0))
+        except ValueError:
+            if item.strip():
+                logger.warning(f"[限流] 忽略无效配置: {item}")
+    return limits
+
+
+class DashScopeRateLimiter:
+    """百炼调用限流"""
+    
+    def __init__(self):
+        self.limits = _parse_limits(settings.DASHSCOPE_RATE_LIMITS)
+        self._acquire_script = None
+        self._penalize_script = None
+        self._stats: Dict[str, float] = {
+            "acquired": 0,
+            "rate_limited": 0,
+            "wait_seconds": 0.0
+        }
+    
+    def _key(self, limit: RateLimit, part: str) -> str:
+        return f"{KEY_PREFIX}{limit.name}:{part}"
+    
+    def resolve(self, endpoint: str, model: Optional[str] = None) -> Optional[RateLimit]:
+        """查找限流项：先按 端点/模型，再按端点"""
+        if model and f"{endpoint}/{model}" in self.limits:
+            return self.limits[f"{endpoint}/{model}"]
+        return self.limits.get(endpoint)
+    
+    def _try_acquire(self, limit: RateLimit, waiter: str) -> float:
+        """尝试获取一次，成功返回 0，否则返回建议等待的秒数"""
+        if self._acquire_script is None:
+            self._acquire_script = get_redis().register_script(ACQUIRE_SCRIPT)
+        acquired, wait_ms = self._acquire_script(
+            keys=[
+                self._key(limit, "bucket"),
+                self._key(limit, "queue"),
+                self._key(limit, "alive"),
+                self._key(limit, "slots")
+            ],
+            args=[
+                waiter,
+                limit.rate,
+                max(limit.rate, 1),
+                limit.concurrency,
+                settings.DASHSCOPE_SLOT_TTL,
+                WAITER_TTL,
+                settings.DASHSCOPE_RATE_LIMIT_RECOVERY
+            ]
+        )
+        return 0.0 if int(acquired) else int(wait_ms) / 1000
+    
+    def _release(self, limit: RateLimit, waiter: str):
+        try:
+            get_redis().zrem(self._key(limit, "slots"), waiter)
+        except RedisError as e:
+            logger.warning(f"[限流] 释放并发槽位失败: {limit.name}, {e}")
+    
+    def _penalize(self, limit: RateLimit, retry_after: float):
+        """429：降速并暂停"""
+        self._stats["rate_limited"] += 1
+        try:
+            if self._penalize_script is None:
+                self._penalize_script = get_redis().register_script(PENALIZE_SCRIPT)
+            factor = self._penalize_script(
+                keys=[self._key(limit, "bucket")],
+                args=[retry_after, MIN_FACTOR]
+            )
+            logger.warning(f"[限流] {limit.name} 收到 429，速率降为 {float(factor):.0%}，暂停 {retry_after:.1f}s")
+        except RedisError as e:
+            logger.warning(f"[限流] 记录 429 失败: {limit.name}, {e}")
+    
+    @asynccontextmanager
+    async def limit(self, endpoint: str, model: Optional[str] = None):
+        """
+        在限流内执行一次调用
+        
+        排队等待令牌与并发槽位；调用中抛出 429 时降低该限流项的速率。
+        Redis 不可用时不限流
+        """
+        limit = self.resolve(endpoint, model)
+        if not settings.DASHSCOPE_RATE_LIMIT_ENABLED or limit is None:
+            yield
+            return
+        
+        waiter = uuid.uuid4().hex
+        if not await self._acquire(limit, waiter):
+            yield
+            return
+        
+        try:
+            yield
+        except httpx.HTTPStatusError as e:
+            if e.response.status_code == 429:
+                retry_after = e.response.headers.get("retry-after", "")
+                await asyncio.to_thread(
+                    self._penalize,
+                    limit,
+                    float(retry_after) if retry_after.replace(".", "", 1).isdigit() else DEFAULT_RETRY_AFTER
+                )
+            raise
+        finally:
+            if limit.concurrency > 0:
+                await asyncio.to_thread(self._release, limit, waiter)
+    
+    async def _acquire(self, limit: RateLimit, waiter: str) -> bool:
+        """
+        排队直到获取令牌与槽位
+        
+        Returns:
+            是否经过了限流（Redis 不可用时返回 False，不限流）
+        """
+        started = time.monotonic()
+        try:
+            while True:
+                wait = await asyncio.to_thread(self._try_acquire, limit, waiter)
+                if not wait:
+                    break
+                await asyncio.sleep(min(wait, MAX_WAIT))
+        except RedisError as e:
+            logger.warning(f"[限流] Redis 不可用，跳过限流: {limit.name}, {e}")
+            return False
+        except BaseException:
+            # 等待中被取消：立即离开队列，不占着队首直到过期
+            await asyncio.to_thread(self._leave, limit, waiter)
+            raise
+        
+        self._stats["acquired"] += 1
+        self._stats["wait_seconds"] += time.monotonic() - started
+        return True
+    
+    def _leave(self, limit: RateLimit, waiter: str):
+        try:
+            pipe = get_redis().pipeline()
+            pipe.zrem(self._key(limit, "queue"), waiter)
+            pipe.zrem(self._key(limit, "alive"), waiter)
+            pipe.execute()
+        except RedisError as e:
+            logger.warning(f"[限流] 离开等待队列失败: {limit.name}, {e}")
+    
+    async def run(self, endpoint: str, model: Optional[str], func, *args, **kwargs):
+        """
+        在限流内调用 func，收到 429 时重新排队，最多重试 DASHSCOPE_RATE_LIMIT_RETRIES 次
+        """
+        for attempt in range(settings.DASHSCOPE_RATE_LIMIT_RETRIES + 1):
+            try:
+                async with self.limit(endpoint, model):
+                    return await func(*args, **kwargs)
+            except httpx.HTTPStatusError as e:
+                if e.response.status_code != 429 or attempt == settings.DASHSCOPE_RATE_LIMIT_RETRIES:
+                    raise
+                logger.info(f"[限流] {endpoint} 第 {attempt + 1} 次 429，重新排队")
+    
+    def stats(self) -> dict:
+        """各限流项的当前状态（所有进程共享）与当前进程的等待统计"""
+        limits = {}
+        try:
+            redis = get_redis()
+            for limit in self.limits.values():
+                pipe = redis.pipeline()
+                pipe.hmget(self._key(limit, "bucket"), "tokens", "factor")
+                pipe.zcard(self._key(limit, "queue"))
+                pipe.zcount(self._key(limit, "slots"), time.time(), "+inf")
+                (tokens, factor), waiting, active = pipe.execute()
+                limits[limit.name] = {
+                    "rate": limit.rate,
+                    "concurrency": limit.concurrency,
+                    "factor": round(float(factor), 3) if factor else 1.0,
+                    "tokens": round(float(tokens), 2) if tokens else None,
+                    "waiting": waiting,
+                    "active": active
+                }
+        except RedisError as e:
+            logger.warning(f"[限流] 读取状态失败: {e}")
+        
+        acquired = self._stats["acquired"]
+        return {
+            "limits": limits,
+            "acquired": acquired,
+            "rate_limited": self._stats["rate_limited"],
+            "avg_wait_seconds": round(self._stats["wait_seconds"] / acquired, 3) if acquired else 0.0
+        }
+
+
+# 单例
+dashscope_limiter = DashScopeRateLimiter()
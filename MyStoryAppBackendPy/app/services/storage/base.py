@@ -24,7 +24,7 @@ class StorageService(ABC):
             local_path: 本地文件路径
             filename: 目标文件名
             content_type: 文件类型
-            
+        
         Returns:
             文件访问 URL
         """
@@ -38,7 +38,7 @@ class StorageService(ABC):
         Args:
             remote_url: 远程文件 URL
             local_path: 本地保存路径
-            
+        
         Returns:
             本地文件路径
         """
@@ -51,7 +51,7 @@ class StorageService(ABC):
         
         Args:
             file_url: 文件 URL
-            
+        
         Returns:
             是否成功
         """
@@ -65,7 +65,7 @@ class StorageService(ABC):
         Args:
             filename: 文件名
             expire: URL 过期时间（秒）
-            
+        
         Returns:
             带签名的访问 URL
         """
@@ -78,8 +78,23 @@ class StorageService(ABC):
         
         Args:
             filename: 文件名
-            
+        
         Returns:
             公共访问 URL
         """
         pass
+    
+    def is_stored(self, url: str) -> bool:
+        """
+        URL 是否指向本存储中的文件
+        
+        是的话应通过 download_file 读取：返回的公共 URL 不一定能从 Worker 访问
+        （例如本地存储的 http://localhost:8000/uploads/... 在容器中）
+        
+        Args:
+            url: 文件 URL
+        
+        Returns:
+            是否为本存储中的文件
+        """
+        return False
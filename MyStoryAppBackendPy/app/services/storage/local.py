@@ -2,6 +2,7 @@
 本地存储服务实现
 """
 
+import asyncio
 import shutil
 from pathlib import Path
 from typing import Optional
@@ -78,7 +79,7 @@ class LocalStorageService(StorageService):
         
         dest = Path(local_path)
         dest.parent.mkdir(parents=True, exist_ok=True)
-        shutil.copy2(source, dest)
+        await asyncio.to_thread(shutil.copy2, source, dest)
         
         return str(dest)
     
@@ -114,6 +115,12 @@ class LocalStorageService(StorageService):
         """
         return self.get_public_url(filename)
     
+    def is_stored(self, url: str) -> bool:
+        """
+        本地存储：上传目录或输出目录的 URL
+        """
+        return url.startswith((f"{self.base_url}/uploads/", f"{self.base_url}/output/"))
+    
     def get_public_url(self, filename: str) -> str:
         """
         获取公共访问 URL
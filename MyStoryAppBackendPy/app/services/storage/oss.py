@@ -177,6 +177,14 @@ class OSSStorageService(StorageService):
             # 使用 OSS 默认域名
             return f"https://{self.bucket_name}.{self.endpoint}/{key}"
     
+    def is_stored(self, url: str) -> bool:
+        """
+        OSS：自定义域名或 Bucket 域名下的 URL
+        """
+        if self.custom_domain and url.startswith(f"https://{self.custom_domain}/"):
+            return True
+        return url.startswith(f"https://{self.bucket_name}.{self.endpoint}/")
+    
     def _extract_key_from_url(self, url: str) -> str:
         """
         从 URL 中提取 OSS key
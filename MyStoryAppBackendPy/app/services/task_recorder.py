@@ -0,0 +1,147 @@
+"""
+视频任务持久化
+Worker 与 API 进程中的任务状态变更先在内存中按 task_id 合并，由后台线程定期批量写入 video_tasks 表：
+同一任务两次刷新之间的多次进度更新只产生一条 UPDATE，同一批次的任务用一次 executemany 提交；
+完成/失败/取消等终止状态会立即唤醒刷新
+"""
+
+import os
+import threading
+from datetime import datetime
+from typing import Dict, Optional
+
+from sqlalchemy import bindparam, create_engine, update
+from sqlalchemy.engine import Engine, make_url
+
+from app.config import settings
+from app.core.logger import logger
+from app.db.material import VideoTaskDB
+
+
+# 立即刷新的状态
+FLUSH_NOW_STATUSES = {"completed", "failed", "cancelled"}
+
+
+def _sync_database_url() -> str:
+    """Worker 线程使用同步驱动（psycopg2 / sqlite）"""
+    url = make_url(settings.DATABASE_URL)
+    backend = url.get_backend_name()
+    driver = "postgresql+psycopg2" if backend == "postgresql" else backend
+    return url.set(drivername=driver).render_as_string(hide_password=False)
+
+
+class TaskRecorder:
+    """任务状态批量写入器（每个 Worker / API 进程一个后台线程）"""
+    
+    def __init__(self, interval: float = settings.TASK_PERSIST_INTERVAL):
+        self.interval = interval
+        
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._pending: Dict[str, dict] = {}
+        self._thread: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+        self._stopped = False
+        self._engine: Optional[Engine] = None
+    
+    def record(self, task_id: str, fields: dict):
+        """
+        记录一次状态变更（任务状态存储的监听器）
+        
+        只做内存合并，不访问数据库
+        """
+        values = self._to_columns(fields)
+        if not values:
+            return
+        
+        with self._lock:
+            self._pending.setdefault(task_id, {}).update(values)
+            self._ensure_thread()
+        
+        if values.get("status") in FLUSH_NOW_STATUSES:
+            self._wake.set()
+    
+    def _to_columns(self, fields: dict) -> dict:
+        """状态字段转换为 video_tasks 列"""
+        values = {}
+        if "status" in fields:
+            values["status"] = fields["status"]
+            if fields["status"] == "completed":
+                values["completed_at"] = datetime.utcnow()
+        if "progress" in fields:
+            values["progress"] = int(round(float(fields["progress"]) * 100))
+        if "message" in fields:
+            values["message"] = str(fields["message"])[:500]
+        if "error" in fields:
+            values["error"] = str(fields["error"])
+        if "output_url" in fields:
+            values["output_url"] = fields["output_url"]
+        return values
+    
+    def _ensure_thread(self):
+        """按需启动刷新线程；prefork 子进程中不会继承父进程的线程，需要重新启动"""
+        if self._pid == os.getpid() and self._thread and self._thread.is_alive():
+            return
+        self._pid = os.getpid()
+        self._stopped = False
+        self._engine = None
+        self._thread = threading.Thread(target=self._run, name="task-recorder", daemon=True)
+        self._thread.start()
+    
+    def _run(self):
+        while not self._stopped:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            self.flush()
+    
+    def _get_engine(self) -> Engine:
+        if self._engine is None:
+            self._engine = create_engine(_sync_database_url(), pool_size=1, pool_pre_ping=True)
+        return self._engine
+    
+    def flush(self):
+        """把合并后的变更批量写入数据库，失败时保留待下次重试"""
+        with self._lock:
+            batch, self._pending = self._pending, {}
+        if not batch:
+            return
+        
+        # 按更新的列分组，每组一次 executemany
+        groups: Dict[tuple, list] = {}
+        for task_id, values in batch.items():
+            columns = tuple(sorted(values))
+            groups.setdefault(columns, []).append(
+                {"_task_id": task_id, **{f"_{column}": value for column, value in values.items()}}
+            )
+        
+        table = VideoTaskDB.__table__
+        try:
+            with self._get_engine().begin() as conn:
+                for columns, rows in groups.items():
+                    stmt = (
+                        update(table)
+                        .where(table.c.task_id == bindparam("_task_id"))
+                        .values({column: bindparam(f"_{column}") for column in columns})
+                    )
+                    conn.execute(stmt, rows)
+        except Exception as e:
+            logger.warning(f"[任务记录] 写入数据库失败，稍后重试: {len(batch)} 个任务, {e}")
+            with self._lock:
+                for task_id, values in batch.items():
+                    # 期间产生的新变更优先
+                    self._pending[task_id] = {**values, **self._pending.get(task_id, {})}
+            return
+        
+        logger.debug(f"[任务记录] 已写入 {len(batch)} 个任务状态")
+    
+    def close(self):
+        """停止刷新线程并写入剩余变更（Worker 进程退出或应用关闭时调用）"""
+        self._stopped = True
+        self._wake.set()
+        if self._thread and self._pid == os.getpid():
+            self._thread.join(timeout=self.interval + 5)
+        self.flush()
+
+
+# 单例
+task_recorder = TaskRecorder()
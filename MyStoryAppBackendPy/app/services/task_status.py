@@ -0,0 +1,199 @@
+"""
+视频任务状态存储
+Worker 每次更新进度时写入 Redis hash video:status:{task_id}（按我们自己的 task_id，
+而不是 Celery 任务 ID），状态接口一次 HGETALL 即可读取；
+同时把变更发布到频道 video:events:{task_id}，供 SSE 接口推送给客户端
+"""
+
+import asyncio
+import json
+import time
+from typing import AsyncIterator, Callable, Dict, List, Optional, Set
+
+from redis import RedisError
+
+from app.config import settings
+from app.core.logger import logger
+from app.core.redis import get_async_redis, get_redis
+
+
+STATUS_KEY_PREFIX = "video:status:"
+EVENT_CHANNEL_PREFIX = "video:events:"
+
+# 终止状态：到达后不会再有进度事件
+TERMINAL_STATUSES = {"completed", "failed", "cancelled"}
+
+
+def _decode(record: Dict[str, str]) -> Optional[dict]:
+    """把 hash 中的字符串还原为接口返回的类型"""
+    if not record:
+        return None
+    data = dict(record)
+    for field in ("progress", "created_at", "updated_at", "started_at", "estimated_time"):
+        if field in data:
+            data[field] = float(data[field])
+    for field in ("queue_position", "estimated_wait"):
+        if field in data:
+            data[field] = int(float(data[field]))
+    return data
+
+
+class TaskStatusStore:
+    """
+    任务状态存储
+    
+    只保存标量字段（status、progress、message、output_url、error 等），
+    阶段耗时等大字段仍然只放在 Celery 结果中
+    """
+    
+    def __init__(self):
+        self._listeners: List[Callable[[str, dict], None]] = []
+    
+    def add_listener(self, listener: Callable[[str, dict], None]):
+        """注册状态变更监听器，参数为 (task_id, 变更字段)"""
+        self._listeners.append(listener)
+    
+    def _key(self, task_id: str) -> str:
+        return f"{STATUS_KEY_PREFIX}{task_id}"
+    
+    def _channel(self, task_id: str) -> str:
+        return f"{EVENT_CHANNEL_PREFIX}{task_id}"
+    
+    def create(self, task_id: str, **fields):
+        """创建任务记录（状态为 pending）"""
+        self.update(task_id, "pending", progress=0.0, message="排队中...", created_at=time.time(), **fields)
+    
+    def update(self, task_id: str, status: Optional[str] = None, **fields):
+        """
+        更新任务记录并发布变更事件
+        
+        Redis 不可用时只记录警告，不影响任务本身
+        """
+        if status is not None:
+            fields["status"] = status
+        mapping = {
+            name: value for name, value in fields.items()
+            if isinstance(value, (str, int, float)) and not isinstance(value, bool)
+        }
+        mapping["updated_at"] = time.time()
+        
+        try:
+            pipe = get_redis().pipeline()
+            pipe.hset(self._key(task_id), mapping=mapping)
+            pipe.expire(self._key(task_id), settings.TASK_STATUS_TTL)
+            pipe.publish(self._channel(task_id), json.dumps({"task_id": task_id, **mapping}, ensure_ascii=False))
+            pipe.execute()
+        except RedisError as e:
+            logger.warning(f"[任务状态] 更新失败: {task_id}, {e}")
+        
+        for listener in self._listeners:
+            try:
+                listener(task_id, mapping)
+            except Exception as e:
+                logger.warning(f"[任务状态] 监听器执行失败: {task_id}, {e}")
+    
+    def get(self, task_id: str) -> Optional[dict]:
+        """读取任务记录，不存在时返回 None"""
+        return _decode(get_redis().hgetall(self._key(task_id)))
+    
+    async def aget(self, task_id: str) -> Optional[dict]:
+        """读取任务记录（API 进程使用，不阻塞事件循环）"""
+        return _decode(await get_async_redis().hgetall(self._key(task_id)))
+
+
+class EventBroadcaster:
+    """
+    任务事件分发
+    
+    每个 API 进程只保持一条 Redis 订阅连接（PSUBSCRIBE video:events:*），
+    收到事件后按 task_id 分发给本进程内的 SSE 连接，客户端数量不影响 Redis 连接数
+    """
+    
+    def __init__(self, queue_size: int = 100):
+        self.queue_size = queue_size
+        self._subscribers: Dict[str, Set[asyncio.Queue]] = {}
+        self._reader: Optional[asyncio.Task] = None
+    
+    async def subscribe(self, task_id: str) -> asyncio.Queue:
+        """订阅一个任务的事件"""
+        if self._reader is None or self._reader.done():
+            self._reader = asyncio.create_task(self._read_loop())
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        self._subscribers.setdefault(task_id, set()).add(queue)
+        return queue
+    
+    def unsubscribe(self, task_id: str, queue: asyncio.Queue):
+        """取消订阅"""
+        queues = self._subscribers.get(task_id)
+        if queues is None:
+            return
+        queues.discard(queue)
+        if not queues:
+            del self._subscribers[task_id]
+    
+    async def close(self):
+        """关闭订阅连接（应用关闭时调用）"""
+        if self._reader:
+            self._reader.cancel()
+            await asyncio.gather(self._reader, return_exceptions=True)
+            self._reader = None
+    
+    async def _read_loop(self):
+        """读取 Redis 订阅消息，连接断开后自动重连"""
+        while True:
+            pubsub = get_async_redis().pubsub()
+            try:
+                await pubsub.psubscribe(f"{EVENT_CHANNEL_PREFIX}*")
+                async for message in pubsub.listen():
+                    if message["type"] == "pmessage":
+                        self._dispatch(message["channel"][len(EVENT_CHANNEL_PREFIX):], message["data"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"[任务事件] 订阅连接异常，1 秒后重连: {e}")
+                await asyncio.sleep(1)
+            finally:
+                await pubsub.aclose()
+    
+    def _dispatch(self, task_id: str, data: str):
+        """分发事件；订阅者处理不及时时丢弃最旧的事件（进度以最新为准）"""
+        for queue in self._subscribers.get(task_id, ()):
+            if queue.full():
+                queue.get_nowait()
+            queue.put_nowait(data)
+
+
+async def stream_events(task_id: str) -> AsyncIterator[str]:
+    """
+    生成 SSE 事件流
+    
+    先订阅再读取当前状态，避免两者之间的事件丢失；
+    任务到达终止状态后结束，空闲时定期发送注释行保持连接
+    """
+    queue = await event_broadcaster.subscribe(task_id)
+    try:
+        record = await task_status_store.aget(task_id)
+        if record is None:
+            yield "event: error\ndata: {\"detail\": \"任务不存在\"}\n\n"
+            return
+        snapshot = {"task_id": task_id, **record}
+        yield f"event: status\ndata: {json.dumps(snapshot, ensure_ascii=False)}\n\n"
+        if record.get("status") in TERMINAL_STATUSES:
+            return
+        
+        while True:
+            try:
+                data = await asyncio.wait_for(queue.get(), settings.SSE_HEARTBEAT_INTERVAL)
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"
+                continue
+            yield f"event: status\ndata: {data}\n\n"
+            if json.loads(data).get("status") in TERMINAL_STATUSES:
+                return
+    finally:
+        event_broadcaster.unsubscribe(task_id, queue)
+
+
+# 单例
+task_status_store = TaskStatusStore()
+event_broadcaster = EventBroadcaster()
@@ -0,0 +1,176 @@
+"""
+配音缓存
+相同的文本（规范化后）、音色、语速与模型只合成一次：音频按内容寻址缓存在本地磁盘
+（LRU 淘汰），使用共享存储（OSS）时同时上传，其他机器本地未命中时从存储下载，
+都不需要再调用 DashScope。
+
+返回给任务的音频硬链接（跨文件系统时复制）到输出目录 /output/tts_{键}.mp3，
+相同配音的任务共用这个文件；缓存项被淘汰后已交给任务的 URL 仍然可用。
+Redis 与磁盘操作都在线程池中执行，不阻塞事件循环
+"""
+
+import asyncio
+import re
+import unicodedata
+import uuid
+from pathlib import Path
+from typing import Optional
+
+from redis import RedisError
+
+from app.config import settings
+from app.core.logger import logger
+from app.core.redis import get_redis
+from app.services.disk_cache import DiskCache, link_or_copy
+from app.services.storage import get_storage
+
+
+# 缓存格式版本，修改合成参数时递增以使旧缓存失效
+TTS_CACHE_VERSION = 1
+
+STORAGE_KEY_PREFIX = "tts:cache:"
+STATS_KEY = "tts:cache:stats"
+
+tts_disk_cache = DiskCache(
+    "tts",
+    settings.TTS_CACHE_DIR,
+    settings.TTS_CACHE_MAX_BYTES
+)
+
+
+def normalize_text(text: str) -> str:
+    """规范化文本：全角/半角统一、合并空白，不影响发音的差异不产生新的缓存项"""
+    text = unicodedata.normalize("NFKC", text)
+    return re.sub(r"\s+", " ", text).strip()
+
+
+class TTSCache:
+    """配音缓存"""
+    
+    def make_key(self, text: str, voice: str, speed: float, model: str) -> str:
+        """缓存键：规范化文本 + 音色 + 语速 + 模型"""
+        return DiskCache.make_key(TTS_CACHE_VERSION, normalize_text(text), voice, round(speed, 2), model)
+    
+    def _output_name(self, key: str) -> str:
+        return f"tts_{key[:32]}.mp3"
+    
+    def _output_path(self, key: str) -> Path:
+        path = Path(settings.OUTPUT_DIR) / self._output_name(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        return path
+    
+    def _shared(self) -> bool:
+        """是否使用共享存储（本地存储时磁盘缓存即唯一副本）"""
+        return settings.STORAGE_TYPE.lower() != "local"
+    
+    def _count(self, field: str):
+        """全局命中统计"""
+        try:
+            get_redis().hincrby(STATS_KEY, field, 1)
+        except RedisError as e:
+            logger.warning(f"[配音缓存] 更新统计失败: {e}")
+    
+    async def get(self, key: str) -> Optional[str]:
+        """
+        查找缓存
+        
+        Returns:
+            命中时返回输出目录中的音频 URL（/output/tts_{键}.mp3），未命中返回 None
+        """
+        if not settings.TTS_CACHE_ENABLED:
+            return None
+        
+        output_path = self._output_path(key)
+        if await asyncio.to_thread(tts_disk_cache.link, key, ".mp3", output_path):
+            field = "hits"
+        elif self._shared() and await self._fetch_from_storage(key, output_path):
+            field = "storage_hits"
+        else:
+            await asyncio.to_thread(self._count, "misses")
+            return None
+        
+        await asyncio.to_thread(self._count, field)
+        logger.info(f"[配音缓存] 命中: {key[:12]}")
+        return self._url(output_path)
+    
+    async def put(self, key: str, audio_data: bytes) -> str:
+        """
+        保存合成结果
+        
+        Returns:
+            输出目录中的音频 URL
+        """
+        if not settings.TTS_CACHE_ENABLED:
+            output_path = self._output_path(uuid.uuid4().hex)
+            await asyncio.to_thread(output_path.write_bytes, audio_data)
+            return self._url(output_path)
+        
+        output_path = self._output_path(key)
+        temp_path = tts_disk_cache.temp_path(".mp3")
+        await asyncio.to_thread(temp_path.write_bytes, audio_data)
+        path = await asyncio.to_thread(self._commit, temp_path, key, output_path)
+        
+        if self._shared():
+            await self._upload_to_storage(path, key)
+        return self._url(output_path)
+    
+    def _commit(self, temp_path: Path, key: str, output_path: Path) -> Path:
+        """先链接到输出目录再移入缓存（移入后可能立即被淘汰）"""
+        link_or_copy(temp_path, output_path)
+        return tts_disk_cache.commit(temp_path, key, ".mp3")
+    
+    def local_path(self, url: str) -> str:
+        """get / put 返回的音频 URL 对应的本地路径"""
+        return str(Path(settings.OUTPUT_DIR) / url[len("/output/"):])
+    
+    def _url(self, path: Path) -> str:
+        return f"/output/{path.name}"
+    
+    async def _upload_to_storage(self, path: Path, key: str):
+        try:
+            url = await get_storage().upload_file(str(path), self._output_name(key), "audio/mpeg")
+            await asyncio.to_thread(
+                get_redis().set, STORAGE_KEY_PREFIX + key, url, ex=settings.TTS_CACHE_STORAGE_TTL
+            )
+        except Exception as e:
+            logger.warning(f"[配音缓存] 上传到存储失败: {key[:12]}, {e}")
+    
+    async def _fetch_from_storage(self, key: str, output_path: Path) -> bool:
+        """从共享存储下载到本地缓存和输出目录"""
+        try:
+            url = await asyncio.to_thread(get_redis().get, STORAGE_KEY_PREFIX + key)
+            if not url:
+                return False
+            temp_path = tts_disk_cache.temp_path(".mp3")
+            try:
+                await get_storage().download_file(url, str(temp_path))
+            except BaseException:
+                temp_path.unlink(missing_ok=True)
+                raise
+            await asyncio.to_thread(self._commit, temp_path, key, output_path)
+            return True
+        except Exception as e:
+            logger.warning(f"[配音缓存] 从存储下载失败: {key[:12]}, {e}")
+            return False
+    
+    def stats(self) -> dict:
+        """命中统计：local 为当前进程的磁盘缓存，cluster 为所有进程累计"""
+        try:
+            cluster = {field: int(value) for field, value in get_redis().hgetall(STATS_KEY).items()}
+        except RedisError as e:
+            logger.warning(f"[配音缓存] 读取统计失败: {e}")
+            cluster = {}
+        
+        lookups = sum(cluster.get(field, 0) for field in ("hits", "storage_hits", "misses"))
+        hits = cluster.get("hits", 0) + cluster.get("storage_hits", 0)
+        return {
+            "local": tts_disk_cache.stats(),
+            "cluster": {
+                **cluster,
+                "hit_rate": hits / lookups if lookups else 0.0
+            }
+        }
+
+
+# 单例
+tts_cache = TTSCache()
@@ -3,14 +3,23 @@
 使用 FFmpeg 合成视频
 """
 
+import asyncio
 import ffmpeg
+import re
+import time
 import uuid
+from functools import partial
 from pathlib import Path
-from typing import List, Callable, Optional
+from typing import List, Callable, Optional, Awaitable, Union
 
 from app.config import settings
 from app.core.logger import logger
-from app.models.schemas import Slide, VideoConfigRequest
+from app.models.schemas import Slide, VideoConfigRequest, VideoResolution
+from app.services.ffmpeg_runner import run_ffmpeg, get_render_slots
+from app.services.disk_cache import DiskCache, hash_file, link_or_copy
+from app.services.image_normalizer import image_normalizer
+from app.services.checkpoint import JobCheckpoint
+from app.services.storage import get_storage
 
 
 # 分辨率映射
@@ -22,6 +31,91 @@ RESOLUTION_MAP = {
     "4k": (3840, 2160)
 }
 
+# 片段编码参数版本，修改编码参数时递增以使旧缓存失效
+SEGMENT_ENCODER_VERSION = 1
+
+# 淡入淡出时长（秒）
+FADE_DURATION = 0.5
+
+# still 编码模式下的关键帧间隔（秒）
+STILL_GOP_SECONDS = 10
+
+segment_cache = DiskCache(
+    "segments",
+    settings.SEGMENT_CACHE_DIR,
+    settings.SEGMENT_CACHE_MAX_BYTES
+)
+
+
+def escape_filter_value(value: str) -> str:
+    """
+    转义写入滤镜图（-vf / -filter_complex）的滤镜选项值
+    
+    ffmpeg 解析两层：先按滤镜图规则解析 \\ ' [ ] , ;，再按滤镜选项规则解析 \\ ' :，
+    所以先转义选项层，再转义滤镜图层（见 ffmpeg-filters 文档 "Notes on filtergraph escaping"）
+    """
+    value = re.sub(r"([\\':])", r"\\\1", value)
+    return re.sub(r"([\\'\[\],;])", r"\\\1", value)
+
+
+def make_preview_config(config: VideoConfigRequest) -> VideoConfigRequest:
+    """生成草稿预览配置：低分辨率、低帧率，跳过 AI 图片扩展"""
+    resolution = settings.PREVIEW_RESOLUTION
+    if resolution not in RESOLUTION_MAP:
+        logger.warning(f"[视频] 无效的预览分辨率: {resolution}, 使用 480p")
+        resolution = VideoResolution.SD.value
+    
+    return config.model_copy(update={
+        "resolution": VideoResolution(resolution),
+        "frame_rate": min(config.frame_rate, settings.PREVIEW_FRAME_RATE),
+        "ai_image_expansion": False
+    })
+
+
+class ProgressTracker:
+    """
+    合成进度汇总
+    
+    把各个 ffmpeg 的细粒度进度映射到整体进度区间，并限制回调频率，
+    避免每个进度事件都写一次 Redis
+    """
+    
+    def __init__(
+        self,
+        callback: Optional[Callable[[float, str], Awaitable[None]]] = None,
+        min_interval: float = settings.PROGRESS_MIN_INTERVAL
+    ):
+        self.callback = callback
+        self.min_interval = min_interval
+        self._last_time = float("-inf")
+        self._last_progress = 0.0
+        self._last_message = ""
+    
+    async def report(self, progress: float, message: str, force: bool = False):
+        """上报进度，非强制上报时按 min_interval 限流"""
+        if not self.callback:
+            return
+        
+        now = time.monotonic()
+        if not force and now - self._last_time < self.min_interval:
+            return
+        
+        # 并发片段的进度可能乱序到达，保证整体进度不回退
+        progress = max(progress, self._last_progress)
+        if not force and (progress, message) == (self._last_progress, self._last_message):
+            return
+        
+        self._last_time = now
+        self._last_progress = progress
+        self._last_message = message
+        await self.callback(progress, message)
+    
+    def stage(self, start: float, end: float, message: str) -> Callable[[float], Awaitable[None]]:
+        """生成把 0-1 阶段进度映射到 [start, end] 的回调"""
+        async def on_progress(fraction: float):
+            await self.report(start + (end - start) * fraction, message)
+        return on_progress
+
 
 class VideoService:
     """视频合成服务"""
@@ -31,7 +125,9 @@ class VideoService:
         slides: List[Slide],
         config: VideoConfigRequest,
         task_id: str,
-        progress_callback: Optional[Callable[[float, str], None]] = None
+        progress_callback: Optional[Callable[[float, str], None]] = None,
+        draft: bool = False,
+        checkpoint: Optional[JobCheckpoint] = None
     ) -> str:
         """
         合成视频
@@ -41,44 +137,98 @@ class VideoService:
             config: 视频配置
             task_id: 任务ID
             progress_callback: 进度回调函数
-            
+            draft: 是否为草稿预览（使用最快的编码预设，单独输出 preview_ 文件）
+            checkpoint: 任务检查点，已编码的片段在重试时直接复用
+        
         Returns:
             输出视频的 URL
         """
-        logger.info(f"[视频] 开始合成任务: {task_id}")
+        logger.info(f"[视频] 开始合成任务: {task_id}, 草稿: {draft}")
         
         width, height = RESOLUTION_MAP.get(config.resolution.value, (1280, 720))
-        output_filename = f"video_{task_id}.mp4"
-        output_path = Path(settings.OUTPUT_DIR) / output_filename
-        output_path.parent.mkdir(parents=True, exist_ok=True)
+        if draft:
+            # 预览与正式渲染可能同时进行，临时文件使用独立前缀
+            output_filename = f"preview_{task_id}.mp4"
+            task_id = f"{task_id}_preview"
+        else:
+            output_filename = f"video_{task_id}.mp4"
         
-        # 步骤1: 创建每个幻灯片的视频片段
-        if progress_callback:
-            await progress_callback(0.1, "准备素材...")
+        progress = ProgressTracker(progress_callback)
+        await progress.report(0.1, "准备素材...", force=True)
         
-        slide_videos = []
-        for i, slide in enumerate(slides):
-            slide_video = await self._create_slide_video(
-                slide, width, height, config, i, task_id
+        try:
+            if settings.VIDEO_RENDER_ENGINE == "filtergraph":
+                # 单次编码：所有幻灯片在一个 filter_complex 中完成，不产生中间片段
+                return await self.assemble_video(
+                    slides, config, task_id, output_filename, progress,
+                    start=0.1, draft=draft
+                )
+            
+            # 步骤1: 创建每个幻灯片的视频片段
+            slide_videos = await self._render_slides(
+                slides, width, height, config, task_id, progress, draft, checkpoint
             )
-            slide_videos.append(slide_video)
             
-            progress = 0.1 + (0.4 * (i + 1) / len(slides))
-            if progress_callback:
-                await progress_callback(progress, f"处理幻灯片 {i+1}/{len(slides)}...")
+            # 步骤2: 合并所有片段并添加背景音乐
+            return await self.assemble_video(
+                slides, config, task_id, output_filename, progress,
+                slide_videos=slide_videos, start=0.5
+            )
+        finally:
+            # 预处理后的图片（渲染失败或重试时重新生成）
+            await self._cleanup_temp_files(list(Path(settings.OUTPUT_DIR).glob(f"temp_{task_id}_norm_*")))
+    
+    async def assemble_video(
+        self,
+        slides: List[Slide],
+        config: VideoConfigRequest,
+        task_id: str,
+        output_filename: str,
+        progress: ProgressTracker,
+        slide_videos: Optional[List[Path]] = None,
+        image_paths: Optional[List[str]] = None,
+        start: float = 0.5,
+        draft: bool = False
+    ) -> str:
+        """
+        生成最终视频
         
-        # 步骤2: 合并所有片段
-        if progress_callback:
-            await progress_callback(0.5, "合并视频片段...")
+        传入 slide_videos 时合并已编码的片段，否则单次编码所有幻灯片；
+        之后添加背景音乐、移动到输出目录并清理临时文件。
+        进度在 [start, 1.0] 区间内上报
         
-        merged_path = await self._merge_videos(slide_videos, task_id)
+        Returns:
+            输出视频的 URL
+        """
+        output_path = Path(settings.OUTPUT_DIR) / output_filename
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+        total_duration = sum(slide.duration for slide in slides)
+        
+        with_bgm = bool(config.background_music and config.background_music != "none")
+        merge_end = start + (1.0 - start) * (0.4 if with_bgm else 0.9)
+        bgm_end = start + (1.0 - start) * 0.9
         
-        # 步骤3: 添加背景音乐（可选）
-        if config.background_music and config.background_music != "none":
-            if progress_callback:
-                await progress_callback(0.7, "添加背景音乐...")
+        if slide_videos is None:
+            width, height = RESOLUTION_MAP.get(config.resolution.value, (1280, 720))
+            merged_path = await self._render_single_pass(
+                slides, width, height, config, task_id, progress, draft,
+                image_paths=image_paths, span=(start, merge_end)
+            )
+            slide_videos = []
+        else:
+            await progress.report(start, "合并视频片段...", force=True)
+            merged_path = await self._merge_videos(
+                slide_videos, task_id,
+                duration=total_duration,
+                on_progress=progress.stage(start, merge_end, "合并视频片段...")
+            )
+        
+        # 添加背景音乐（可选）
+        if with_bgm:
+            await progress.report(merge_end, "添加背景音乐...", force=True)
             final_path = await self._add_background_music(
-                merged_path, config.background_music, task_id
+                merged_path, config.background_music, task_id,
+                on_progress=progress.stage(merge_end, bgm_end, "添加背景音乐...")
             )
         else:
             final_path = merged_path
@@ -90,66 +240,313 @@ class VideoService:
         # 清理临时文件
         await self._cleanup_temp_files(slide_videos)
         
-        if progress_callback:
-            await progress_callback(1.0, "完成！")
+        await progress.report(1.0, "完成！", force=True)
         
-        logger.info(f"[视频] 合成完成: {output_path}")
+        logger.info(f"[视频] 合成完成: {output_path}, 片段缓存: {segment_cache.stats()}")
         return f"/output/{output_filename}"
     
-    async def _create_slide_video(
+    async def _render_slides(
+        self,
+        slides: List[Slide],
+        width: int,
+        height: int,
+        config: VideoConfigRequest,
+        task_id: str,
+        progress: ProgressTracker,
+        draft: bool = False,
+        checkpoint: Optional[JobCheckpoint] = None
+    ) -> List[Path]:
+        """
+        并发渲染所有幻灯片片段
+        
+        同时运行的 ffmpeg 数量受 get_render_slots() 限制，
+        返回的片段顺序与 slides 一致
+        """
+        slots = min(get_render_slots(), len(slides))
+        semaphore = asyncio.Semaphore(slots)
+        completed = 0
+        
+        # 按时长加权汇总各片段的编码进度
+        fractions = [0.0] * len(slides)
+        total_duration = sum(slide.duration for slide in slides)
+        
+        logger.info(f"[视频] 并发渲染 {len(slides)} 个片段, 并发数: {slots}")
+        
+        async def on_slide_progress(i: int, fraction: float, force: bool = False):
+            fractions[i] = fraction
+            done = sum(f * s.duration for f, s in zip(fractions, slides)) / total_duration
+            await progress.report(
+                0.1 + 0.4 * done,
+                f"处理幻灯片 {completed}/{len(slides)}...",
+                force=force
+            )
+        
+        async def render(i: int, slide: Slide) -> Path:
+            nonlocal completed
+            
+            # 上次尝试已编码完成的片段直接复用
+            segment_path = checkpoint.get(JobCheckpoint.SEGMENT, i) if checkpoint else None
+            if segment_path and Path(segment_path).exists():
+                slide_video = Path(segment_path)
+            else:
+                async with semaphore:
+                    slide_video = await self.create_slide_video(
+                        slide, width, height, config, i, task_id,
+                        on_progress=partial(on_slide_progress, i),
+                        draft=draft
+                    )
+                if checkpoint:
+                    checkpoint.save(JobCheckpoint.SEGMENT, i, str(slide_video))
+            
+            completed += 1
+            await on_slide_progress(i, 1.0, force=completed == len(slides))
+            return slide_video
+        
+        tasks = [asyncio.ensure_future(render(i, slide)) for i, slide in enumerate(slides)]
+        try:
+            return await asyncio.gather(*tasks)
+        except BaseException:
+            # 任一片段失败时取消其余渲染
+            for t in tasks:
+                t.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+    
+    async def create_slide_video(
         self,
         slide: Slide,
         width: int,
         height: int,
         config: VideoConfigRequest,
         index: int,
-        task_id: str
+        task_id: str,
+        on_progress: Optional[Callable[[float], Awaitable[None]]] = None,
+        draft: bool = False,
+        image_path: Optional[str] = None
     ) -> Path:
-        """创建单个幻灯片视频"""
-        image_path = slide.expanded_image_url or slide.image_url
-        
-        # 如果是网络图片，先下载
-        if image_path.startswith("http"):
-            image_path = await self._download_image(image_path, task_id, index)
+        """创建单个幻灯片视频（image_path 为空时自动下载并预处理图片）"""
+        if image_path is None:
+            image_path = await self._resolve_image(slide, task_id, index, width, height)
         
         output_path = Path(settings.OUTPUT_DIR) / f"temp_{task_id}_slide_{index}.mp4"
+        vf_filter = self._build_slide_filter(slide, width, height, config)
         
-        # 构建字幕滤镜
-        subtitle_filter = ""
-        if config.subtitle_enabled and slide.caption:
-            y_position = self._get_subtitle_y_position(config.subtitle_position, height)
-            # 转义特殊字符
-            safe_caption = slide.caption.replace("'", "\\'")
-            subtitle_filter = f",drawtext=text='{safe_caption}':fontcolor=white:fontsize=48:x=(w-text_w)/2:y={y_position}:box=1:boxcolor=black@0.5:boxborderw=10"
+        # 查找片段缓存
+        # 滤镜链已包含分辨率、帧率、字幕文字/位置和淡入淡出参数
+        cache_key = None
+        if settings.SEGMENT_CACHE_ENABLED:
+            image_hash = await asyncio.to_thread(hash_file, image_path)
+            cache_key = DiskCache.make_key(
+                SEGMENT_ENCODER_VERSION, image_hash, slide.duration, vf_filter,
+                self._encoder_options(config, draft)
+            )
+            # 查找后被其他进程淘汰时按未命中重新编码
+            if await asyncio.to_thread(segment_cache.link, cache_key, ".mp4", output_path):
+                logger.info(f"[视频] 片段缓存命中: 幻灯片 {index}")
+                return output_path
+        
+        encode_path = segment_cache.temp_path(".mp4") if cache_key else output_path
         
         # 使用 FFmpeg 生成视频
         try:
-            vf_filter = (
-                f"fps={config.frame_rate},"
-                f"scale={width}:{height}:force_original_aspect_ratio=decrease,"
-                f"pad={width}:{height}:(ow-iw)/2:(oh-ih)/2,"
-                f"fade=t=in:st=0:d=0.5,"
-                f"fade=t=out:st={slide.duration-0.5}:d=0.5"
-            )
-            
-            (
+            cmd = (
                 ffmpeg
                 .input(image_path, loop=1, t=slide.duration)
                 .output(
-                    str(output_path),
-                    vcodec='libx264',
-                    pix_fmt='yuv420p',
-                    vf=vf_filter
+                    str(encode_path),
+                    vf=vf_filter,
+                    **self._encoder_options(config, draft)
                 )
-                .run(overwrite_output=True, quiet=True)
+                .compile(overwrite_output=True)
+            )
+            await run_ffmpeg(cmd, slide.duration, on_progress, config.frame_rate)
+        except BaseException as e:
+            if cache_key:
+                encode_path.unlink(missing_ok=True)
+            if isinstance(e, ffmpeg.Error):
+                logger.error(f"FFmpeg 错误: {e}")
+            raise
+        
+        if cache_key:
+            # 先链接到任务路径再放入缓存，放入后立即被淘汰也不影响本任务
+            # commit 可能扫描整个缓存目录淘汰旧文件，不阻塞同一事件循环上的其他任务
+            await asyncio.to_thread(link_or_copy, encode_path, output_path)
+            await asyncio.to_thread(segment_cache.commit, encode_path, cache_key, ".mp4")
+        
+        return output_path
+    
+    async def _render_single_pass(
+        self,
+        slides: List[Slide],
+        width: int,
+        height: int,
+        config: VideoConfigRequest,
+        task_id: str,
+        progress: ProgressTracker,
+        draft: bool = False,
+        image_paths: Optional[List[str]] = None,
+        span: tuple = (0.1, 0.7)
+    ) -> Path:
+        """
+        单次编码渲染所有幻灯片
+        
+        每张图片作为一路输入，在同一个 filter_complex 中完成
+        缩放/填充/淡入淡出/字幕，再经 concat 滤镜拼接后一次编码输出
+        """
+        if image_paths is None:
+            image_paths = await asyncio.gather(*[
+                self._resolve_image(slide, task_id, i, width, height)
+                for i, slide in enumerate(slides)
+            ])
+        
+        output_path = Path(settings.OUTPUT_DIR) / f"temp_{task_id}_merged.mp4"
+        
+        cmd = ["ffmpeg"]
+        graph = []
+        for i, (slide, image_path) in enumerate(zip(slides, image_paths)):
+            cmd += ["-loop", "1", "-t", str(slide.duration), "-i", image_path]
+            # 统一 SAR，concat 滤镜要求各路输入参数一致
+            slide_filter = self._build_slide_filter(slide, width, height, config)
+            graph.append(f"[{i}:v]{slide_filter},setsar=1[v{i}]")
+        
+        inputs = "".join(f"[v{i}]" for i in range(len(slides)))
+        graph.append(f"{inputs}concat=n={len(slides)}:v=1:a=0[out]")
+        
+        cmd += ["-filter_complex", ";".join(graph), "-map", "[out]"]
+        for key, value in self._encoder_options(config, draft).items():
+            cmd += [f"-{key}", str(value)]
+        cmd += [str(output_path), "-y"]
+        
+        message = f"单次编码 {len(slides)} 张幻灯片..."
+        await progress.report(span[0], message, force=True)
+        
+        try:
+            await run_ffmpeg(
+                cmd,
+                sum(slide.duration for slide in slides),
+                progress.stage(span[0], span[1], message),
+                config.frame_rate
             )
         except ffmpeg.Error as e:
-            logger.error(f"FFmpeg 错误: {e}")
+            logger.error(f"FFmpeg 单次编码错误: {e.stderr}")
             raise
         
         return output_path
     
-    async def _merge_videos(self, video_paths: List[Path], task_id: str) -> Path:
+    async def _resolve_image(
+        self,
+        slide: Slide,
+        task_id: str,
+        index: int,
+        width: int,
+        height: int
+    ) -> str:
+        """获取幻灯片图片的本地路径（已预处理为目标尺寸）"""
+        image_path = await self.download_image(
+            slide.expanded_image_url or slide.image_url, task_id, index
+        )
+        return await self.normalize_image(image_path, width, height, task_id, index)
+    
+    async def download_image(self, url: str, task_id: str, index: Union[int, str]) -> str:
+        """
+        获取图片的本地路径，网络图片先下载到临时文件
+        
+        我们自己存储中的图片（上传的原图、扩展结果）通过存储服务读取，不经过公共 URL
+        """
+        storage = get_storage()
+        if storage.is_stored(url):
+            return await storage.download_file(url, str(self._temp_image_path(url, task_id, index)))
+        if url.startswith("http"):
+            return await self._download_image(url, task_id, index)
+        return url
+    
+    async def normalize_image(
+        self,
+        image_path: str,
+        width: int,
+        height: int,
+        task_id: str,
+        index: Union[int, str]
+    ) -> str:
+        """
+        预处理：只解码一次原图并缩放到目标尺寸，重复渲染直接命中缓存
+        
+        结果为任务临时文件 temp_{task_id}_norm_{index}.png，与其他临时文件一起清理
+        """
+        if not settings.IMAGE_NORMALIZE_ENABLED:
+            return image_path
+        output_path = Path(settings.OUTPUT_DIR) / f"temp_{task_id}_norm_{index}.png"
+        try:
+            return await image_normalizer.normalize(image_path, width, height, output_path)
+        except Exception as e:
+            logger.warning(f"[视频] 图片预处理失败，使用原图: {image_path}, {e}")
+            return image_path
+    
+    def _build_slide_filter(
+        self,
+        slide: Slide,
+        width: int,
+        height: int,
+        config: VideoConfigRequest
+    ) -> str:
+        """构建单个幻灯片的滤镜链"""
+        # 构建字幕滤镜
+        subtitle_filter = ""
+        if config.subtitle_enabled and slide.caption:
+            y_position = self._get_subtitle_y_position(config.subtitle_position, height)
+            # 字幕是用户输入：转义后不能改变滤镜选项，expansion=none 使 % 不被当作表达式
+            subtitle_filter = (
+                f",drawtext=text={escape_filter_value(slide.caption)}:expansion=none"
+                f":fontcolor=white:fontsize=48:x=(w-text_w)/2:y={y_position}"
+                f":box=1:boxcolor=black@0.5:boxborderw=10"
+            )
+        
+        slide_filter = (
+            f"fps={config.frame_rate},"
+            f"scale={width}:{height}:force_original_aspect_ratio=decrease,"
+            f"pad={width}:{height}:(ow-iw)/2:(oh-ih)/2,"
+            f"fade=t=in:st=0:d={FADE_DURATION},"
+            f"fade=t=out:st={slide.duration-FADE_DURATION}:d={FADE_DURATION}"
+            f"{subtitle_filter}"
+        )
+        
+        if settings.VIDEO_ENCODE_MODE == "still":
+            # 丢弃静止部分的重复帧，只有淡入淡出窗口保持完整帧率
+            slide_filter += ",mpdecimate"
+        
+        return slide_filter
+    
+    def _encoder_options(self, config: VideoConfigRequest, draft: bool = False) -> dict:
+        """
+        libx264 编码参数
+        
+        still 模式针对静态幻灯片：stillimage 调优、长 GOP，
+        配合 mpdecimate 输出可变帧率；草稿预览使用最快的编码预设
+        """
+        options = {
+            "vcodec": "libx264",
+            "pix_fmt": "yuv420p"
+        }
+        
+        if settings.VIDEO_ENCODE_MODE == "still":
+            options.update({
+                "tune": "stillimage",
+                "g": config.frame_rate * STILL_GOP_SECONDS,
+                "fps_mode": "vfr"
+            })
+        
+        if draft:
+            options["preset"] = settings.PREVIEW_PRESET
+        
+        return options
+    
+    async def _merge_videos(
+        self,
+        video_paths: List[Path],
+        task_id: str,
+        duration: Optional[float] = None,
+        on_progress: Optional[Callable[[float], Awaitable[None]]] = None
+    ) -> Path:
         """合并视频片段"""
         # 创建 concat 列表文件
         list_path = Path(settings.OUTPUT_DIR) / f"temp_{task_id}_list.txt"
@@ -160,12 +557,13 @@ class VideoService:
         output_path = Path(settings.OUTPUT_DIR) / f"temp_{task_id}_merged.mp4"
         
         try:
-            (
+            cmd = (
                 ffmpeg
                 .input(str(list_path), format='concat', safe=0)
                 .output(str(output_path), c='copy')
-                .run(overwrite_output=True, quiet=True)
+                .compile(overwrite_output=True)
             )
+            await run_ffmpeg(cmd, duration, on_progress)
         except ffmpeg.Error as e:
             logger.error(f"FFmpeg 合并错误: {e.stderr}")
             raise
@@ -179,14 +577,15 @@ class VideoService:
         self,
         video_path: Path,
         bgm_type: str,
-        task_id: str
+        task_id: str,
+        on_progress: Optional[Callable[[float], Awaitable[None]]] = None
     ) -> Path:
         """添加背景音乐"""
-        # TODO: 实现背景音乐混音
+        # TODO: 实现背景音乐混音，混音的 ffmpeg 进度通过 on_progress 上报
         # 目前直接返回原视频
         return video_path
     
-    async def _download_image(self, url: str, task_id: str, index: int) -> str:
+    async def _download_image(self, url: str, task_id: str, index: Union[int, str]) -> str:
         """下载网络图片"""
         import httpx
         
@@ -195,15 +594,18 @@ class VideoService:
             response.raise_for_status()
             
             # 保存图片
-            ext = url.split('.')[-1].split('?')[0] or 'jpg'
-            if ext not in ['jpg', 'jpeg', 'png', 'webp']:
-                ext = 'jpg'
-            
-            image_path = Path(settings.OUTPUT_DIR) / f"temp_{task_id}_img_{index}.{ext}"
+            image_path = self._temp_image_path(url, task_id, index)
             image_path.write_bytes(response.content)
             
             return str(image_path)
     
+    def _temp_image_path(self, url: str, task_id: str, index: Union[int, str]) -> Path:
+        """下载图片使用的临时文件（扩展名取自 URL）"""
+        ext = url.split('.')[-1].split('?')[0] or 'jpg'
+        if ext not in ['jpg', 'jpeg', 'png', 'webp']:
+            ext = 'jpg'
+        return Path(settings.OUTPUT_DIR) / f"temp_{task_id}_img_{index}.{ext}"
+    
     def _get_subtitle_y_position(self, position: str, video_height: int) -> int:
         """获取字幕 Y 坐标"""
         positions = {
@@ -3,6 +3,9 @@ Celery 任务配置
 """
 
 from celery import Celery
+from celery.signals import (
+    task_postrun, task_prerun, worker_init, worker_process_init, worker_process_shutdown, worker_shutdown
+)
 from app.config import settings
 from app.core.logger import logger
 
@@ -11,7 +14,7 @@ celery_app = Celery(
     "mystoryapp",
     broker=settings.REDIS_URL,
     backend=settings.REDIS_URL,
-    include=["app.tasks.video_tasks"]
+    include=["app.tasks.video_tasks", "app.tasks.workflow_tasks"]
 )
 
 # Celery 配置
@@ -24,4 +27,78 @@ celery_app.conf.update(
     task_track_started=True,
     task_time_limit=3600,  # 任务超时时间 1小时
     worker_prefetch_multiplier=1,  # 每次只取一个任务
+    # 默认进入 CPU 队列（视频合成、预览、片段编码、合并都运行 ffmpeg）
+    task_default_queue=settings.CELERY_CPU_QUEUE,
+    # 主要时间花在等待外部 API 的任务进入 I/O 队列
+    task_routes={
+        "app.tasks.video_tasks.prepare_media_task": {"queue": settings.CELERY_IO_QUEUE},
+        "app.tasks.workflow_tasks.expand_slide_task": {"queue": settings.CELERY_IO_QUEUE},
+        "app.tasks.workflow_tasks.voice_slide_task": {"queue": settings.CELERY_IO_QUEUE},
+    },
 )
+
+
+@worker_init.connect
+def _on_worker_init(sender=None, **kwargs):
+    """
+    Worker 启动时注册任务状态持久化（prefork 子进程继承该注册），
+    并在主进程中启动心跳（队列指标使用）
+    """
+    from app.services.task_recorder import task_recorder
+    from app.services.task_status import task_status_store
+    from app.tasks.metrics import worker_heartbeat
+    
+    task_status_store.add_listener(task_recorder.record)
+    if sender is not None:
+        worker_heartbeat.start(
+            sender.hostname,
+            sender.app.amqp.queues.consume_from.keys(),
+            sender.concurrency
+        )
+
+
+@worker_process_init.connect
+def _on_worker_process_init(**kwargs):
+    """prefork 子进程不继承父进程的 HTTP 连接"""
+    from app.services.http_client import dashscope_http
+    
+    dashscope_http.reset()
+
+
+@task_prerun.connect
+def _on_task_prerun(task_id=None, task=None, **kwargs):
+    """记录运行中的任务数"""
+    from app.tasks.metrics import worker_heartbeat
+    
+    if task.request.hostname:
+        worker_heartbeat.task_started(task.request.hostname, task_id)
+
+
+@task_postrun.connect
+def _on_task_postrun(task_id=None, task=None, **kwargs):
+    """更新运行中的任务数与队列平均耗时"""
+    from app.tasks.metrics import worker_heartbeat
+    
+    if task.request.hostname:
+        delivery_info = task.request.delivery_info or {}
+        worker_heartbeat.task_finished(task.request.hostname, task_id, delivery_info.get("routing_key"))
+
+
+@worker_process_shutdown.connect
+@worker_shutdown.connect
+def _on_worker_shutdown(**kwargs):
+    """
+    进程退出前写入尚未刷新的任务状态，停止心跳，关闭 DashScope 连接池与进程的事件循环，
+    并记录连接复用与轮询统计
+    """
+    from app.services.dashscope_poller import dashscope_poller
+    from app.services.http_client import dashscope_http
+    from app.services.task_recorder import task_recorder
+    from app.tasks.event_loop import worker_loop
+    from app.tasks.metrics import worker_heartbeat
+    
+    task_recorder.close()
+    worker_heartbeat.stop()
+    worker_loop.shutdown(dashscope_http.aclose)
+    logger.info(f"[HTTP] DashScope 连接统计: {dashscope_http.stats()}")
+    logger.info(f"[轮询] DashScope 轮询统计: {dashscope_poller.stats()}")
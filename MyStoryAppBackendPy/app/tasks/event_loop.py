@@ -0,0 +1,87 @@
+"""
+Worker 进程的事件循环
+每个 Worker 进程一个在后台线程中常驻的事件循环，任务在其中运行协程。
+绑定在事件循环上的资源（DashScope 连接池、轮询协程）因此在整个进程生命周期内复用，
+不会随任务结束而重建；I/O Worker 的多个线程也共用同一个循环
+"""
+
+import asyncio
+import os
+import threading
+from typing import Optional
+
+from app.core.logger import logger
+
+
+class WorkerEventLoop:
+    """
+    进程级事件循环
+    
+    首次使用时在当前进程中启动（prefork 子进程 fork 后重新创建），
+    Worker 进程退出时调用 shutdown() 停止
+    """
+    
+    def __init__(self):
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+        self._lock = threading.Lock()
+    
+    def _ensure(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            # fork 得到的子进程中父进程的循环线程并不存在
+            if self._loop is None or self._pid != os.getpid() or not self._thread.is_alive():
+                self._loop = asyncio.new_event_loop()
+                self._pid = os.getpid()
+                self._thread = threading.Thread(
+                    target=self._loop.run_forever, name="worker-event-loop", daemon=True
+                )
+                self._thread.start()
+            return self._loop
+    
+    def run(self, func, *args, **kwargs):
+        """
+        在进程的事件循环中运行协程函数并等待结果（在任务线程中调用）
+        
+        等待被打断时（例如任务超时）同时取消协程
+        """
+        loop = self._ensure()
+        if threading.current_thread() is self._thread:
+            raise RuntimeError("不能在 Worker 事件循环线程中同步等待协程")
+        
+        future = asyncio.run_coroutine_threadsafe(func(*args, **kwargs), loop)
+        try:
+            return future.result()
+        except BaseException:
+            future.cancel()
+            raise
+    
+    def shutdown(self, cleanup=None, timeout: float = 10):
+        """
+        停止当前进程的事件循环
+        
+        Args:
+            cleanup: 停止前在循环中运行的协程函数（例如关闭连接池）
+        """
+        with self._lock:
+            loop, thread = self._loop, self._thread
+            if loop is None or self._pid != os.getpid() or not thread.is_alive():
+                return
+            self._loop = self._thread = self._pid = None
+        
+        if cleanup is not None:
+            try:
+                asyncio.run_coroutine_threadsafe(cleanup(), loop).result(timeout)
+            except Exception as e:
+                logger.warning(f"[事件循环] 退出前清理失败: {e}")
+        
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join(timeout)
+        if thread.is_alive():
+            logger.warning("[事件循环] Worker 事件循环未能按时停止")
+            return
+        loop.close()
+
+
+# 单例
+worker_loop = WorkerEventLoop()
@@ -0,0 +1,225 @@
+"""
+队列指标
+Worker 定时把自身信息（监听的队列、并发数、心跳时间）写入 Redis，任务开始/结束时
+更新运行中的任务数与各队列的平均任务耗时；API 进程在后台定时读取 Broker 队列长度
+与这些信息并汇总，/queue-status 直接返回缓存结果，不再广播 inspect() 到所有 Worker
+"""
+
+import asyncio
+import os
+import threading
+import time
+from typing import Dict, Iterable, List, Optional
+
+from redis import RedisError
+
+from app.config import settings
+from app.core.logger import logger
+from app.core.redis import get_redis
+from app.tasks.scheduler import fair_scheduler
+
+
+WORKER_KEY_PREFIX = "video:workers:"
+TASK_SECONDS_KEY = "video:metrics:task_seconds"
+
+# Redis Broker 按优先级拆分的子队列后缀（kombu 默认 priority_steps）
+PRIORITY_SEPARATOR = "\x06\x16"
+PRIORITY_STEPS = (3, 6, 9)
+
+# 没有历史数据时使用的平均任务耗时（秒）
+DEFAULT_TASK_SECONDS = 60.0
+
+# 只在 Worker 记录存在时更新运行中的任务数：记录过期或 Worker 下线删除后，
+# HINCRBY 会重建一个没有 TTL 的 hash，指标中一直留着一个不存在的 Worker
+INCR_ACTIVE_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    return redis.call('HINCRBY', KEYS[1], 'active', ARGV[1])
+end
+return nil
+"""
+
+
+class WorkerHeartbeat:
+    """
+    Worker 心跳
+    
+    每个 Worker 一个 hash video:workers:{hostname}，字段为 queues、concurrency、pid、
+    heartbeat 与 active（运行中的任务数）。心跳停止后按 TTL 自动过期
+    """
+    
+    def __init__(self):
+        self._thread: Optional[threading.Thread] = None
+        self._key: Optional[str] = None
+        self._stop = threading.Event()
+        self._started: Dict[str, float] = {}
+        self._incr_script = None
+    
+    def start(self, hostname: str, queues: Iterable[str], concurrency: int):
+        """在 Worker 主进程中启动心跳线程（同名 Worker 重启时清零运行中的任务数）"""
+        key = WORKER_KEY_PREFIX + hostname
+        info = {
+            "hostname": hostname,
+            "queues": ",".join(sorted(queues)),
+            "concurrency": concurrency,
+            "pid": os.getpid()
+        }
+        try:
+            pipe = get_redis().pipeline()
+            pipe.delete(key)
+            pipe.hset(key, mapping={**info, "active": 0, "heartbeat": time.time()})
+            pipe.expire(key, int(settings.WORKER_HEARTBEAT_INTERVAL * 3))
+            pipe.execute()
+        except RedisError as e:
+            logger.warning(f"[心跳] 注册 Worker 失败: {hostname}, {e}")
+        
+        self._key = key
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, args=(key,), name="worker-heartbeat", daemon=True)
+        self._thread.start()
+    
+    def stop(self):
+        """停止心跳；在主进程中同时删除 Worker 记录，指标立即反映 Worker 下线"""
+        self._stop.set()
+        if self._thread is not None and self._thread.is_alive():
+            try:
+                get_redis().delete(self._key)
+            except RedisError as e:
+                logger.warning(f"[心跳] 删除 Worker 记录失败: {self._key}, {e}")
+    
+    def _run(self, key: str):
+        while not self._stop.wait(settings.WORKER_HEARTBEAT_INTERVAL):
+            try:
+                pipe = get_redis().pipeline()
+                pipe.hset(key, "heartbeat", time.time())
+                pipe.expire(key, int(settings.WORKER_HEARTBEAT_INTERVAL * 3))
+                pipe.execute()
+            except RedisError as e:
+                logger.warning(f"[心跳] 更新失败: {key}, {e}")
+    
+    def _incr_active(self, hostname: str, amount: int):
+        """更新运行中的任务数（Worker 记录已过期或已删除时跳过）"""
+        if self._incr_script is None:
+            self._incr_script = get_redis().register_script(INCR_ACTIVE_SCRIPT)
+        self._incr_script(keys=[WORKER_KEY_PREFIX + hostname], args=[amount])
+    
+    def task_started(self, hostname: str, task_id: str):
+        """任务开始（在执行任务的进程中调用）"""
+        self._started[task_id] = time.monotonic()
+        try:
+            self._incr_active(hostname, 1)
+        except RedisError as e:
+            logger.warning(f"[心跳] 更新运行中任务数失败: {hostname}, {e}")
+    
+    def task_finished(self, hostname: str, task_id: str, queue: Optional[str]):
+        """任务结束：运行中任务数减一，并更新该队列的平均任务耗时"""
+        started = self._started.pop(task_id, None)
+        try:
+            self._incr_active(hostname, -1)
+            redis = get_redis()
+            if started is not None and queue:
+                seconds = time.monotonic() - started
+                average = redis.hget(TASK_SECONDS_KEY, queue)
+                average = seconds if average is None else 0.8 * float(average) + 0.2 * seconds
+                redis.hset(TASK_SECONDS_KEY, queue, average)
+        except RedisError as e:
+            logger.warning(f"[心跳] 更新任务耗时失败: {hostname}, {e}")
+
+
+class QueueMetrics:
+    """
+    队列指标汇总（API 进程）
+    
+    后台每 QUEUE_METRICS_INTERVAL 秒刷新一次，接口读取缓存
+    """
+    
+    def __init__(self):
+        self._snapshot: Optional[dict] = None
+        self._lock = asyncio.Lock()
+    
+    def _queue_depth(self, redis, queue: str) -> int:
+        """Broker 中等待的消息数（含优先级子队列）"""
+        keys = [queue] + [f"{queue}{PRIORITY_SEPARATOR}{step}" for step in PRIORITY_STEPS]
+        pipe = redis.pipeline()
+        for key in keys:
+            pipe.llen(key)
+        return sum(pipe.execute())
+    
+    def _workers(self, redis) -> List[dict]:
+        """存活的 Worker"""
+        keys = list(redis.scan_iter(match=WORKER_KEY_PREFIX + "*", count=100))
+        pipe = redis.pipeline()
+        for key in keys:
+            pipe.hgetall(key)
+        
+        workers = []
+        for data in pipe.execute():
+            if not data:
+                continue
+            workers.append({
+                "hostname": data.get("hostname"),
+                "queues": [q for q in data.get("queues", "").split(",") if q],
+                "concurrency": int(data.get("concurrency", 0)),
+                # 任务被强制终止时计数可能偏大，以并发数为上限
+                "active": min(max(int(data.get("active", 0)), 0), int(data.get("concurrency", 0))),
+                "last_heartbeat": float(data.get("heartbeat", 0))
+            })
+        return sorted(workers, key=lambda worker: worker["hostname"] or "")
+    
+    def collect(self) -> dict:
+        """读取 Broker 与 Worker 信息并汇总"""
+        redis = get_redis()
+        workers = self._workers(redis)
+        task_seconds = redis.hgetall(TASK_SECONDS_KEY)
+        
+        queues = {}
+        for queue in (settings.CELERY_CPU_QUEUE, settings.CELERY_IO_QUEUE):
+            serving = [worker for worker in workers if queue in worker["queues"]]
+            concurrency = sum(worker["concurrency"] for worker in serving)
+            depth = self._queue_depth(redis, queue)
+            average = float(task_seconds.get(queue, DEFAULT_TASK_SECONDS))
+            queues[queue] = {
+                "depth": depth,
+                "workers": len(serving),
+                "concurrency": concurrency,
+                "active": sum(worker["active"] for worker in serving),
+                "avg_task_seconds": round(average, 1),
+                # 没有 Worker 时按单个槽位估算
+                "backlog_seconds": round(depth * average / max(concurrency, 1))
+            }
+        
+        scheduler = fair_scheduler.stats()
+        active = sum(queue["active"] for queue in queues.values())
+        waiting = sum(queue["depth"] for queue in queues.values()) + scheduler["waiting"]
+        return {
+            "active": active,
+            "waiting": waiting,
+            "queues": queues,
+            "scheduler": scheduler,
+            "workers": workers,
+            "updated_at": time.time()
+        }
+    
+    async def refresh(self):
+        async with self._lock:
+            self._snapshot = await asyncio.to_thread(self.collect)
+    
+    async def get(self) -> dict:
+        """返回缓存的指标，缓存过期（后台刷新停止）时当场刷新"""
+        snapshot = self._snapshot
+        if snapshot is None or time.time() - snapshot["updated_at"] > settings.QUEUE_METRICS_INTERVAL * 3:
+            await self.refresh()
+        return self._snapshot
+    
+    async def run(self):
+        """后台定时刷新"""
+        while True:
+            try:
+                await self.refresh()
+            except Exception as e:
+                logger.warning(f"[队列指标] 刷新失败: {e}")
+            await asyncio.sleep(settings.QUEUE_METRICS_INTERVAL)
+
+
+# 单例
+worker_heartbeat = WorkerHeartbeat()
+queue_metrics = QueueMetrics()
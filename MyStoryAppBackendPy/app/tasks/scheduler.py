@@ -0,0 +1,503 @@
+"""
+视频任务公平调度
+任务先进入 Redis 中按用户划分的等待队列，调度器在有空闲槽位时才提交给 Celery：
+
+- 优先级通道：preview（草稿预览）/ paid（付费用户）/ standard，按权重平滑轮转，
+  高优先级通道先出队但不会完全饿死低优先级通道
+- 同一通道内按用户轮询（round-robin），一个用户提交五十个视频不会阻塞其他用户
+- 全局同时运行的任务数（SCHED_MAX_ACTIVE）与单用户同时运行的任务数（SCHED_USER_MAX_ACTIVE）受限
+
+在提交任务、任务结束以及 API 进程的定时器中触发调度
+"""
+
+import asyncio
+import json
+import math
+import time
+import uuid
+from typing import Dict, List, Optional, Tuple
+
+from redis import RedisError
+from redis.exceptions import LockError
+
+from app.config import settings
+from app.core.logger import logger
+from app.core.redis import get_redis
+from app.services.task_status import task_status_store
+
+
+KEY_PREFIX = "video:sched:"
+
+LANES = ("preview", "paid", "standard")
+
+# 没有历史数据时使用的平均任务耗时（秒）
+DEFAULT_JOB_SECONDS = {
+    "video": 120.0,
+    "preview": 15.0
+}
+
+
+def preview_job_id(task_id: str) -> str:
+    """预览任务的调度ID（与正式视频共用 task_id 时区分两者）"""
+    return f"{task_id}:preview"
+
+
+def _parse_lane_weights(raw: str) -> dict:
+    """解析通道权重配置，如 preview:4,paid:2,standard:1"""
+    weights = {lane: 1 for lane in LANES}
+    for item in raw.split(","):
+        lane, _, weight = item.strip().partition(":")
+        if lane in weights and weight.strip().isdigit():
+            weights[lane] = max(1, int(weight))
+    return weights
+
+
+class FairScheduler:
+    """
+    公平调度器
+    
+    Redis 结构:
+        sched:job:{job_id}        任务信息 hash（用户、通道、提交参数）
+        sched:queue:{lane}:{user} 用户在该通道的等待队列（list）
+        sched:ring:{lane}         有等待任务的用户轮转顺序（list）
+        sched:active              运行中的任务（zset，分数为租约到期时间，Worker 上报进度时续期）
+        sched:active:{user}       用户运行中的任务（zset）
+        sched:weights             通道平滑加权轮转的当前值（hash）
+        sched:stats               各类任务的平均耗时（hash）
+    """
+    
+    def __init__(self):
+        self.lane_weights = _parse_lane_weights(settings.SCHED_LANE_WEIGHTS)
+        self.paid_users = {
+            f"user:{user_id.strip()}"
+            for user_id in settings.SCHED_PAID_USER_IDS.split(",")
+            if user_id.strip()
+        }
+        # 当前进程最近一次续期租约的时间 {job_id: 时间}
+        self._renewed: Dict[str, float] = {}
+    
+    def _key(self, *parts) -> str:
+        return KEY_PREFIX + ":".join(str(part) for part in parts)
+    
+    def lane_for(self, user_key: str, kind: str) -> str:
+        """选择优先级通道"""
+        if kind == "preview":
+            return "preview"
+        if user_key in self.paid_users:
+            return "paid"
+        return "standard"
+    
+    def submit(self, task_id: str, user_key: str, kind: str, payload: dict) -> Tuple[str, Optional[Tuple[int, float]]]:
+        """
+        提交任务：启用调度时进入等待队列并尝试调度，否则直接提交给 Celery
+        
+        Args:
+            task_id: 视频任务ID
+            user_key: 用户标识
+            kind: video 或 preview
+            payload: slides_data / config_data（预览另有 standalone）
+        
+        Returns:
+            (Celery 任务ID, 仍在等待时的 (前面的任务数, 预计等待秒数)，已提交时为 None)
+        """
+        job_id = task_id if kind == "video" else preview_job_id(task_id)
+        celery_task_id = str(uuid.uuid4())
+        
+        if not settings.SCHED_ENABLED:
+            _submit({
+                "task_id": task_id,
+                "kind": kind,
+                "celery_task_id": celery_task_id,
+                "payload": json.dumps(payload, ensure_ascii=False)
+            })
+            return celery_task_id, None
+        
+        self.enqueue(job_id, task_id, user_key, kind, payload, celery_task_id)
+        
+        # 先记录排队状态，调度成功时会被覆盖为 pending
+        queued = self.position(job_id)
+        if queued is not None and (kind == "video" or payload.get("standalone", True)):
+            self._mark_queued(task_id, *queued)
+        
+        self.dispatch()
+        return celery_task_id, self.position(job_id)
+    
+    def _mark_queued(self, task_id: str, ahead: int, wait: float):
+        task_status_store.update(
+            task_id, "queued",
+            message=f"排队中，前面还有 {ahead} 个任务",
+            queue_position=ahead,
+            estimated_wait=round(wait)
+        )
+    
+    def enqueue(
+        self,
+        job_id: str,
+        task_id: str,
+        user_key: str,
+        kind: str,
+        payload: dict,
+        celery_task_id: str
+    ) -> str:
+        """
+        任务进入等待队列
+        
+        Args:
+            job_id: 调度任务ID（正式视频为 task_id，预览为 {task_id}:preview）
+            task_id: 视频任务ID
+            user_key: 用户标识（登录用户为 user:{id}，匿名请求为 ip:{地址}）
+            kind: video 或 preview
+            payload: 提交 Celery 任务所需的参数
+            celery_task_id: 预先分配的 Celery 任务ID
+        
+        Returns:
+            所在通道
+        """
+        lane = self.lane_for(user_key, kind)
+        redis = get_redis()
+        
+        pipe = redis.pipeline()
+        pipe.hset(self._key("job", job_id), mapping={
+            "task_id": task_id,
+            "user": user_key,
+            "lane": lane,
+            "kind": kind,
+            "celery_task_id": celery_task_id,
+            "payload": json.dumps(payload, ensure_ascii=False),
+            "enqueued_at": time.time()
+        })
+        pipe.expire(self._key("job", job_id), settings.TASK_STATUS_TTL)
+        pipe.rpush(self._key("queue", lane, user_key), job_id)
+        pipe.execute()
+        
+        # 用户首次进入该通道时加入轮转
+        if redis.sadd(self._key("members", lane), user_key):
+            redis.rpush(self._key("ring", lane), user_key)
+        
+        return lane
+    
+    def dispatch(self) -> int:
+        """
+        把等待中的任务提交给 Celery，直到没有空闲槽位或没有可运行的任务
+        
+        多个进程可能同时调用，通过 Redis 锁串行执行；短时间内拿不到锁说明
+        其他进程正在调度，本次跳过（遗漏的任务由定时调度补发）
+        
+        Returns:
+            本次提交的任务数
+        """
+        redis = get_redis()
+        dispatched = 0
+        try:
+            with redis.lock(self._key("lock"), timeout=30, blocking_timeout=1):
+                now = time.time()
+                # 清理租约过期的运行记录（Worker 崩溃等未正常释放的槽位）
+                redis.zremrangebyscore(self._key("active"), 0, now)
+                
+                free = settings.SCHED_MAX_ACTIVE - redis.zcard(self._key("active"))
+                while free > 0:
+                    job_id = self._next_job()
+                    if job_id is None:
+                        break
+                    self._start(job_id)
+                    free -= 1
+                    dispatched += 1
+        except LockError:
+            logger.debug("[调度] 其他进程正在调度，跳过")
+        except RedisError as e:
+            logger.warning(f"[调度] 调度失败: {e}")
+        
+        if dispatched:
+            logger.info(f"[调度] 提交 {dispatched} 个任务")
+        return dispatched
+    
+    def _next_job(self) -> Optional[str]:
+        """按通道平滑加权轮转选择下一个任务"""
+        redis = get_redis()
+        lanes = [lane for lane in LANES if redis.llen(self._key("ring", lane))]
+        
+        while lanes:
+            current = {
+                lane: float(value)
+                for lane, value in redis.hgetall(self._key("weights")).items()
+            }
+            total = sum(self.lane_weights[lane] for lane in lanes)
+            for lane in lanes:
+                current[lane] = current.get(lane, 0.0) + self.lane_weights[lane]
+            lane = max(lanes, key=lambda name: current[name])
+            
+            job_id = self._pop_from_lane(lane)
+            if job_id is None:
+                # 该通道的用户都已达到并发上限
+                lanes.remove(lane)
+                continue
+            
+            current[lane] -= total
+            redis.hset(self._key("weights"), mapping=current)
+            return job_id
+        
+        return None
+    
+    def _pop_from_lane(self, lane: str) -> Optional[str]:
+        """在通道内按用户轮询出队，跳过已达到并发上限的用户"""
+        redis = get_redis()
+        ring = self._key("ring", lane)
+        
+        for _ in range(redis.llen(ring)):
+            user_key = redis.lmove(ring, ring, "LEFT", "RIGHT")
+            if user_key is None:
+                return None
+            
+            queue = self._key("queue", lane, user_key)
+            # 与全局运行记录一样清理过期租约，否则崩溃任务会一直占用该用户的名额
+            redis.zremrangebyscore(self._key("active", user_key), 0, time.time())
+            if redis.zcard(self._key("active", user_key)) >= settings.SCHED_USER_MAX_ACTIVE:
+                if redis.llen(queue):
+                    continue
+                job_id = None
+            else:
+                job_id = redis.lpop(queue)
+            
+            if not redis.llen(queue):
+                redis.lrem(ring, 0, user_key)
+                redis.srem(self._key("members", lane), user_key)
+            
+            if job_id:
+                return job_id
+        
+        return None
+    
+    def _start(self, job_id: str):
+        """标记为运行中并提交 Celery 任务"""
+        redis = get_redis()
+        job = redis.hgetall(self._key("job", job_id))
+        if not job:
+            return
+        
+        lease = time.time() + settings.SCHED_LEASE_SECONDS
+        pipe = redis.pipeline()
+        pipe.zadd(self._key("active"), {job_id: lease})
+        pipe.zadd(self._key("active", job["user"]), {job_id: lease})
+        pipe.expire(self._key("active", job["user"]), settings.SCHED_LEASE_SECONDS)
+        pipe.hset(self._key("job", job_id), "dispatched_at", time.time())
+        pipe.execute()
+        
+        try:
+            _submit(job)
+        except Exception:
+            logger.exception(f"[调度] 提交任务失败: {job_id}")
+            self.release(job_id, dispatch=False)
+            task_status_store.update(job["task_id"], "failed", message="任务提交失败")
+    
+    def renew(self, job_id: str):
+        """
+        续期运行中任务的槽位租约
+        
+        Worker 每次上报进度时调用（按租约时长的十分之一限频），运行时间超过
+        SCHED_LEASE_SECONDS 的任务不会被当作 Worker 崩溃而回收槽位。
+        租约已过期被回收或未经过调度器的任务调用时无副作用
+        """
+        if not settings.SCHED_ENABLED:
+            return
+        now = time.time()
+        if now - self._renewed.get(job_id, float("-inf")) < settings.SCHED_LEASE_SECONDS / 10:
+            return
+        self._renewed[job_id] = now
+        
+        try:
+            redis = get_redis()
+            user_key = redis.hget(self._key("job", job_id), "user")
+            if user_key is None:
+                return
+            
+            lease = now + settings.SCHED_LEASE_SECONDS
+            pipe = redis.pipeline()
+            pipe.zadd(self._key("active"), {job_id: lease}, xx=True)
+            pipe.zadd(self._key("active", user_key), {job_id: lease}, xx=True)
+            pipe.expire(self._key("active", user_key), settings.SCHED_LEASE_SECONDS)
+            pipe.execute()
+        except RedisError as e:
+            logger.warning(f"[调度] 续期租约失败: {job_id}, {e}")
+    
+    def release(self, job_id: str, dispatch: bool = True):
+        """
+        任务结束（成功或最终失败）后释放槽位并调度下一个任务
+        
+        未经过调度器的任务调用时无副作用
+        """
+        self._renewed.pop(job_id, None)
+        try:
+            redis = get_redis()
+            job = redis.hgetall(self._key("job", job_id))
+            if not job:
+                return
+            
+            pipe = redis.pipeline()
+            pipe.zrem(self._key("active"), job_id)
+            pipe.zrem(self._key("active", job["user"]), job_id)
+            pipe.delete(self._key("job", job_id))
+            pipe.execute()
+            
+            if job.get("dispatched_at"):
+                # 平均耗时（指数滑动平均），用于估算等待时间
+                seconds = time.time() - float(job["dispatched_at"])
+                field = f"avg:{job['kind']}"
+                average = redis.hget(self._key("stats"), field)
+                average = seconds if average is None else 0.8 * float(average) + 0.2 * seconds
+                redis.hset(self._key("stats"), field, average)
+        except RedisError as e:
+            logger.warning(f"[调度] 释放槽位失败: {job_id}, {e}")
+            return
+        
+        if dispatch:
+            self.dispatch()
+    
+    def cancel(self, task_id: str) -> List[str]:
+        """
+        取消任务：从等待队列中移除并释放已占用的槽位
+        
+        Returns:
+            被取消的任务已分配的 Celery 任务ID
+        """
+        redis = get_redis()
+        celery_ids = []
+        released = False
+        for job_id in (task_id, preview_job_id(task_id)):
+            job = redis.hgetall(self._key("job", job_id))
+            if not job:
+                continue
+            celery_ids.append(job["celery_task_id"])
+            
+            queue = self._key("queue", job["lane"], job["user"])
+            pipe = redis.pipeline()
+            pipe.lrem(queue, 0, job_id)
+            pipe.zrem(self._key("active"), job_id)
+            pipe.zrem(self._key("active", job["user"]), job_id)
+            pipe.delete(self._key("job", job_id))
+            _, _, active, _ = pipe.execute()
+            released = released or bool(active)
+        
+        if released:
+            self.dispatch()
+        return celery_ids
+    
+    def stats(self) -> dict:
+        """等待与运行中的任务数（队列指标使用）"""
+        redis = get_redis()
+        lanes = {}
+        for lane in LANES:
+            users = redis.lrange(self._key("ring", lane), 0, -1)
+            lanes[lane] = sum(redis.llen(self._key("queue", lane, user)) for user in users)
+        
+        average = redis.hget(self._key("stats"), "avg:video")
+        average = float(average) if average else DEFAULT_JOB_SECONDS["video"]
+        waiting = sum(lanes.values())
+        return {
+            "waiting": waiting,
+            "lanes": lanes,
+            "active": redis.zcard(self._key("active")),
+            "max_active": settings.SCHED_MAX_ACTIVE,
+            "backlog_seconds": round(waiting * average / settings.SCHED_MAX_ACTIVE)
+        }
+    
+    def position(self, job_id: str) -> Optional[Tuple[int, float]]:
+        """
+        估算排队位置与等待时间
+        
+        同一通道内轮询出队：前面的任务数约为自己在用户队列中靠前的任务，
+        加上其他用户各自不超过同样轮次的任务；其他通道按权重比例折算
+        
+        Returns:
+            (前面的任务数, 预计等待秒数)，已提交给 Celery 或不在调度器中时为 None
+        """
+        redis = get_redis()
+        job = redis.hgetall(self._key("job", job_id))
+        if not job or job.get("dispatched_at"):
+            return None
+        
+        lane, user_key = job["lane"], job["user"]
+        index = redis.lpos(self._key("queue", lane, user_key), job_id) or 0
+        
+        lane_lengths = {}
+        for name in LANES:
+            users = redis.lrange(self._key("ring", name), 0, -1)
+            lane_lengths[name] = {
+                user: redis.llen(self._key("queue", name, user)) for user in users
+            }
+        
+        ahead_in_lane = index + sum(
+            min(length, index + 1)
+            for user, length in lane_lengths[lane].items()
+            if user != user_key
+        )
+        ahead = ahead_in_lane
+        rounds = ahead_in_lane + 1
+        for name in LANES:
+            if name == lane:
+                continue
+            share = math.ceil(rounds * self.lane_weights[name] / self.lane_weights[lane])
+            ahead += min(sum(lane_lengths[name].values()), share)
+        
+        average = redis.hget(self._key("stats"), "avg:video")
+        average = float(average) if average else DEFAULT_JOB_SECONDS["video"]
+        
+        # 用户已达到并发上限时，至少要等自己的一个任务结束
+        own_waves = 0
+        if redis.zcard(self._key("active", user_key)) >= settings.SCHED_USER_MAX_ACTIVE:
+            own_waves = index // settings.SCHED_USER_MAX_ACTIVE + 1
+        
+        free = max(settings.SCHED_MAX_ACTIVE - redis.zcard(self._key("active")), 0)
+        waves = 0
+        if ahead >= free:
+            waves = math.ceil((ahead - free + 1) / settings.SCHED_MAX_ACTIVE)
+        return ahead, max(waves, own_waves) * average
+
+
+async def run_scheduler_loop(interval: float):
+    """
+    定时调度（API 进程后台运行）
+    
+    正常情况下任务提交和结束时都会触发调度，定时器用于回收过期租约后
+    补发等待中的任务
+    """
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await asyncio.to_thread(fair_scheduler.dispatch)
+        except Exception as e:
+            logger.warning(f"[调度] 定时调度失败: {e}")
+
+
+def _submit(job: dict):
+    """提交 Celery 任务（与 API 直接提交时的参数一致）"""
+    from app.tasks.video_tasks import generate_video_task, generate_preview_task, start_split_workflow
+    from app.tasks.workflow_tasks import start_video_workflow
+    
+    payload = json.loads(job["payload"])
+    task_id = job["task_id"]
+    celery_task_id = job["celery_task_id"]
+    
+    if job["kind"] == "preview":
+        generate_preview_task.apply_async(
+            (task_id, payload["slides_data"], payload["config_data"]),
+            {"standalone": payload.get("standalone", True)},
+            task_id=celery_task_id
+        )
+        if not payload.get("standalone", True):
+            task_status_store.update(task_id, preview_status="pending")
+            return
+    elif settings.VIDEO_WORKFLOW == "fanout":
+        start_video_workflow(task_id, payload["slides_data"], payload["config_data"], root_id=celery_task_id)
+    elif settings.VIDEO_WORKFLOW == "split":
+        start_split_workflow(task_id, payload["slides_data"], payload["config_data"], root_id=celery_task_id)
+    else:
+        generate_video_task.apply_async(
+            (task_id, payload["slides_data"], payload["config_data"]),
+            task_id=celery_task_id
+        )
+    
+    task_status_store.update(task_id, "pending", message="等待 Worker 处理...", queue_position=0)
+
+
+# 单例
+fair_scheduler = FairScheduler()
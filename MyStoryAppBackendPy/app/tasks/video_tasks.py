@@ -3,14 +3,24 @@
 """
 
 import asyncio
-from celery import Task
-from asgiref.sync import async_to_sync
+import json
+import time
+from typing import Optional
+from celery import Task, chain
 
 from app.tasks import celery_app
+from app.config import settings
 from app.models.schemas import Slide, VideoConfigRequest
 from app.services.bailian_image import bailian_image_service
 from app.services.bailian_tts import bailian_tts_service
-from app.services.video_service import video_service
+from app.services.video_service import video_service, make_preview_config
+from app.services.checkpoint import JobCheckpoint
+from app.services.pipeline import SlidePipeline
+from app.services.eta import JobFeatures, eta_estimator
+from app.services.task_status import task_status_store
+from app.services.cancellation import JobCancelled, cleanup_task_files, run_cancellable
+from app.tasks.event_loop import worker_loop
+from app.tasks.scheduler import fair_scheduler, preview_job_id
 from app.core.logger import logger
 
 
@@ -22,10 +32,101 @@ class CallbackTask(Task):
     
     def on_failure(self, exc, task_id, args, kwargs, einfo):
         logger.error(f"任务失败: {task_id}, 错误: {exc}")
+    
+    def report(self, task_id: str, state: str, meta: dict, celery_task_id: Optional[str] = None):
+        """
+        更新任务状态
+        
+        同时写入 Celery 结果和任务状态存储（按我们的 task_id 索引，并推送给订阅的客户端），
+        并续期调度槽位的租约
+        
+        Args:
+            task_id: 视频任务ID
+            state: 状态
+            meta: 进度信息
+            celery_task_id: 要更新的 Celery 任务，默认为当前任务
+        """
+        self.update_state(task_id=celery_task_id, state=state, meta=meta)
+        task_status_store.update(task_id, state, **meta)
+        fair_scheduler.renew(task_id)
+    
+    def run_async(self, task_id: str, func, *args, **kwargs):
+        """
+        运行任务协程，用户取消任务时中止
+        
+        Raises:
+            JobCancelled: 任务已被取消
+        """
+        return worker_loop.run(run_cancellable, task_id, func, *args, **kwargs)
+    
+    def cancelled(self, task_id: str, job_id: Optional[str] = None) -> dict:
+        """任务被取消：清理中间文件、记录状态并释放调度槽位"""
+        worker_loop.run(cleanup_task_files, task_id)
+        task_status_store.update(task_id, "cancelled", message="任务已取消")
+        fair_scheduler.release(job_id or task_id)
+        return {"success": False, "task_id": task_id, "cancelled": True}
+    
+    def retry_or_fail(self, task_id: str, exc: Exception, countdown: int):
+        """重试任务，重试次数用尽时把任务状态记为失败并释放调度槽位"""
+        if self.request.retries >= self.max_retries:
+            task_status_store.update(task_id, "failed", message="视频生成失败", error=str(exc))
+            fair_scheduler.release(task_id)
+        else:
+            task_status_store.update(
+                task_id, "retrying",
+                message=f"出错了，{countdown} 秒后第 {self.request.retries + 1} 次重试..."
+            )
+        raise self.retry(exc=exc, countdown=countdown)
+
+
+def start_split_workflow(task_id: str, slides_data: list, config_data: dict, root_id: str):
+    """
+    提交拆分执行的视频任务
+    
+    I/O 队列的 prepare_media_task 扩展图片、生成配音并写入检查点，
+    随后 CPU 队列的 generate_video_task 只做合成，等待外部 API 时不占用 CPU Worker 的槽位。
+    不需要扩展和配音时直接提交合成任务
+    
+    Args:
+        root_id: 合成任务的 Celery 任务ID（即调度器记录的 celery_task_id，取消时按它撤销）
+    """
+    config = VideoConfigRequest(**config_data)
+    compose = generate_video_task.si(task_id, slides_data, config_data, prepared=True).set(task_id=root_id)
+    
+    if not config.ai_image_expansion and not any(slide.get("voice_text") for slide in slides_data):
+        compose.apply_async()
+        return
+    
+    chain(prepare_media_task.si(task_id, slides_data, config_data), compose).apply_async()
 
 
 @celery_app.task(base=CallbackTask, bind=True, max_retries=3)
-def generate_video_task(self, task_id: str, slides_data: list, config_data: dict):
+def prepare_media_task(self, task_id: str, slides_data: list, config_data: dict):
+    """
+    扩展图片、生成配音（I/O 队列）
+    
+    结果写入检查点，由随后的 generate_video_task 读取。任务被取消时直接返回，
+    清理和状态记录交给合成任务的取消分支
+    
+    Args:
+        task_id: 任务ID
+        slides_data: 幻灯片数据列表
+        config_data: 配置数据
+    """
+    try:
+        slides = [Slide(**slide) for slide in slides_data]
+        config = VideoConfigRequest(**config_data)
+        self.run_async(task_id, _prepare_media_async, self, task_id, slides, config)
+        return {"success": True, "task_id": task_id}
+    except JobCancelled:
+        return {"success": False, "task_id": task_id, "cancelled": True}
+    except Exception as exc:
+        logger.exception(f"素材准备任务失败: {task_id}")
+        self.retry_or_fail(task_id, exc, countdown=60)
+
+
+@celery_app.task(base=CallbackTask, bind=True, max_retries=3)
+def generate_video_task(self, task_id: str, slides_data: list, config_data: dict, prepared: bool = False):
     """
     生成视频任务
     
@@ -33,6 +134,7 @@ def generate_video_task(self, task_id: str, slides_data: list, config_data: dict
         task_id: 任务ID
         slides_data: 幻灯片数据列表
         config_data: 配置数据
+        prepared: 扩展和配音已由 prepare_media_task 完成，只做合成
     """
     try:
         # 转换数据模型
@@ -40,84 +142,326 @@ def generate_video_task(self, task_id: str, slides_data: list, config_data: dict
         config = VideoConfigRequest(**config_data)
         
         # 运行异步任务
-        async_to_sync(_generate_video_async)(self, task_id, slides, config)
+        self.run_async(task_id, _generate_video_async, self, task_id, slides, config, prepared)
+        fair_scheduler.release(task_id)
         
         return {"success": True, "task_id": task_id}
-        
+    
+    except JobCancelled:
+        return self.cancelled(task_id)
     except Exception as exc:
         logger.exception(f"视频生成任务失败: {task_id}")
         # 重试
-        raise self.retry(exc=exc, countdown=60)
+        self.retry_or_fail(task_id, exc, countdown=60)
 
 
-async def _generate_video_async(task, task_id: str, slides: list, config: VideoConfigRequest):
-    """异步生成视频"""
+@celery_app.task(base=CallbackTask, bind=True)
+def generate_preview_task(self, task_id: str, slides_data: list, config_data: dict, standalone: bool = True):
+    """
+    生成草稿预览任务
     
-    # 步骤1: 扩展图片
-    if config.ai_image_expansion:
-        task.update_state(
-            state="expanding_images",
-            meta={"progress": 0.1, "message": "AI扩展图片中..."}
+    低分辨率、低帧率、最快编码预设，跳过 AI 图片扩展；
+    输出 preview_{task_id}.mp4，与正式视频互不影响，失败不重试
+    
+    Args:
+        task_id: 任务ID
+        slides_data: 幻灯片数据列表
+        config_data: 配置数据
+        standalone: 是否为单独的预览任务；与正式视频一起提交时，
+            只在任务状态中记录 preview_status / preview_url，不覆盖正式视频的进度
+    """
+    slides = [Slide(**slide) for slide in slides_data]
+    config = make_preview_config(VideoConfigRequest(**config_data))
+    
+    async def progress_callback(progress: float, message: str):
+        meta = {"progress": progress, "message": f"[预览] {message}"}
+        if standalone:
+            self.report(task_id, "previewing", meta)
+        else:
+            self.update_state(state="previewing", meta=meta)
+        fair_scheduler.renew(preview_job_id(task_id))
+    
+    try:
+        preview_url = self.run_async(
+            task_id,
+            video_service.compose_video,
+            slides,
+            config,
+            task_id,
+            progress_callback,
+            draft=True
         )
-        
-        for i, slide in enumerate(slides):
+    except JobCancelled:
+        return self.cancelled(task_id, preview_job_id(task_id))
+    except Exception as exc:
+        if standalone:
+            task_status_store.update(task_id, "failed", message="预览生成失败", error=str(exc))
+        else:
+            task_status_store.update(task_id, preview_status="failed")
+        raise
+    finally:
+        fair_scheduler.release(preview_job_id(task_id))
+    
+    if standalone:
+        task_status_store.update(
+            task_id, "completed",
+            progress=1.0, message="预览生成完成！", output_url=preview_url, preview_url=preview_url
+        )
+    else:
+        task_status_store.update(task_id, preview_status="completed", preview_url=preview_url)
+    
+    return {"success": True, "task_id": task_id, "preview_url": preview_url}
+
+
+async def _expand_images(task, slides: list, config: VideoConfigRequest, checkpoint: JobCheckpoint):
+    """
+    并发扩展图片
+    
+    同时进行的扩展数量受 IMAGE_EXPANSION_CONCURRENCY 限制，按完成顺序更新进度；
+    单张失败时保留原图
+    """
+    pending = []
+    for i, slide in enumerate(slides):
+        expanded_url = checkpoint.get(JobCheckpoint.EXPANDED, i)
+        if expanded_url:
+            slide.expanded_image_url = expanded_url
+        else:
+            pending.append(i)
+    
+    completed = len(slides) - len(pending)
+    task.report(
+        checkpoint.task_id,
+        "expanding_images",
+        {
+            "progress": 0.1 + (0.3 * completed / len(slides)),
+            "message": f"AI扩展图片中...（已恢复 {completed} 张）" if completed else "AI扩展图片中..."
+        }
+    )
+    
+    semaphore = asyncio.Semaphore(settings.IMAGE_EXPANSION_CONCURRENCY)
+    
+    async def expand(i: int):
+        async with semaphore:
             try:
                 expanded_url = await bailian_image_service.expand_image(
-                    slide.image_url,
+                    slides[i].image_url,
                     config.expansion_style.value
                 )
-                slide.expanded_image_url = expanded_url
-                
-                progress = 0.1 + (0.3 * (i + 1) / len(slides))
-                task.update_state(
-                    state="expanding_images",
-                    meta={"progress": progress, "message": f"扩展图片 {i+1}/{len(slides)}..."}
-                )
+                return i, expanded_url, None
             except Exception as e:
-                logger.warning(f"图片扩展失败，使用原图: {e}")
+                return i, None, e
     
-    # 步骤2: 生成配音
-    task.update_state(
-        state="generating_voice",
-        meta={"progress": 0.4, "message": "生成配音中..."}
-    )
+    for future in asyncio.as_completed([expand(i) for i in pending]):
+        i, expanded_url, error = await future
+        completed += 1
+        
+        if error:
+            logger.warning(f"图片扩展失败，使用原图: 幻灯片 {i}, {error}")
+        else:
+            slides[i].expanded_image_url = expanded_url
+            checkpoint.save(JobCheckpoint.EXPANDED, i, expanded_url)
+        
+        task.report(
+            checkpoint.task_id,
+            "expanding_images",
+            {
+                "progress": 0.1 + (0.3 * completed / len(slides)),
+                "message": f"扩展图片 {completed}/{len(slides)}..."
+            }
+        )
+
+
+async def _generate_voices(task, slides: list, config: VideoConfigRequest, checkpoint: JobCheckpoint):
+    """
+    并发生成配音
     
+    同时进行的合成数量受 TTS_CONCURRENCY 限制，单段失败不影响其他幻灯片
+    """
+    pending = []
     for i, slide in enumerate(slides):
-        if slide.voice_text:
+        if not slide.voice_text:
+            continue
+        voice_url = checkpoint.get(JobCheckpoint.VOICE, i)
+        if voice_url:
+            slide.voice_url = voice_url
+        else:
+            pending.append(i)
+    
+    total = sum(1 for slide in slides if slide.voice_text)
+    completed = total - len(pending)
+    task.report(
+        checkpoint.task_id,
+        "generating_voice",
+        {
+            "progress": 0.4 + (0.2 * completed / total if total else 0.2),
+            "message": f"生成配音中...（已恢复 {completed} 段）" if completed else "生成配音中..."
+        }
+    )
+    
+    semaphore = asyncio.Semaphore(settings.TTS_CONCURRENCY)
+    
+    async def synthesize(i: int):
+        async with semaphore:
             try:
                 tts_result = await bailian_tts_service.generate_speech(
-                    slide.voice_text,
+                    slides[i].voice_text,
                     config.voice_type.value,
                     config.voice_speed
                 )
-                slide.voice_url = tts_result["url"]
-                
-                progress = 0.4 + (0.2 * (i + 1) / len(slides))
-                task.update_state(
-                    state="generating_voice",
-                    meta={"progress": progress, "message": f"生成配音 {i+1}/{len(slides)}..."}
-                )
+                return i, tts_result["url"], None
             except Exception as e:
-                logger.warning(f"配音生成失败: {e}")
+                return i, None, e
+    
+    for future in asyncio.as_completed([synthesize(i) for i in pending]):
+        i, voice_url, error = await future
+        completed += 1
+        
+        if error:
+            logger.warning(f"配音生成失败: 幻灯片 {i}, {error}")
+        else:
+            slides[i].voice_url = voice_url
+            checkpoint.save(JobCheckpoint.VOICE, i, voice_url)
+        
+        task.report(
+            checkpoint.task_id,
+            "generating_voice",
+            {
+                "progress": 0.4 + (0.2 * completed / total),
+                "message": f"生成配音 {completed}/{total}..."
+            }
+        )
+
+
+def _format_timings(timings: dict) -> str:
+    """格式化阶段耗时"""
+    return ", ".join(f"{name}={seconds:.2f}s" for name, seconds in timings.items())
+
+
+async def _prepare_media_async(task, task_id: str, slides: list, config: VideoConfigRequest):
+    """扩展图片、生成配音，结果和阶段耗时写入检查点"""
+    checkpoint = JobCheckpoint(task_id).load()
+    task_status_store.update(task_id, started_at=time.time())
+    
+    stage_timings = {}
+    if config.ai_image_expansion:
+        start = time.perf_counter()
+        await _expand_images(task, slides, config, checkpoint)
+        stage_timings["expanding_images"] = time.perf_counter() - start
+    
+    start = time.perf_counter()
+    await _generate_voices(task, slides, config, checkpoint)
+    stage_timings["generating_voice"] = time.perf_counter() - start
+    
+    checkpoint.save(JobCheckpoint.MEDIA_TIMINGS, 0, json.dumps(stage_timings))
+
+
+def _restore_media(slides: list, checkpoint: JobCheckpoint):
+    """从检查点恢复 prepare_media_task 的扩展和配音结果"""
+    for i, expanded_url in checkpoint.items(JobCheckpoint.EXPANDED).items():
+        slides[i].expanded_image_url = expanded_url
+    for i, voice_url in checkpoint.items(JobCheckpoint.VOICE).items():
+        slides[i].voice_url = voice_url
+
+
+def _merge_media_timings(stage_timings: dict, checkpoint: JobCheckpoint) -> dict:
+    """合并准备任务的阶段耗时，wall 加上准备阶段的耗时"""
+    media_timings = json.loads(checkpoint.get(JobCheckpoint.MEDIA_TIMINGS, 0) or "{}")
+    if not media_timings:
+        return stage_timings
+    merged = {**media_timings, **stage_timings}
+    if "wall" in stage_timings:
+        merged["wall"] = stage_timings["wall"] + sum(media_timings.values())
+    return merged
+
+
+async def _generate_video_async(task, task_id: str, slides: list, config: VideoConfigRequest, prepared: bool = False):
+    """
+    异步生成视频
+    
+    每个节点的中间结果写入检查点，重试时跳过已完成的部分
+    """
+    checkpoint = JobCheckpoint(task_id).load()
+    if not prepared:
+        task_status_store.update(task_id, started_at=time.time())
+    
+    extra_meta = {}
+    if settings.VIDEO_PIPELINE == "staged":
+        output_url, stage_timings = await _run_stages(task, task_id, slides, config, checkpoint, prepared)
+    else:
+        async def progress_callback(progress: float, message: str):
+            task.report(task_id, "processing", {"progress": progress, "message": message})
+        
+        pipeline = SlidePipeline(slides, config, task_id, checkpoint, progress_callback, media_prepared=prepared)
+        output_url = await pipeline.run()
+        stage_timings = pipeline.timer.summary()
+        extra_meta["node_timings"] = pipeline.timer.nodes
+    
+    if prepared:
+        stage_timings = _merge_media_timings(stage_timings, checkpoint)
+    
+    # 完成
+    checkpoint.clear()
+    logger.info(f"[任务] {task_id} 各阶段耗时: {_format_timings(stage_timings)}")
+    eta_estimator.record(JobFeatures.from_request(slides, config), stage_timings)
+    task.report(
+        task_id,
+        "completed",
+        {
+            "progress": 1.0,
+            "message": "视频生成完成！",
+            "output_url": output_url,
+            "stage_timings": stage_timings,
+            **extra_meta
+        }
+    )
+    
+    return output_url
+
+
+async def _run_stages(
+    task,
+    task_id: str,
+    slides: list,
+    config: VideoConfigRequest,
+    checkpoint: JobCheckpoint,
+    prepared: bool = False
+):
+    """
+    逐阶段执行：扩展全部图片 → 生成全部配音 → 合成视频
+    
+    prepared 为 True 时前两步已由 prepare_media_task 完成，从检查点恢复结果
+    
+    Returns:
+        (输出视频 URL, 各阶段耗时)
+    """
+    stage_timings = {}
+    
+    if prepared:
+        _restore_media(slides, checkpoint)
+    else:
+        # 步骤1: 扩展图片
+        if config.ai_image_expansion:
+            start = time.perf_counter()
+            await _expand_images(task, slides, config, checkpoint)
+            stage_timings["expanding_images"] = time.perf_counter() - start
+        
+        # 步骤2: 生成配音
+        start = time.perf_counter()
+        await _generate_voices(task, slides, config, checkpoint)
+        stage_timings["generating_voice"] = time.perf_counter() - start
     
     # 步骤3: 合成视频
     async def progress_callback(progress: float, message: str):
-        task.update_state(
-            state="composing",
-            meta={"progress": 0.6 + (progress * 0.4), "message": message}
-        )
+        task.report(task_id, "composing", {"progress": 0.6 + (progress * 0.4), "message": message})
     
+    start = time.perf_counter()
     output_url = await video_service.compose_video(
         slides,
         config,
         task_id,
-        progress_callback
+        progress_callback,
+        checkpoint=checkpoint
     )
+    stage_timings["composing"] = time.perf_counter() - start
     
-    # 完成
-    task.update_state(
-        state="completed",
-        meta={"progress": 1.0, "message": "视频生成完成！", "output_url": output_url}
-    )
-    
-    return output_url
+    return output_url, stage_timings
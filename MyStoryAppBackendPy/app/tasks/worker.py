@@ -0,0 +1,56 @@
+"""
+Celery Worker 启动入口
+按 Settings 中的队列名、进程池和并发数启动 I/O Worker 或 CPU Worker:
+    
+    python -m app.tasks.worker io     # AI 扩展、配音等等待外部 API 的任务
+    python -m app.tasks.worker cpu    # ffmpeg 编码、合并等 CPU 密集任务
+
+其余参数原样传给 celery worker，例如 --loglevel=debug
+"""
+
+import os
+import sys
+
+from app.config import settings
+from app.services.ffmpeg_runner import get_render_slots
+from app.tasks import celery_app
+
+
+def cpu_concurrency() -> int:
+    """
+    CPU Worker 进程数
+    
+    CELERY_CPU_CONCURRENCY 为 0 时按核数计算：每个任务内部已经并发运行
+    get_render_slots() 个 ffmpeg，进程数 × 片段并发数约等于 CPU 核数
+    """
+    if settings.CELERY_CPU_CONCURRENCY > 0:
+        return settings.CELERY_CPU_CONCURRENCY
+    return max(1, (os.cpu_count() or 1) // get_render_slots())
+
+
+def worker_argv(kind: str) -> list:
+    """生成 celery worker 命令行参数"""
+    if kind == "io":
+        return [
+            "worker",
+            "--queues", settings.CELERY_IO_QUEUE,
+            "--pool", settings.CELERY_IO_POOL,
+            "--concurrency", str(settings.CELERY_IO_CONCURRENCY),
+            "--hostname", "io@%h"
+        ]
+    if kind == "cpu":
+        return [
+            "worker",
+            "--queues", settings.CELERY_CPU_QUEUE,
+            "--pool", "prefork",
+            "--concurrency", str(cpu_concurrency()),
+            "--hostname", "cpu@%h"
+        ]
+    raise ValueError(f"未知的 Worker 类型: {kind}（可选 io / cpu）")
+
+
+if __name__ == "__main__":
+    kind = sys.argv[1] if len(sys.argv) > 1 else "cpu"
+    celery_app.worker_main(
+        worker_argv(kind) + [f"--loglevel={settings.LOG_LEVEL}"] + sys.argv[2:]
+    )
@@ -0,0 +1,427 @@
+"""
+视频生成分布式工作流
+把一个视频拆成按幻灯片的 Celery 子任务（AI 扩展 → 片段编码、配音），
+通过 chord 汇总后由合并任务拼接，同一视频的幻灯片可以在不同机器上编码。
+子任务之间的中间产物（片段、配音）经共享存储 get_storage() 传递
+"""
+
+import time
+import uuid
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+from celery import chain, chord
+from celery.result import AsyncResult
+from redis import RedisError
+
+from app.tasks import celery_app
+from app.tasks.scheduler import fair_scheduler
+from app.tasks.video_tasks import CallbackTask
+from app.config import settings
+from app.core.logger import logger
+from app.core.redis import get_redis
+from app.models.schemas import Slide, VideoConfigRequest
+from app.services.bailian_image import bailian_image_service
+from app.services.bailian_tts import bailian_tts_service
+from app.services.cancellation import JobCancelled
+from app.services.checkpoint import JobCheckpoint
+from app.services.pipeline import ASSEMBLE_START, NODE_LABELS, NODE_WEIGHTS, PIPELINE_START
+from app.services.storage import get_storage
+from app.services.task_status import task_status_store
+from app.services.video_service import RESOLUTION_MAP, ProgressTracker, video_service
+
+
+class WorkflowProgress:
+    """
+    分布式工作流进度
+    
+    各子任务完成时在 Redis hash video:workflow:{task_id} 中累加计数，
+    汇总后写到合并任务的状态上，客户端只需跟踪一个 celery_task_id
+    """
+    
+    def __init__(self, task_id: str):
+        self.task_id = task_id
+        self.key = f"video:workflow:{task_id}"
+    
+    def init(self, totals: Dict[str, int]):
+        """记录各类子任务总数"""
+        try:
+            pipe = get_redis().pipeline()
+            pipe.delete(self.key)
+            pipe.hset(self.key, mapping={f"total:{kind}": count for kind, count in totals.items()})
+            pipe.expire(self.key, settings.CHECKPOINT_TTL)
+            pipe.execute()
+        except RedisError as e:
+            logger.warning(f"[工作流] 初始化进度失败: {self.task_id}, {e}")
+    
+    def advance(self, kind: str) -> Tuple[float, str]:
+        """
+        记录一个子任务完成
+        
+        Returns:
+            (整体进度, 进度消息)
+        """
+        try:
+            pipe = get_redis().pipeline()
+            pipe.hincrby(self.key, f"done:{kind}", 1)
+            pipe.hgetall(self.key)
+            _, data = pipe.execute()
+        except RedisError as e:
+            logger.warning(f"[工作流] 更新进度失败: {self.task_id}, {e}")
+            data = {}
+        
+        total = done = 0
+        parts = []
+        for node, label in NODE_LABELS.items():
+            count = int(data.get(f"total:{node}", 0))
+            if not count:
+                continue
+            finished = min(int(data.get(f"done:{node}", 0)), count)
+            total += NODE_WEIGHTS[node] * count
+            done += NODE_WEIGHTS[node] * finished
+            parts.append(f"{label} {finished}/{count}")
+        
+        fraction = done / total if total else 1.0
+        progress = PIPELINE_START + (ASSEMBLE_START["segments"] - PIPELINE_START) * fraction
+        return progress, " · ".join(parts)
+    
+    def clear(self):
+        """工作流结束后删除进度记录"""
+        try:
+            get_redis().delete(self.key)
+        except RedisError as e:
+            logger.warning(f"[工作流] 删除进度失败: {self.task_id}, {e}")
+
+
+class WorkflowIncomplete(Exception):
+    """合并时缺少部分幻灯片的片段（编码子任务重试用尽）"""
+    
+    def __init__(self, task_id: str, missing: list, errors: Dict[int, str]):
+        detail = "; ".join(f"幻灯片 {i}: {error}" for i, error in sorted(errors.items()))
+        super().__init__(f"幻灯片 {missing} 没有生成视频片段" + (f"（{detail}）" if detail else ""))
+        self.task_id = task_id
+        self.missing = missing
+
+
+class SlideTask(CallbackTask):
+    """
+    按幻灯片拆分的子任务
+    
+    同一个视频的其他子任务与 chord 仍在运行，子任务的重试与失败不修改整个任务的状态、
+    不释放调度槽位，由合并任务统一处理
+    """
+    
+    def retry_slide(self, index: int, exc: Exception, countdown: int) -> dict:
+        """
+        重试子任务；重试次数用尽时返回失败结果（不抛出异常，保证 chord 照常执行合并任务）
+        """
+        if self.request.retries >= self.max_retries:
+            logger.error(f"[工作流] 子任务重试次数用尽: {self.name} 幻灯片 {index}, {exc}")
+            return {"index": index, "error": str(exc)}
+        raise self.retry(exc=exc, countdown=countdown)
+
+
+def _report(task, root_id: str, task_id: str, kind: str):
+    """子任务完成后更新合并任务上的整体进度"""
+    progress, message = WorkflowProgress(task_id).advance(kind)
+    task.report(task_id, "processing", {"progress": progress, "message": message}, celery_task_id=root_id)
+
+
+def start_video_workflow(
+    task_id: str,
+    slides_data: list,
+    config_data: dict,
+    root_id: Optional[str] = None
+) -> AsyncResult:
+    """
+    提交分布式工作流
+    
+    每张幻灯片一条 扩展 → 编码 链，有配音文本的幻灯片另加一个配音任务，
+    全部完成后执行合并任务
+    
+    Args:
+        root_id: 合并任务的 Celery 任务ID，不传时自动生成
+    
+    Returns:
+        合并任务的 AsyncResult，各子任务的进度也写在它上面
+    """
+    config = VideoConfigRequest(**config_data)
+    root_id = root_id or str(uuid.uuid4())
+    
+    header = []
+    voices = 0
+    for i, slide_data in enumerate(slides_data):
+        if config.ai_image_expansion:
+            header.append(chain(
+                expand_slide_task.s(task_id, i, slide_data, config_data, root_id),
+                encode_slide_task.s(task_id, i, slide_data, config_data, root_id)
+            ))
+        else:
+            prepared = {"index": i, "image_url": slide_data["image_url"]}
+            header.append(encode_slide_task.s(prepared, task_id, i, slide_data, config_data, root_id))
+        
+        if slide_data.get("voice_text"):
+            header.append(voice_slide_task.s(task_id, i, slide_data, config_data, root_id))
+            voices += 1
+    
+    WorkflowProgress(task_id).init({
+        "expand": len(slides_data) if config.ai_image_expansion else 0,
+        "encode": len(slides_data),
+        "voice": voices
+    })
+    
+    # 各子任务没有统一的起点，以提交时间作为开始时间
+    task_status_store.update(task_id, started_at=time.time())
+    
+    logger.info(f"[工作流] 提交任务 {task_id}: {len(header)} 个子任务, 合并任务 {root_id}")
+    body = merge_video_task.s(task_id, slides_data, config_data).set(task_id=root_id)
+    return chord(header)(body)
+
+
+@celery_app.task(base=SlideTask, bind=True, max_retries=3)
+def expand_slide_task(self, task_id: str, index: int, slide_data: dict, config_data: dict, root_id: str) -> dict:
+    """
+    AI 扩展单张幻灯片
+    
+    失败时保留原图，不影响后续编码；其他异常重试，重试用尽时同样使用原图
+    
+    Returns:
+        {"index": 序号, "image_url": 编码使用的图片 URL}
+    """
+    try:
+        image_url = self.run_async(task_id, _expand_slide, task_id, index, slide_data, config_data)
+    except JobCancelled:
+        # 取消后由合并任务统一清理
+        return {"index": index, "cancelled": True}
+    except Exception as exc:
+        logger.exception(f"图片扩展子任务失败: {task_id} 幻灯片 {index}")
+        result = self.retry_slide(index, exc, countdown=10)
+        _report(self, root_id, task_id, "expand")
+        return {**result, "image_url": slide_data["image_url"]}
+    
+    _report(self, root_id, task_id, "expand")
+    return {"index": index, "image_url": image_url}
+
+
+async def _expand_slide(task_id: str, index: int, slide_data: dict, config_data: dict) -> str:
+    checkpoint = JobCheckpoint(task_id).load()
+    expanded_url = checkpoint.get(JobCheckpoint.EXPANDED, index)
+    if expanded_url:
+        return expanded_url
+    
+    image_url = slide_data["image_url"]
+    source = image_url
+    try:
+        # 原图下载失败同样使用原图，由编码任务重新下载并按自己的重试处理
+        source = await video_service.download_image(image_url, task_id, f"src_{index}")
+        expanded_url = await bailian_image_service.expand_image(
+            source,
+            VideoConfigRequest(**config_data).expansion_style.value
+        )
+        checkpoint.save(JobCheckpoint.EXPANDED, index, expanded_url)
+        return expanded_url
+    except Exception as e:
+        logger.warning(f"图片扩展失败，使用原图: 幻灯片 {index}, {e}")
+        return image_url
+    finally:
+        if source != image_url:
+            Path(source).unlink(missing_ok=True)
+
+
+@celery_app.task(base=SlideTask, bind=True, max_retries=3)
+def encode_slide_task(
+    self,
+    prepared: dict,
+    task_id: str,
+    index: int,
+    slide_data: dict,
+    config_data: dict,
+    root_id: str
+) -> dict:
+    """
+    编码单张幻灯片片段并上传到共享存储
+    
+    Args:
+        prepared: 上一步（扩展任务）的结果，含编码使用的图片 URL
+    
+    Returns:
+        {"index": 序号, "segment_url": 片段在共享存储中的 URL}，重试用尽时为 {"index": 序号, "error": 错误}
+    """
+    try:
+        segment_url = self.run_async(
+            task_id, _encode_slide, prepared.get("image_url"), task_id, index, slide_data, config_data
+        )
+    except JobCancelled:
+        return {"index": index, "cancelled": True}
+    except Exception as exc:
+        logger.exception(f"片段编码失败: {task_id} 幻灯片 {index}")
+        return self.retry_slide(index, exc, countdown=10)
+    
+    _report(self, root_id, task_id, "encode")
+    return {"index": index, "segment_url": segment_url}
+
+
+async def _encode_slide(image_url: str, task_id: str, index: int, slide_data: dict, config_data: dict) -> str:
+    checkpoint = JobCheckpoint(task_id).load()
+    segment_url = checkpoint.get(JobCheckpoint.SEGMENT_URL, index)
+    if segment_url:
+        return segment_url
+    
+    slide = Slide(**slide_data)
+    config = VideoConfigRequest(**config_data)
+    width, height = RESOLUTION_MAP.get(config.resolution.value, (1280, 720))
+    
+    image_path = await video_service.download_image(image_url, task_id, f"src_{index}")
+    normalized = image_path
+    try:
+        normalized = await video_service.normalize_image(image_path, width, height, task_id, index)
+        segment = await video_service.create_slide_video(
+            slide, width, height, config, index, task_id,
+            image_path=normalized
+        )
+        try:
+            segment_url = await get_storage().upload_file(
+                str(segment),
+                f"segment_{task_id}_{index}.mp4",
+                "video/mp4"
+            )
+        finally:
+            segment.unlink(missing_ok=True)
+    finally:
+        if image_path != image_url:
+            Path(image_path).unlink(missing_ok=True)
+        if normalized != image_path:
+            Path(normalized).unlink(missing_ok=True)
+    
+    checkpoint.save(JobCheckpoint.SEGMENT_URL, index, segment_url)
+    return segment_url
+
+
+@celery_app.task(base=SlideTask, bind=True)
+def voice_slide_task(self, task_id: str, index: int, slide_data: dict, config_data: dict, root_id: str) -> dict:
+    """
+    生成单张幻灯片的配音并上传到共享存储，失败不影响其他幻灯片
+    
+    Returns:
+        {"index": 序号, "voice_url": 配音 URL，失败时为 None}
+    """
+    try:
+        voice_url = self.run_async(task_id, _voice_slide, task_id, index, slide_data, config_data)
+    except JobCancelled:
+        return {"index": index, "cancelled": True}
+    _report(self, root_id, task_id, "voice")
+    return {"index": index, "voice_url": voice_url}
+
+
+async def _voice_slide(task_id: str, index: int, slide_data: dict, config_data: dict):
+    checkpoint = JobCheckpoint(task_id).load()
+    voice_url = checkpoint.get(JobCheckpoint.VOICE, index)
+    if voice_url:
+        return voice_url
+    
+    config = VideoConfigRequest(**config_data)
+    try:
+        tts_result = await bailian_tts_service.generate_speech(
+            slide_data["voice_text"],
+            config.voice_type.value,
+            config.voice_speed
+        )
+        voice_url = await get_storage().upload_file(
+            tts_result["path"],
+            f"voice_{task_id}_{index}.mp3",
+            "audio/mpeg"
+        )
+    except Exception as e:
+        logger.warning(f"配音生成失败: 幻灯片 {index}, {e}")
+        return None
+    
+    checkpoint.save(JobCheckpoint.VOICE, index, voice_url)
+    return voice_url
+
+
+@celery_app.task(base=CallbackTask, bind=True, max_retries=3)
+def merge_video_task(self, results: list, task_id: str, slides_data: list, config_data: dict):
+    """
+    合并所有片段
+    
+    Args:
+        results: chord 汇总的子任务结果（片段与配音）
+    """
+    try:
+        output_url = self.run_async(task_id, _merge_video, self, results, task_id, slides_data, config_data)
+    except JobCancelled:
+        WorkflowProgress(task_id).clear()
+        return self.cancelled(task_id)
+    except WorkflowIncomplete as exc:
+        # 缺少的片段重试合并也无法补齐，直接记为失败
+        logger.error(f"视频合并失败: {task_id}, {exc}")
+        WorkflowProgress(task_id).clear()
+        task_status_store.update(task_id, "failed", message="视频生成失败", error=str(exc))
+        fair_scheduler.release(task_id)
+        return {"success": False, "task_id": task_id, "error": str(exc)}
+    except Exception as exc:
+        logger.exception(f"视频合并失败: {task_id}")
+        self.retry_or_fail(task_id, exc, countdown=60)
+    
+    fair_scheduler.release(task_id)
+    return {"success": True, "task_id": task_id, "output_url": output_url}
+
+
+async def _merge_video(task, results: list, task_id: str, slides_data: list, config_data: dict) -> str:
+    slides = [Slide(**slide) for slide in slides_data]
+    config = VideoConfigRequest(**config_data)
+    storage = get_storage()
+    
+    segment_urls = {}
+    errors = {}
+    cancelled = False
+    for result in results:
+        if "segment_url" in result:
+            segment_urls[result["index"]] = result["segment_url"]
+        elif result.get("voice_url"):
+            slides[result["index"]].voice_url = result["voice_url"]
+        elif "error" in result:
+            errors[result["index"]] = result["error"]
+        cancelled = cancelled or bool(result.get("cancelled"))
+    
+    missing = [i for i in range(len(slides)) if i not in segment_urls]
+    if missing:
+        # 子任务在取消后退出时同样没有片段
+        if cancelled:
+            raise JobCancelled(task_id)
+        raise WorkflowIncomplete(task_id, missing, errors)
+    
+    async def progress_callback(progress: float, message: str):
+        task.report(task_id, "processing", {"progress": progress, "message": message})
+    
+    progress = ProgressTracker(progress_callback)
+    start = ASSEMBLE_START["segments"]
+    await progress.report(start, "下载视频片段...", force=True)
+    
+    slide_videos = []
+    for i in range(len(slides)):
+        local_path = Path(settings.OUTPUT_DIR) / f"temp_{task_id}_slide_{i}.mp4"
+        await storage.download_file(segment_urls[i], str(local_path))
+        slide_videos.append(local_path)
+    
+    output_url = await video_service.assemble_video(
+        slides, config, task_id, f"video_{task_id}.mp4", progress,
+        slide_videos=slide_videos, start=start
+    )
+    
+    # 合并成功后再删除共享存储中的片段，重试时仍可使用
+    for url in segment_urls.values():
+        await storage.delete_file(url)
+    JobCheckpoint(task_id).clear()
+    WorkflowProgress(task_id).clear()
+    
+    task.report(
+        task_id,
+        "completed",
+        {
+            "progress": 1.0,
+            "message": "视频生成完成！",
+            "output_url": output_url
+        }
+    )
+    return output_url
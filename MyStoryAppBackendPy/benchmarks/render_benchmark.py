@@ -0,0 +1,173 @@
+"""
+视频渲染基准测试
+对比渲染引擎 segments（逐页片段 + concat 合并）/ filtergraph（单次编码）
+与编码模式 standard / still（静态幻灯片优化）的组合
+
+用法:
+    python benchmarks/render_benchmark.py --slides 20 --resolution 1080p --runs 3
+
+统计指标:
+    wall_time      合成耗时（秒，取多次运行的中位数）
+    bytes_written  ffmpeg 写入磁盘的总字节数（中间片段 + 合并结果）
+    output_size    最终视频大小
+    ssim           与 segments/standard 输出对比的 SSIM（1.0 为完全一致）
+"""
+
+import argparse
+import asyncio
+import os
+import re
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+WORK_DIR = Path(tempfile.mkdtemp(prefix="render_bench_"))
+os.environ["OUTPUT_DIR"] = str(WORK_DIR / "output")
+os.environ["SEGMENT_CACHE_ENABLED"] = "false"
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.config import settings  # noqa: E402
+from app.models.schemas import Slide, VideoConfigRequest  # noqa: E402
+from app.services import video_service as video_module  # noqa: E402
+
+
+class WriteCounter:
+    """统计每次 ffmpeg 调用写出的文件大小"""
+
+    def __init__(self):
+        self.bytes_written = 0
+        self._run_ffmpeg = video_module.run_ffmpeg
+
+    async def __call__(self, cmd, *args, **kwargs):
+        await self._run_ffmpeg(cmd, *args, **kwargs)
+        output = next(a for a in reversed(cmd) if a.endswith(".mp4"))
+        self.bytes_written += Path(output).stat().st_size
+
+
+def make_deck(count: int, size: str) -> list:
+    """生成合成幻灯片图片（模拟手机拍摄的大尺寸照片）"""
+    deck_dir = WORK_DIR / "deck"
+    deck_dir.mkdir(parents=True, exist_ok=True)
+
+    paths = []
+    for i in range(count):
+        path = deck_dir / f"slide_{i}.jpg"
+        subprocess.run(
+            [
+                "ffmpeg", "-loglevel", "error", "-y",
+                "-f", "lavfi", "-i", f"testsrc2=size={size}:rate=1",
+                "-vf", f"hue=h={i * 37 % 360}",
+                "-frames:v", "1", str(path)
+            ],
+            check=True
+        )
+        paths.append(str(path))
+    return paths
+
+
+def measure_ssim(output: Path, reference: Path, frame_rate: int) -> float:
+    """计算 SSIM，先统一为恒定帧率以对齐可变帧率输出"""
+    result = subprocess.run(
+        [
+            "ffmpeg", "-i", str(output), "-i", str(reference),
+            "-lavfi", f"[0:v]fps={frame_rate}[a];[1:v]fps={frame_rate}[b];[a][b]ssim",
+            "-f", "null", "-"
+        ],
+        capture_output=True,
+        text=True,
+        check=True
+    )
+    match = re.search(r"All:([0-9.]+)", result.stderr)
+    return float(match.group(1)) if match else float("nan")
+
+
+async def run_case(
+    engine: str,
+    mode: str,
+    slides: list,
+    config: VideoConfigRequest,
+    task_id: str
+) -> dict:
+    """运行一次合成"""
+    settings.VIDEO_RENDER_ENGINE = engine
+    settings.VIDEO_ENCODE_MODE = mode
+    counter = WriteCounter()
+    video_module.run_ffmpeg = counter
+    try:
+        start = time.perf_counter()
+        url = await video_module.video_service.compose_video(slides, config, task_id)
+        wall_time = time.perf_counter() - start
+    finally:
+        video_module.run_ffmpeg = counter._run_ffmpeg
+
+    output = Path(settings.OUTPUT_DIR) / url.split("/")[-1]
+    return {
+        "wall_time": wall_time,
+        "bytes_written": counter.bytes_written,
+        "output_size": output.stat().st_size,
+        "output": output
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="视频渲染引擎基准测试")
+    parser.add_argument("--slides", type=int, default=10, help="幻灯片数量")
+    parser.add_argument("--duration", type=int, default=5, help="每页时长(秒)")
+    parser.add_argument("--resolution", default="1080p", help="输出分辨率")
+    parser.add_argument("--source-size", default="4032x3024", help="源图片尺寸")
+    parser.add_argument("--captions", action="store_true", help="启用字幕（需要 ffmpeg 支持 drawtext）")
+    parser.add_argument("--runs", type=int, default=3, help="每种组合的运行次数")
+    args = parser.parse_args()
+
+    images = make_deck(args.slides, args.source_size)
+    slides = [
+        Slide(
+            id=str(i),
+            image_url=path,
+            caption=f"第 {i + 1} 页" if args.captions else "",
+            duration=args.duration
+        )
+        for i, path in enumerate(images)
+    ]
+    config = VideoConfigRequest(
+        resolution=args.resolution,
+        subtitle_enabled=args.captions,
+        background_music="none",
+        ai_image_expansion=False
+    )
+
+    print(f"幻灯片: {args.slides} x {args.duration}s, 分辨率: {args.resolution}, 源图: {args.source_size}")
+    print(
+        f"{'engine':<12} {'mode':<9} {'wall_time(s)':>12} "
+        f"{'bytes_written':>14} {'output_size':>12} {'ssim':>8}"
+    )
+
+    try:
+        reference = None
+        for engine in ("segments", "filtergraph"):
+            for mode in ("standard", "still"):
+                runs = [
+                    await run_case(engine, mode, slides, config, f"bench_{engine}_{mode}_{n}")
+                    for n in range(args.runs)
+                ]
+                output = runs[0]["output"]
+                # 第一个组合 segments/standard 即当前默认路径，作为质量基准
+                reference = reference or output
+                ssim = measure_ssim(output, reference, config.frame_rate)
+                print(
+                    f"{engine:<12} {mode:<9} "
+                    f"{statistics.median(r['wall_time'] for r in runs):>12.2f} "
+                    f"{runs[0]['bytes_written']:>14,} "
+                    f"{runs[0]['output_size']:>12,} "
+                    f"{ssim:>8.4f}"
+                )
+    finally:
+        shutil.rmtree(WORK_DIR, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
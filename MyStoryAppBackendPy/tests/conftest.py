@@ -0,0 +1,39 @@
+"""
+测试公共夹具
+Redis 使用 fakeredis（含 Lua 支持），文件目录指向临时目录，不依赖外部服务
+"""
+
+import sys
+
+import fakeredis
+import pytest
+
+from app.config import settings
+
+
+@pytest.fixture
+def redis(monkeypatch):
+    """内存 Redis，替换所有已导入模块中的 get_redis / get_async_redis（共用同一份数据）"""
+    server = fakeredis.FakeServer()
+    client = fakeredis.FakeRedis(server=server, decode_responses=True)
+    async_client = fakeredis.FakeAsyncRedis(server=server, decode_responses=True)
+    for name, module in list(sys.modules.items()):
+        if not name.startswith("app"):
+            continue
+        if callable(getattr(module, "get_redis", None)):
+            monkeypatch.setattr(module, "get_redis", lambda: client)
+        if callable(getattr(module, "get_async_redis", None)):
+            monkeypatch.setattr(module, "get_async_redis", lambda: async_client)
+    return client
+
+
+@pytest.fixture
+def dirs(tmp_path, monkeypatch):
+    """上传/输出目录指向临时目录"""
+    upload_dir = tmp_path / "uploads"
+    output_dir = tmp_path / "output"
+    upload_dir.mkdir()
+    output_dir.mkdir()
+    monkeypatch.setattr(settings, "UPLOAD_DIR", str(upload_dir))
+    monkeypatch.setattr(settings, "OUTPUT_DIR", str(output_dir))
+    return tmp_path
@@ -0,0 +1,57 @@
+"""
+取消任务后的中间文件清理
+"""
+
+import pytest
+
+from app.services import cancellation
+from app.services.cancellation import cleanup_task_files
+from app.services.checkpoint import JobCheckpoint
+
+
+class FakeStorage:
+    def __init__(self):
+        self.deleted = []
+    
+    async def delete_file(self, url: str) -> bool:
+        self.deleted.append(url)
+        return True
+
+
+@pytest.fixture
+def storage(monkeypatch):
+    fake = FakeStorage()
+    monkeypatch.setattr(cancellation, "get_storage", lambda: fake)
+    return fake
+
+
+async def test_local_segments_are_never_sent_to_storage(redis, dirs, storage):
+    output = dirs / "output"
+    kept = output / "temp_task_slide_0.mp4"
+    kept.write_bytes(b"segment")
+    
+    checkpoint = JobCheckpoint("task")
+    checkpoint.save(JobCheckpoint.SEGMENT, 0, str(kept))
+    # 已被重试删除的本地片段
+    checkpoint.save(JobCheckpoint.SEGMENT, 1, str(output / "temp_task_slide_1.mp4"))
+    checkpoint.save(JobCheckpoint.VOICE, 0, "/output/tts_shared.mp3")
+    
+    await cleanup_task_files("task")
+    
+    assert not kept.exists()
+    assert storage.deleted == []
+    assert not redis.exists(checkpoint.key)
+
+
+async def test_uploaded_segments_and_voices_are_deleted_from_storage(redis, dirs, storage):
+    checkpoint = JobCheckpoint("task")
+    checkpoint.save(JobCheckpoint.SEGMENT_URL, 0, "https://oss/segment_task_0.mp4")
+    checkpoint.save(JobCheckpoint.VOICE, 0, "https://oss/voice_task_0.mp3")
+    checkpoint.save(JobCheckpoint.VOICE, 1, "https://oss/tts_shared.mp3")
+    
+    await cleanup_task_files("task")
+    
+    assert sorted(storage.deleted) == [
+        "https://oss/segment_task_0.mp4",
+        "https://oss/voice_task_0.mp3"
+    ]
@@ -0,0 +1,68 @@
+"""
+任务检查点：保存、加载与重试时跳过已完成的片段
+"""
+
+from app.config import settings
+from app.models.schemas import Slide, VideoConfigRequest
+from app.services.checkpoint import JobCheckpoint
+from app.services.pipeline import SlidePipeline
+
+
+def test_save_and_load(redis):
+    checkpoint = JobCheckpoint("task")
+    checkpoint.save(JobCheckpoint.EXPANDED, 0, "https://oss/exp_0.png")
+    checkpoint.save(JobCheckpoint.VOICE, 2, "/output/tts_a.mp3")
+    checkpoint.save(JobCheckpoint.SEGMENT, 0, "/tmp/seg_0.mp4")
+    checkpoint.save(JobCheckpoint.SEGMENT_URL, 1, "https://oss/seg_1.mp4")
+    
+    # 重试时的新实例
+    loaded = JobCheckpoint("task").load()
+    assert loaded.get(JobCheckpoint.EXPANDED, 0) == "https://oss/exp_0.png"
+    assert loaded.get(JobCheckpoint.EXPANDED, 1) is None
+    assert loaded.items(JobCheckpoint.SEGMENT) == {0: "/tmp/seg_0.mp4"}
+    assert loaded.items(JobCheckpoint.SEGMENT_URL) == {1: "https://oss/seg_1.mp4"}
+    assert loaded.count(JobCheckpoint.VOICE) == 1
+    assert 0 < redis.ttl(loaded.key) <= settings.CHECKPOINT_TTL
+
+
+def test_clear(redis):
+    checkpoint = JobCheckpoint("task")
+    checkpoint.save(JobCheckpoint.VOICE, 0, "/output/tts_a.mp3")
+    checkpoint.clear()
+    assert not redis.exists(checkpoint.key)
+    assert JobCheckpoint("task").load().get(JobCheckpoint.VOICE, 0) is None
+
+
+def test_pipeline_restores_segments_and_voices(redis, dirs, monkeypatch):
+    monkeypatch.setattr(settings, "VIDEO_RENDER_ENGINE", "segments")
+    segment = dirs / "output" / "temp_task_slide_0.mp4"
+    segment.write_bytes(b"segment")
+    
+    checkpoint = JobCheckpoint("task")
+    checkpoint.save(JobCheckpoint.SEGMENT, 0, str(segment))
+    # 片段文件已被删除（如换了机器），需要重新编码
+    checkpoint.save(JobCheckpoint.SEGMENT, 1, str(dirs / "output" / "temp_task_slide_1.mp4"))
+    checkpoint.save(JobCheckpoint.VOICE, 1, "/output/tts_b.mp3")
+    
+    slides = [
+        Slide(id=str(i), image_url=f"{i}.jpg", voice_text="你好")
+        for i in range(3)
+    ]
+    pipeline = SlidePipeline(
+        slides, VideoConfigRequest(ai_image_expansion=True), "task", JobCheckpoint("task").load()
+    )
+    restored = pipeline._plan()
+    
+    assert restored == {0: segment}
+    assert slides[1].voice_url == "/output/tts_b.mp3"
+    assert slides[0].voice_url is None
+    
+    fractions = pipeline._fractions
+    # 已编码的幻灯片跳过整条图片链路
+    assert fractions[("encode", 0)] == 1.0
+    assert ("download", 0) not in fractions
+    assert ("expand", 0) not in fractions
+    for node in ("download", "expand", "normalize", "encode"):
+        assert fractions[(node, 1)] == 0.0
+    assert fractions[("voice", 1)] == 1.0
+    assert fractions[("voice", 0)] == fractions[("voice", 2)] == 0.0
@@ -0,0 +1,190 @@
+"""
+百炼任务轮询：查询间隔、超时、失败与跨事件循环共用
+"""
+
+import asyncio
+import threading
+from contextlib import asynccontextmanager
+
+import httpx
+import pytest
+
+from app.config import settings
+from app.services import dashscope_poller as poller_module
+from app.services.dashscope_poller import BACKOFF_FACTOR, DashScopePoller, _PendingTask
+
+
+class FakeLimiter:
+    @asynccontextmanager
+    async def limit(self, kind: str):
+        yield
+
+
+class FakeHttp:
+    """按任务 ID 依次返回预设的状态"""
+    
+    def __init__(self, statuses: dict):
+        self.statuses = statuses
+        self.requests = []
+        self.threads = []
+        self.client = httpx.AsyncClient(transport=httpx.MockTransport(self._handle))
+    
+    def _handle(self, request: httpx.Request) -> httpx.Response:
+        task_id = request.url.path.rsplit("/", 1)[-1]
+        self.requests.append(task_id)
+        self.threads.append((task_id, threading.get_ident()))
+        statuses = self.statuses[task_id]
+        status = statuses.pop(0) if len(statuses) > 1 else statuses[0]
+        if isinstance(status, int):
+            return httpx.Response(status)
+        if isinstance(status, bytes):
+            return httpx.Response(200, content=status)
+        return httpx.Response(200, json={"output": {"task_status": status, "message": f"{status} 原因"}})
+    
+    def get(self) -> httpx.AsyncClient:
+        return self.client
+
+
+@pytest.fixture
+def fast(monkeypatch):
+    monkeypatch.setattr(settings, "DASHSCOPE_POLL_MIN_INTERVAL", 0.01)
+    monkeypatch.setattr(settings, "DASHSCOPE_POLL_MAX_INTERVAL", 0.05)
+    monkeypatch.setattr(settings, "DASHSCOPE_POLL_TIMEOUT", 5.0)
+    monkeypatch.setattr(poller_module, "dashscope_limiter", FakeLimiter())
+
+
+def _use_http(monkeypatch, statuses: dict) -> FakeHttp:
+    http = FakeHttp(statuses)
+    monkeypatch.setattr(poller_module, "dashscope_http", http)
+    return http
+
+
+def _pending(polls: int = 0) -> _PendingTask:
+    return _PendingTask(
+        task_id="t", kind="image", future=None, loop=None, submitted_at=0.0,
+        next_poll=0.0, interval=settings.DASHSCOPE_POLL_MIN_INTERVAL, polls=polls
+    )
+
+
+def test_next_delay_backs_off_without_history():
+    poller = DashScopePoller()
+    pending = _pending()
+    assert poller._next_delay(pending, 0.0) == settings.DASHSCOPE_POLL_MIN_INTERVAL
+    
+    pending.polls = 1
+    delays = [poller._next_delay(pending, 0.0) for _ in range(10)]
+    assert delays[0] == pytest.approx(settings.DASHSCOPE_POLL_MIN_INTERVAL * BACKOFF_FACTOR)
+    assert delays[1] == pytest.approx(settings.DASHSCOPE_POLL_MIN_INTERVAL * BACKOFF_FACTOR ** 2)
+    assert delays[-1] == settings.DASHSCOPE_POLL_MAX_INTERVAL
+
+
+def test_next_delay_follows_duration_quantiles():
+    poller = DashScopePoller()
+    for seconds in range(1, 101):
+        poller._record_duration("image", float(seconds))
+    
+    # p10 = 10s
+    assert poller._next_delay(_pending(), 0.0) == pytest.approx(10.0)
+    # 已经过 p10，下一个分位点 p25 = 25s，间隔以最长间隔为上限
+    assert poller._next_delay(_pending(polls=1), 9.0) == settings.DASHSCOPE_POLL_MAX_INTERVAL
+    # p50 = 50s
+    assert poller._next_delay(_pending(polls=1), 45.0) == pytest.approx(5.0)
+    # 超过 p99 后按指数退避
+    assert poller._next_delay(_pending(polls=1), 100.0) == pytest.approx(
+        settings.DASHSCOPE_POLL_MIN_INTERVAL * BACKOFF_FACTOR
+    )
+
+
+def test_next_delay_ignores_few_samples():
+    poller = DashScopePoller()
+    for seconds in range(1, 5):
+        poller._record_duration("image", float(seconds * 10))
+    assert poller._next_delay(_pending(), 0.0) == settings.DASHSCOPE_POLL_MIN_INTERVAL
+
+
+async def test_wait_returns_output_on_success(fast, monkeypatch):
+    http = _use_http(monkeypatch, {"t1": ["RUNNING", 500, "PENDING", "SUCCEEDED"]})
+    poller = DashScopePoller()
+    
+    output = await poller.wait("t1", "image")
+    
+    assert output["task_status"] == "SUCCEEDED"
+    assert http.requests == ["t1"] * 4
+    stats = poller.stats()
+    assert (stats["polls"], stats["errors"], stats["succeeded"], stats["pending"]) == (4, 1, 1, 0)
+    assert stats["durations"]["image"]["samples"] == 1
+
+
+@pytest.mark.parametrize("status", ["FAILED", "CANCELED", "UNKNOWN"])
+async def test_failed_task_raises(fast, monkeypatch, status):
+    _use_http(monkeypatch, {"t1": ["RUNNING", status]})
+    poller = DashScopePoller()
+    
+    with pytest.raises(RuntimeError, match=f"{status} 原因"):
+        await poller.wait("t1", "tts")
+    assert poller.stats()["failed"] == 1
+    assert "tts" not in poller.stats()["durations"]
+
+
+async def test_deadline_raises_timeout(fast, monkeypatch):
+    monkeypatch.setattr(settings, "DASHSCOPE_POLL_TIMEOUT", 0.2)
+    _use_http(monkeypatch, {"t1": ["RUNNING"]})
+    poller = DashScopePoller()
+    
+    with pytest.raises(TimeoutError):
+        await poller.wait("t1", "image")
+    stats = poller.stats()
+    assert stats["timeouts"] == 1
+    assert stats["pending"] == 0
+
+
+async def test_concurrent_tasks_are_polled_together(fast, monkeypatch):
+    http = _use_http(monkeypatch, {"a": ["RUNNING", "SUCCEEDED"], "b": ["FAILED"]})
+    poller = DashScopePoller()
+    
+    results = await asyncio.gather(poller.wait("a", "image"), poller.wait("b", "image"), return_exceptions=True)
+    
+    assert results[0]["task_status"] == "SUCCEEDED"
+    assert isinstance(results[1], RuntimeError)
+    assert sorted(http.requests) == ["a", "a", "b"]
+
+
+async def test_unparsable_response_keeps_polling(fast, monkeypatch):
+    http = _use_http(monkeypatch, {"t1": [b"<html>gateway error</html>", "SUCCEEDED"]})
+    poller = DashScopePoller()
+    
+    output = await asyncio.wait_for(poller.wait("t1", "image"), 2)
+    
+    assert output["task_status"] == "SUCCEEDED"
+    assert http.requests == ["t1", "t1"]
+    assert poller.stats()["errors"] == 1
+
+
+async def test_waiters_on_other_loops_share_one_runner(fast, monkeypatch):
+    http = _use_http(monkeypatch, {"a": ["RUNNING", "SUCCEEDED"], "b": ["RUNNING"] * 8 + ["SUCCEEDED"]})
+    poller = DashScopePoller()
+    registered = threading.Event()
+    results = {}
+    
+    async def wait_in_thread():
+        task = asyncio.ensure_future(poller.wait("a", "image"))
+        await asyncio.sleep(0)
+        registered.set()
+        results["a"] = await task
+        # 等 b 也被这个事件循环上的轮询协程查询过之后再结束
+        while ("b", threading.get_ident()) not in http.threads:
+            await asyncio.sleep(0.01)
+    
+    thread = threading.Thread(target=asyncio.run, args=(wait_in_thread(),))
+    thread.start()
+    registered.wait()
+    
+    # 在另一个事件循环中等待：由已有的轮询协程查询，该循环结束后轮询转移到这里
+    results["b"] = await asyncio.wait_for(poller.wait("b", "image"), 3)
+    await asyncio.to_thread(thread.join)
+    
+    assert results["a"]["task_status"] == results["b"]["task_status"] == "SUCCEEDED"
+    b_threads = [ident for task_id, ident in http.threads if task_id == "b"]
+    assert b_threads[0] == thread.ident
+    assert b_threads[-1] == threading.get_ident()
+    assert poller.stats()["pending"] == 0
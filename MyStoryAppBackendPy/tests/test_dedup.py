@@ -0,0 +1,83 @@
+"""
+视频任务去重
+"""
+
+from app.config import settings
+from app.models.schemas import VideoCreateRequest
+from app.services.dedup import job_deduplicator
+
+
+def _request(**overrides) -> VideoCreateRequest:
+    data = {
+        "title": "旅行",
+        "slides": [{"image_url": "a.jpg", "caption": "第一天", "voice_text": "出发"}],
+        "config": {"resolution": "720p"},
+        **overrides
+    }
+    return VideoCreateRequest(**data)
+
+
+def test_claim_returns_existing_task(redis):
+    key = job_deduplicator.make_key(_request(), user_id=1)
+    assert job_deduplicator.claim(key, "first") is None
+    assert job_deduplicator.claim(key, "second") == "first"
+    assert 0 < redis.ttl(key) <= settings.VIDEO_DEDUP_TTL
+
+
+def test_replace_points_to_new_task(redis):
+    key = job_deduplicator.make_key(_request(), user_id=1)
+    job_deduplicator.claim(key, "failed")
+    job_deduplicator.replace(key, "retry")
+    assert job_deduplicator.claim(key, "third") == "retry"
+
+
+def test_release_only_own_claim(redis):
+    key = job_deduplicator.make_key(_request(), user_id=1)
+    job_deduplicator.claim(key, "first")
+    
+    # 指纹已指向其他任务时不释放
+    job_deduplicator.release(key, "other")
+    assert job_deduplicator.claim(key, "second") == "first"
+    
+    job_deduplicator.release(key, "first")
+    assert job_deduplicator.claim(key, "second") is None
+
+
+def test_anonymous_requests_need_idempotency_key():
+    # 匿名请求不按请求内容去重
+    assert job_deduplicator.make_key(_request()) is None
+    assert job_deduplicator.make_key(_request(), client="10.0.0.1") is None
+    
+    key = job_deduplicator.make_key(_request(), "abc", client="10.0.0.1")
+    assert key == job_deduplicator.make_key(_request(config={"resolution": "1080p"}), "abc", client="10.0.0.1")
+    assert key != job_deduplicator.make_key(_request(), "abc", client="10.0.0.2")
+    assert key != job_deduplicator.make_key(_request(), "abc", user_id=1)
+
+
+def test_keys_are_scoped_per_user():
+    assert job_deduplicator.make_key(_request(), user_id=1) != job_deduplicator.make_key(_request(), user_id=2)
+    assert (
+        job_deduplicator.make_key(_request(), "abc", user_id=1)
+        != job_deduplicator.make_key(_request(), "abc", user_id=2)
+    )
+
+
+def test_preview_flag_changes_fingerprint():
+    plain = job_deduplicator.make_key(_request(), user_id=1)
+    assert job_deduplicator.make_key(_request(preview=True), user_id=1) != plain
+    assert job_deduplicator.make_key(_request(preview=False), user_id=1) == plain
+
+
+def test_fingerprint_covers_slides_and_config():
+    plain = job_deduplicator.make_key(_request(), user_id=1)
+    assert job_deduplicator.make_key(_request(title="另一个标题"), user_id=1) == plain
+    assert job_deduplicator.make_key(_request(config={"resolution": "1080p"}), user_id=1) != plain
+    assert job_deduplicator.make_key(
+        _request(slides=[{"image_url": "b.jpg", "caption": "第一天", "voice_text": "出发"}]), user_id=1
+    ) != plain
+
+
+def test_idempotency_key_takes_precedence():
+    first = job_deduplicator.make_key(_request(), "abc", user_id=1)
+    assert job_deduplicator.make_key(_request(config={"resolution": "1080p"}), "abc", user_id=1) == first
+    assert job_deduplicator.make_key(_request(), "xyz", user_id=1) != first
@@ -0,0 +1,75 @@
+"""
+片段编码参数：still 编码模式
+"""
+
+import pytest
+
+from app.config import settings
+from app.models.schemas import Slide, VideoConfigRequest
+from app.services import video_service as video_module
+from app.services.video_service import STILL_GOP_SECONDS, video_service
+
+
+class FakeFFmpeg:
+    """代替 run_ffmpeg：记录命令行"""
+    
+    def __init__(self):
+        self.cmds = []
+    
+    async def __call__(self, cmd, *args, **kwargs):
+        self.cmds.append(cmd)
+
+
+def _option(cmd: list, name: str):
+    """命令行中某个选项的值，不存在时为 None"""
+    return cmd[cmd.index(name) + 1] if name in cmd else None
+
+
+@pytest.fixture
+def encode(dirs, monkeypatch):
+    fake = FakeFFmpeg()
+    monkeypatch.setattr(video_module, "run_ffmpeg", fake)
+    monkeypatch.setattr(settings, "SEGMENT_CACHE_ENABLED", False)
+    
+    image = dirs / "image.png"
+    image.write_bytes(b"image")
+    
+    async def run(mode: str, frame_rate: int = 30) -> list:
+        monkeypatch.setattr(settings, "VIDEO_ENCODE_MODE", mode)
+        await video_service.create_slide_video(
+            Slide(id="1", image_url=str(image), caption="hi"),
+            1280, 720, VideoConfigRequest(frame_rate=frame_rate), 0, "task", image_path=str(image)
+        )
+        return fake.cmds[-1]
+    
+    return run
+
+
+async def test_still_mode_arguments(encode):
+    cmd = await encode("still", frame_rate=25)
+    assert _option(cmd, "-tune") == "stillimage"
+    assert _option(cmd, "-g") == str(25 * STILL_GOP_SECONDS)
+    assert _option(cmd, "-fps_mode") == "vfr"
+    assert _option(cmd, "-vf").endswith(",mpdecimate")
+    assert _option(cmd, "-vcodec") == "libx264"
+
+
+async def test_standard_mode_arguments(encode):
+    cmd = await encode("standard")
+    for name in ("-tune", "-g", "-fps_mode"):
+        assert name not in cmd
+    assert "mpdecimate" not in _option(cmd, "-vf")
+    assert _option(cmd, "-pix_fmt") == "yuv420p"
+
+
+def test_single_pass_uses_same_options(monkeypatch):
+    """单次编码引擎与逐页片段使用相同的编码参数"""
+    monkeypatch.setattr(settings, "VIDEO_ENCODE_MODE", "still")
+    options = video_service._encoder_options(VideoConfigRequest(frame_rate=30))
+    assert options == {
+        "vcodec": "libx264",
+        "pix_fmt": "yuv420p",
+        "tune": "stillimage",
+        "g": 30 * STILL_GOP_SECONDS,
+        "fps_mode": "vfr"
+    }
@@ -0,0 +1,105 @@
+"""
+任务耗时预估：默认值、指数滑动平均与剩余时间修正
+"""
+
+from types import SimpleNamespace
+
+import pytest
+
+from app.services import eta
+from app.services.eta import DEFAULT_RATES, RATES_KEY, SAMPLES_KEY, JobFeatures, eta_estimator
+
+
+def _features(**overrides) -> JobFeatures:
+    data = {
+        "resolution": "720p",
+        "frame_rate": 30,
+        "expansion": False,
+        "slides": 4,
+        "video_seconds": 10.0,
+        "text_chars": 100,
+        **overrides
+    }
+    return JobFeatures(**data)
+
+
+def test_predict_uses_defaults_without_history(redis):
+    expected = (
+        DEFAULT_RATES["encode"] * 10
+        + DEFAULT_RATES["concat"] * 10
+        + DEFAULT_RATES["voice"] * 100
+    )
+    assert eta_estimator.predict(_features()) == pytest.approx(expected)
+    
+    # 其他分辨率按像素吞吐量折算编码耗时，扩展按图片数
+    scaled = eta_estimator.predict(_features(resolution="1080p", expansion=True))
+    assert scaled == pytest.approx(
+        (DEFAULT_RATES["encode"] + DEFAULT_RATES["concat"]) * 10 * 2.25
+        + DEFAULT_RATES["expand"] * 4
+        + DEFAULT_RATES["voice"] * 100
+    )
+
+
+def test_record_applies_exponential_moving_average(redis):
+    features = _features()
+    eta_estimator.record(features, {"encode": 10.0, "voice": 10.0, "wall": 10.0})
+    assert float(redis.hget(RATES_KEY, "encode:720p:30")) == pytest.approx(1.0)
+    assert float(redis.hget(RATES_KEY, "voice")) == pytest.approx(0.1)
+    # 两个阶段完全重叠
+    assert float(redis.hget(RATES_KEY, "overlap:noexp:short")) == pytest.approx(0.5)
+    
+    eta_estimator.record(features, {"encode": 20.0, "voice": 10.0, "wall": 30.0})
+    assert float(redis.hget(RATES_KEY, "encode:720p:30")) == pytest.approx(0.8 * 1.0 + 0.2 * 2.0)
+    assert float(redis.hget(RATES_KEY, "overlap:noexp:short")) == pytest.approx(0.8 * 0.5 + 0.2 * 1.0)
+    assert redis.hget(RATES_KEY, "n:encode:720p:30") == "2"
+    assert redis.llen(SAMPLES_KEY) == 2
+    
+    rates = {"encode": 1.2, "concat": DEFAULT_RATES["concat"], "voice": 0.1, "overlap": 0.6}
+    assert eta_estimator.predict(features) == pytest.approx(
+        (rates["encode"] * 10 + rates["concat"] * 10 + rates["voice"] * 100) * rates["overlap"]
+    )
+
+
+def test_record_maps_staged_timings(redis):
+    eta_estimator.record(
+        _features(expansion=True),
+        {"expanding_images": 40.0, "generating_voice": 5.0, "composing": 5.0}
+    )
+    assert float(redis.hget(RATES_KEY, "expand")) == pytest.approx(10.0)
+    assert float(redis.hget(RATES_KEY, "voice")) == pytest.approx(0.05)
+    assert float(redis.hget(RATES_KEY, "encode:720p:30")) == pytest.approx(0.5)
+    # 没有 wall 时按阶段耗时之和（逐阶段执行不重叠）
+    assert float(redis.hget(RATES_KEY, "overlap:exp:short")) == pytest.approx(1.0)
+
+
+@pytest.fixture
+def now(monkeypatch):
+    monkeypatch.setattr(eta, "time", SimpleNamespace(time=lambda: 1000.0))
+
+
+def test_refine_without_estimate(now):
+    assert eta_estimator.refine({"status": "pending"}) is None
+
+
+def test_refine_before_start_returns_estimate(now):
+    assert eta_estimator.refine({"estimated_time": 100.0, "progress": 0.0}) == 100.0
+
+
+def test_refine_early_progress_uses_model(now):
+    record = {"estimated_time": 100.0, "started_at": 960.0, "progress": 0.0}
+    assert eta_estimator.refine(record) == pytest.approx(100.0)
+    
+    # 已经超过预估时间，至少按剩余进度计算
+    record = {"estimated_time": 30.0, "started_at": 960.0, "progress": 0.05}
+    assert eta_estimator.refine(record) == pytest.approx(30.0 * 0.95)
+
+
+def test_refine_blends_observed_speed(now):
+    record = {"estimated_time": 100.0, "started_at": 960.0, "progress": 0.5}
+    model_remaining = 60.0
+    observed_remaining = 40.0
+    assert eta_estimator.refine(record) == pytest.approx(0.5 * observed_remaining + 0.5 * model_remaining)
+    
+    record["progress"] = 0.9
+    observed_remaining = 40.0 * 0.1 / 0.9
+    assert eta_estimator.refine(record) == pytest.approx(0.9 * observed_remaining + 0.1 * model_remaining)
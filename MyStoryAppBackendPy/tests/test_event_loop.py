@@ -0,0 +1,61 @@
+"""
+Worker 进程事件循环：跨任务复用与退出时关闭
+"""
+
+import asyncio
+import threading
+
+import pytest
+
+from app.tasks.event_loop import WorkerEventLoop
+
+
+@pytest.fixture
+def worker_loop():
+    loop = WorkerEventLoop()
+    yield loop
+    loop.shutdown()
+
+
+def test_tasks_share_one_loop(worker_loop):
+    async def current():
+        return asyncio.get_running_loop()
+    
+    first = worker_loop.run(current)
+    # I/O Worker 的多个线程同样使用这个循环
+    others = []
+    threads = [threading.Thread(target=lambda: others.append(worker_loop.run(current))) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    
+    assert worker_loop.run(current) is first
+    assert others == [first] * 3
+    assert first.is_running()
+
+
+def test_exceptions_propagate(worker_loop):
+    async def fail():
+        raise ValueError("boom")
+    
+    with pytest.raises(ValueError, match="boom"):
+        worker_loop.run(fail)
+
+
+def test_shutdown_runs_cleanup_on_the_loop(worker_loop):
+    async def current():
+        return asyncio.get_running_loop()
+    
+    loop = worker_loop.run(current)
+    cleaned = []
+    
+    async def cleanup():
+        cleaned.append(asyncio.get_running_loop())
+    
+    worker_loop.shutdown(cleanup)
+    
+    assert cleaned == [loop]
+    assert loop.is_closed()
+    # 之后再运行协程时重新创建
+    assert worker_loop.run(current) is not loop
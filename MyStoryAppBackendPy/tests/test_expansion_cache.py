@@ -0,0 +1,138 @@
+"""
+图片扩展缓存：命中时不调用百炼，并发的相同请求合并为一次，结果通过存储服务读取
+"""
+
+import asyncio
+
+import httpx
+import pytest
+
+from app.config import settings
+from app.services import bailian_image, expansion_cache as expansion_cache_module
+from app.services.bailian_image import EXPAND_MODEL, STYLE_PROMPTS, BailianImageService
+from app.services.disk_cache import hash_file
+from app.services.expansion_cache import CACHE_KEY_PREFIX, STATS_KEY, expansion_cache
+from app.services.storage import StorageFactory, get_storage
+from app.services.video_service import video_service
+
+
+class FakeLimiter:
+    """代替百炼调用：记录调用次数，等待 release 后返回结果 URL"""
+    
+    def __init__(self):
+        self.calls = []
+        self.release = asyncio.Event()
+    
+    async def run(self, kind, model, func, base64_image, style_prompt):
+        self.calls.append(style_prompt)
+        await self.release.wait()
+        return f"https://dashscope.test/result/{len(self.calls)}.png"
+
+
+class FakeStorage:
+    def __init__(self):
+        self.uploaded = []
+    
+    async def upload_from_bytes(self, data: bytes, filename: str, content_type: str) -> str:
+        self.uploaded.append(filename)
+        return f"https://oss.test/{filename}"
+
+
+class FakeHttp:
+    def get(self) -> httpx.AsyncClient:
+        return httpx.AsyncClient(transport=httpx.MockTransport(
+            lambda request: httpx.Response(200, content=b"png", headers={"content-type": "image/png"})
+        ))
+
+
+@pytest.fixture
+def service(redis, monkeypatch):
+    monkeypatch.setattr(settings, "IMAGE_EXPANSION_CACHE_ENABLED", True)
+    limiter = FakeLimiter()
+    storage = FakeStorage()
+    monkeypatch.setattr(bailian_image, "dashscope_limiter", limiter)
+    monkeypatch.setattr(bailian_image, "dashscope_http", FakeHttp())
+    monkeypatch.setattr(expansion_cache_module, "get_storage", lambda: storage)
+    return BailianImageService(), limiter, storage
+
+
+@pytest.fixture
+def image(tmp_path):
+    path = tmp_path / "photo.jpg"
+    path.write_bytes(b"photo")
+    return str(path)
+
+
+def _cache_key(image: str, style: str = "cinematic") -> str:
+    return expansion_cache.make_key(hash_file(image), STYLE_PROMPTS[style], EXPAND_MODEL)
+
+
+async def test_cache_hit_skips_api(service, image, redis):
+    expand, limiter, storage = service
+    redis.set(CACHE_KEY_PREFIX + _cache_key(image), "https://oss.test/cached.png")
+    
+    assert await expand.expand_image(image) == "https://oss.test/cached.png"
+    assert limiter.calls == []
+    assert storage.uploaded == []
+    assert redis.hget(STATS_KEY, "hits") == "1"
+
+
+async def test_miss_expands_and_indexes_result(service, image, redis):
+    expand, limiter, storage = service
+    limiter.release.set()
+    
+    url = await expand.expand_image(image)
+    assert limiter.calls == [STYLE_PROMPTS["cinematic"]]
+    assert storage.uploaded == [f"expanded_{_cache_key(image)[:32]}.png"]
+    assert redis.get(CACHE_KEY_PREFIX + _cache_key(image)) == url
+    
+    # 之后的请求命中缓存
+    assert await expand.expand_image(image) == url
+    assert len(limiter.calls) == 1
+
+
+async def test_inflight_requests_are_merged(service, image):
+    expand, limiter, _ = service
+    same = [asyncio.create_task(expand.expand_image(image)) for _ in range(3)]
+    other_style = asyncio.create_task(expand.expand_image(image, "anime"))
+    await asyncio.sleep(0.05)
+    limiter.release.set()
+    
+    urls = await asyncio.gather(*same)
+    assert len(set(urls)) == 1
+    assert await other_style != urls[0]
+    assert sorted(limiter.calls) == sorted([STYLE_PROMPTS["cinematic"], STYLE_PROMPTS["anime"]])
+    assert expand._inflight == {}
+
+
+async def test_disabled_cache_always_expands(service, image, redis, monkeypatch):
+    expand, limiter, _ = service
+    monkeypatch.setattr(settings, "IMAGE_EXPANSION_CACHE_ENABLED", False)
+    limiter.release.set()
+    
+    await expand.expand_image(image)
+    await expand.expand_image(image)
+    assert len(limiter.calls) == 2
+    assert redis.get(CACHE_KEY_PREFIX + _cache_key(image)) is None
+
+
+async def test_stored_result_is_read_through_storage(dirs, monkeypatch):
+    async def no_http(*args):
+        raise AssertionError("stored images must not be fetched over HTTP")
+    
+    monkeypatch.setattr(settings, "STORAGE_TYPE", "local")
+    monkeypatch.setattr(settings, "BASE_URL", "http://api.test")
+    StorageFactory.reset()
+    monkeypatch.setattr(video_service, "_download_image", no_http)
+    try:
+        storage = get_storage()
+        url = await storage.upload_from_bytes(b"png", "expanded_abc.png", "image/png")
+        assert url == "http://api.test/uploads/expanded_abc.png"
+        
+        path = await video_service.download_image(url, "task", "exp_0")
+        # 复制为任务临时文件，任务结束时删除不影响存储中的文件
+        assert path == str(dirs / "output" / "temp_task_img_exp_0.png")
+        assert open(path, "rb").read() == b"png"
+        assert (dirs / "uploads" / "expanded_abc.png").exists()
+    finally:
+        StorageFactory.reset()
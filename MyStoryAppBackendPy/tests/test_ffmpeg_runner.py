@@ -0,0 +1,61 @@
+"""
+ffmpeg 运行器
+"""
+
+import os
+import sys
+
+import pytest
+
+from app.config import settings
+from app.services import ffmpeg_runner
+from app.services.ffmpeg_runner import run_ffmpeg
+
+
+FAKE_FFMPEG = """\
+import os, sys, time
+open(sys.argv[-1], "w").write(str(os.getpid()))
+print("out_time_us=1000000")
+print("progress=continue", flush=True)
+time.sleep(30)
+"""
+
+
+def test_render_slots_follow_cpu_count(monkeypatch):
+    monkeypatch.setattr(ffmpeg_runner.os, "cpu_count", lambda: 8)
+    monkeypatch.setattr(settings, "VIDEO_RENDER_CONCURRENCY", 0)
+    assert ffmpeg_runner.get_render_slots() == 4
+
+
+def test_render_slots_capped_by_cpu_count(monkeypatch):
+    monkeypatch.setattr(ffmpeg_runner.os, "cpu_count", lambda: 2)
+    monkeypatch.setattr(settings, "VIDEO_RENDER_CONCURRENCY", 6)
+    assert ffmpeg_runner.get_render_slots() == 2
+
+
+@pytest.fixture
+def fake_ffmpeg(tmp_path):
+    """输出一组进度后挂起的假 ffmpeg，把自己的 pid 写入命令行最后一个参数"""
+    script = tmp_path / "ffmpeg"
+    script.write_text(f"#!{sys.executable}\n{FAKE_FFMPEG}")
+    script.chmod(0o755)
+    return [str(script), str(tmp_path / "pid")]
+
+
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    return True
+
+
+async def test_progress_callback_error_kills_process(fake_ffmpeg, tmp_path):
+    async def on_progress(fraction):
+        raise ConnectionError("redis down")
+    
+    with pytest.raises(ConnectionError):
+        await run_ffmpeg(fake_ffmpeg, 10.0, on_progress)
+    
+    pid = int((tmp_path / "pid").read_text())
+    assert not _alive(pid)
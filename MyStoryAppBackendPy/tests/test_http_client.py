@@ -0,0 +1,109 @@
+"""
+DashScope HTTP 客户端池：按事件循环复用、连接统计与关闭
+"""
+
+import asyncio
+import functools
+import threading
+
+import httpx
+import pytest
+
+from app.services import http_client
+from app.services.http_client import HttpClientPool
+
+
+async def _handler(request: httpx.Request) -> httpx.Response:
+    # MockTransport 不经过 httpcore，按 httpcore 的方式触发 trace：只有第一个请求新建连接
+    trace = request.extensions["trace"]
+    if request.url.path == "/first":
+        await trace("connection.connect_tcp.complete", {})
+        await trace("connection.start_tls.complete", {})
+    return httpx.Response(200, json={"ok": True})
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    transport = httpx.MockTransport(_handler)
+    monkeypatch.setattr(http_client.httpx, "AsyncClient", functools.partial(httpx.AsyncClient, transport=transport))
+    return HttpClientPool()
+
+
+def _in_other_loop(pool: HttpClientPool):
+    """在新的事件循环（线程）中获取客户端，返回 (循环, 客户端)；循环结束后保留引用"""
+    result = {}
+    
+    async def get():
+        result["loop"] = asyncio.get_running_loop()
+        result["client"] = pool.get()
+    
+    thread = threading.Thread(target=asyncio.run, args=(get(),))
+    thread.start()
+    thread.join()
+    return result["loop"], result["client"]
+
+
+async def test_client_reused_within_loop(pool):
+    client = pool.get()
+    assert pool.get() is client
+    
+    _, other = _in_other_loop(pool)
+    assert other is not client
+    assert pool.stats()["open_clients"] == 2
+    
+    # 已关闭的客户端重新创建
+    await client.aclose()
+    assert pool.get() is not client
+
+
+async def test_trace_counts_new_connections(pool):
+    client = pool.get()
+    await client.get("https://dashscope.test/first")
+    await client.get("https://dashscope.test/second")
+    await client.get("https://dashscope.test/third")
+    
+    stats = pool.stats()
+    assert (stats["requests"], stats["connections"], stats["tls_handshakes"]) == (3, 1, 1)
+    assert stats["reuse_ratio"] == pytest.approx(0.667)
+
+
+async def test_aclose_closes_clients_of_running_loops(pool):
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever)
+    thread.start()
+    try:
+        async def get():
+            return pool.get()
+        
+        other = asyncio.run_coroutine_threadsafe(get(), loop).result()
+        current = pool.get()
+        # 所属循环已结束的客户端被丢弃
+        _, finished = _in_other_loop(pool)
+        
+        await pool.aclose()
+        
+        assert current.is_closed
+        assert other.is_closed
+        assert not finished.is_closed
+        assert pool.stats()["open_clients"] == 0
+    finally:
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        loop.close()
+
+
+async def test_reset_drops_clients_and_stats(pool):
+    client = pool.get()
+    await client.get("https://dashscope.test/first")
+    
+    pool.reset()
+    
+    assert pool.stats() == {
+        "requests": 0,
+        "connections": 0,
+        "tls_handshakes": 0,
+        "http2_responses": 0,
+        "reuse_ratio": 0.0,
+        "open_clients": 0
+    }
+    assert pool.get() is not client
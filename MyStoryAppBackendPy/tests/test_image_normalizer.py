@@ -0,0 +1,75 @@
+"""
+图片预处理缓存：结果不受缓存淘汰影响
+"""
+
+import pytest
+from PIL import Image
+
+from app.config import settings
+from app.services import image_normalizer as normalizer_module
+from app.services.disk_cache import DiskCache
+from app.services.video_service import video_service
+
+
+@pytest.fixture
+def normalize(dirs, monkeypatch):
+    cache = DiskCache("images", str(dirs / "cache"), 1024 ** 2)
+    monkeypatch.setattr(normalizer_module, "image_cache", cache)
+    monkeypatch.setattr(settings, "IMAGE_NORMALIZE_ENABLED", True)
+    
+    image = dirs / "image.jpg"
+    Image.new("RGB", (64, 48), "red").save(image)
+    
+    async def run(index: int = 0):
+        return await video_service.normalize_image(str(image), 32, 24, "task", index)
+    
+    return cache, run
+
+
+def _cached_files(cache):
+    return list(cache.directory.glob("*/*"))
+
+
+async def test_result_is_a_task_temp_file(normalize, dirs):
+    cache, run = normalize
+    output = await run()
+    assert output == str(dirs / "output" / "temp_task_norm_0.png")
+    assert Image.open(output).size == (32, 24)
+    assert len(_cached_files(cache)) == 1
+
+
+async def test_result_survives_eviction(normalize):
+    cache, run = normalize
+    await run(0)
+    output = await run(1)
+    assert cache.stats()["hits"] == 1
+    
+    # 编码过程中缓存被其他进程淘汰
+    for path in _cached_files(cache):
+        path.unlink()
+    assert Image.open(output).size == (32, 24)
+
+
+async def test_evicted_after_lookup_is_a_miss(normalize, monkeypatch):
+    cache, run = normalize
+    await run(0)
+    
+    lookup = cache.get
+    
+    def get_then_evict(key, suffix):
+        path = lookup(key, suffix)
+        path.unlink()
+        return path
+    
+    monkeypatch.setattr(cache, "get", get_then_evict)
+    output = await run(1)
+    assert Image.open(output).size == (32, 24)
+    assert len(_cached_files(cache)) == 1
+
+
+async def test_evicted_right_after_commit(normalize):
+    cache, run = normalize
+    cache.max_bytes = 1
+    output = await run()
+    assert not _cached_files(cache)
+    assert Image.open(output).size == (32, 24)
@@ -0,0 +1,136 @@
+"""
+队列指标：Worker 心跳、运行中任务计数与汇总
+"""
+
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from app.config import settings
+from app.tasks import metrics
+from app.tasks.metrics import (
+    PRIORITY_SEPARATOR, TASK_SECONDS_KEY, WORKER_KEY_PREFIX, QueueMetrics, WorkerHeartbeat
+)
+from app.tasks.scheduler import fair_scheduler
+
+
+@pytest.fixture
+def heartbeat(redis):
+    heartbeat = WorkerHeartbeat()
+    yield heartbeat
+    heartbeat.stop()
+
+
+def test_start_registers_worker(redis, heartbeat):
+    redis.hset(WORKER_KEY_PREFIX + "cpu@host", "active", 5)
+    heartbeat.start("cpu@host", ["cpu", "celery"], 4)
+    
+    data = redis.hgetall(WORKER_KEY_PREFIX + "cpu@host")
+    assert data["queues"] == "celery,cpu"
+    assert data["concurrency"] == "4"
+    # 同名 Worker 重启时清零
+    assert data["active"] == "0"
+    assert redis.ttl(WORKER_KEY_PREFIX + "cpu@host") > 0
+    
+    heartbeat.stop()
+    assert not redis.exists(WORKER_KEY_PREFIX + "cpu@host")
+
+
+def test_heartbeat_thread_refreshes_timestamp(redis, heartbeat, monkeypatch):
+    monkeypatch.setattr(settings, "WORKER_HEARTBEAT_INTERVAL", 0.5)
+    heartbeat.start("cpu@host", ["cpu"], 1)
+    first = float(redis.hget(WORKER_KEY_PREFIX + "cpu@host", "heartbeat"))
+    
+    deadline = time.monotonic() + 5
+    while float(redis.hget(WORKER_KEY_PREFIX + "cpu@host", "heartbeat")) == first:
+        assert time.monotonic() < deadline
+        time.sleep(0.05)
+
+
+def test_task_counters_and_average(redis, heartbeat, monkeypatch):
+    clock = SimpleNamespace(now=0.0)
+    monkeypatch.setattr(metrics, "time", SimpleNamespace(monotonic=lambda: clock.now, time=time.time))
+    heartbeat.start("cpu@host", ["cpu"], 2)
+    
+    heartbeat.task_started("cpu@host", "t1")
+    heartbeat.task_started("cpu@host", "t2")
+    assert redis.hget(WORKER_KEY_PREFIX + "cpu@host", "active") == "2"
+    
+    clock.now = 10.0
+    heartbeat.task_finished("cpu@host", "t1", "cpu")
+    assert redis.hget(WORKER_KEY_PREFIX + "cpu@host", "active") == "1"
+    assert float(redis.hget(TASK_SECONDS_KEY, "cpu")) == pytest.approx(10.0)
+    
+    clock.now = 20.0
+    heartbeat.task_finished("cpu@host", "t2", "cpu")
+    assert redis.hget(WORKER_KEY_PREFIX + "cpu@host", "active") == "0"
+    assert float(redis.hget(TASK_SECONDS_KEY, "cpu")) == pytest.approx(0.8 * 10.0 + 0.2 * 20.0)
+
+
+def test_counters_do_not_recreate_removed_worker(redis, heartbeat):
+    heartbeat.start("cpu@host", ["cpu"], 2)
+    heartbeat.task_started("cpu@host", "t1")
+    
+    # Worker 下线（或记录过期）后才结束的任务不会重建记录
+    heartbeat.stop()
+    heartbeat.task_finished("cpu@host", "t1", "cpu")
+    heartbeat.task_started("cpu@host", "t2")
+    assert not redis.exists(WORKER_KEY_PREFIX + "cpu@host")
+
+
+def _register(redis, hostname: str, queues: str, concurrency: int, active: int):
+    redis.hset(WORKER_KEY_PREFIX + hostname, mapping={
+        "hostname": hostname,
+        "queues": queues,
+        "concurrency": concurrency,
+        "active": active,
+        "heartbeat": 1.0
+    })
+
+
+def test_collect_summarizes_queues(redis, monkeypatch):
+    monkeypatch.setattr(fair_scheduler, "stats", lambda: {"waiting": 3})
+    _register(redis, "cpu1", "cpu", 2, 1)
+    # 计数偏大时以并发数为上限
+    _register(redis, "cpu2", "cpu", 2, 5)
+    _register(redis, "io1", "io", 8, 0)
+    redis.rpush(settings.CELERY_CPU_QUEUE, *["m"] * 6)
+    redis.rpush(f"{settings.CELERY_CPU_QUEUE}{PRIORITY_SEPARATOR}3", "m", "m")
+    redis.hset(TASK_SECONDS_KEY, settings.CELERY_CPU_QUEUE, 30.0)
+    
+    snapshot = QueueMetrics().collect()
+    
+    cpu = snapshot["queues"][settings.CELERY_CPU_QUEUE]
+    assert cpu == {
+        "depth": 8,
+        "workers": 2,
+        "concurrency": 4,
+        "active": 3,
+        "avg_task_seconds": 30.0,
+        "backlog_seconds": 60
+    }
+    io = snapshot["queues"][settings.CELERY_IO_QUEUE]
+    assert (io["depth"], io["workers"], io["avg_task_seconds"]) == (0, 1, metrics.DEFAULT_TASK_SECONDS)
+    assert snapshot["active"] == 3
+    assert snapshot["waiting"] == 11
+    assert [worker["hostname"] for worker in snapshot["workers"]] == ["cpu1", "cpu2", "io1"]
+
+
+def test_collect_without_workers(redis):
+    redis.rpush(settings.CELERY_IO_QUEUE, "m")
+    snapshot = QueueMetrics().collect()
+    assert snapshot["workers"] == []
+    # 没有 Worker 时按单个槽位估算
+    assert snapshot["queues"][settings.CELERY_IO_QUEUE]["backlog_seconds"] == round(metrics.DEFAULT_TASK_SECONDS)
+
+
+async def test_get_returns_cached_snapshot(redis):
+    queue_metrics = QueueMetrics()
+    first = await queue_metrics.get()
+    redis.rpush(settings.CELERY_IO_QUEUE, "m")
+    assert await queue_metrics.get() is first
+    
+    first["updated_at"] -= settings.QUEUE_METRICS_INTERVAL * 3 + 1
+    refreshed = await queue_metrics.get()
+    assert refreshed["queues"][settings.CELERY_IO_QUEUE]["depth"] == 1
@@ -0,0 +1,166 @@
+"""
+幻灯片流水线调度：节点调度、失败时取消与加权进度
+"""
+
+import asyncio
+from pathlib import Path
+
+import pytest
+
+from app.config import settings
+from app.models.schemas import Slide, VideoConfigRequest
+from app.services import pipeline as pipeline_module
+from app.services.checkpoint import JobCheckpoint
+from app.services.pipeline import ASSEMBLE_START, NODE_WEIGHTS, PIPELINE_START, SlidePipeline
+
+
+class FakeServices:
+    """代替百炼与 ffmpeg：记录调用，可让指定幻灯片的编码失败或挂起"""
+    
+    def __init__(self, output_dir: Path):
+        self.output_dir = output_dir
+        self.encoded = []
+        self.assembled = None
+        self.fail_encode = None
+        self.block_encode = None
+        self.blocked_cancelled = False
+    
+    async def download_image(self, url, task_id, name):
+        path = self.output_dir / f"temp_{task_id}_{name}.jpg"
+        path.write_bytes(b"image")
+        return str(path)
+    
+    async def expand_image(self, image_path, style):
+        return f"https://oss/exp_{Path(image_path).stem}.png"
+    
+    async def normalize_image(self, image_path, width, height, task_id, index):
+        return image_path
+    
+    async def create_slide_video(self, slide, width, height, config, index, task_id, on_progress=None, image_path=None):
+        if index == self.fail_encode:
+            raise RuntimeError("encode failed")
+        if index == self.block_encode:
+            try:
+                await asyncio.sleep(60)
+            except asyncio.CancelledError:
+                self.blocked_cancelled = True
+                raise
+        await on_progress(0.5)
+        self.encoded.append((index, image_path))
+        return self.output_dir / f"temp_{task_id}_slide_{index}.mp4"
+    
+    async def assemble_video(self, slides, config, task_id, output_filename, progress, slide_videos=None, **kwargs):
+        self.assembled = slide_videos
+        return f"/output/{output_filename}"
+    
+    async def generate_speech(self, text, voice, speed):
+        return {"url": f"/output/tts_{text}.mp3"}
+
+
+@pytest.fixture
+def services(redis, dirs, monkeypatch):
+    fake = FakeServices(dirs / "output")
+    for name in ("download_image", "normalize_image", "create_slide_video", "assemble_video"):
+        monkeypatch.setattr(pipeline_module.video_service, name, getattr(fake, name))
+    monkeypatch.setattr(pipeline_module.bailian_image_service, "expand_image", fake.expand_image)
+    monkeypatch.setattr(pipeline_module.bailian_tts_service, "generate_speech", fake.generate_speech)
+    monkeypatch.setattr(settings, "VIDEO_RENDER_ENGINE", "segments")
+    return fake
+
+
+def _pipeline(count: int, progress_callback=None, checkpoint=None):
+    slides = [Slide(id=str(i), image_url=f"{i}.jpg", voice_text=f"v{i}") for i in range(count)]
+    config = VideoConfigRequest(ai_image_expansion=True)
+    return SlidePipeline(slides, config, "task", checkpoint or JobCheckpoint("task"), progress_callback)
+
+
+async def test_run_assembles_segments_in_slide_order(services, dirs):
+    pipeline = _pipeline(4)
+    output_url = await pipeline.run()
+    
+    assert output_url == "/output/video_task.mp4"
+    assert services.assembled == [dirs / "output" / f"temp_task_slide_{i}.mp4" for i in range(4)]
+    # 编码使用扩展后的图片
+    assert all("exp_" in image for _, image in services.encoded)
+    assert [slide.voice_url for slide in pipeline.slides] == [f"/output/tts_v{i}.mp3" for i in range(4)]
+    assert [slide.expanded_image_url for slide in pipeline.slides] == [
+        f"https://oss/exp_temp_task_src_{i}.png" for i in range(4)
+    ]
+    
+    checkpoint = JobCheckpoint("task").load()
+    assert sorted(checkpoint.items(JobCheckpoint.SEGMENT)) == [0, 1, 2, 3]
+    assert sorted(checkpoint.items(JobCheckpoint.VOICE)) == [0, 1, 2, 3]
+    # 下载的图片在结束后删除
+    assert not list((dirs / "output").glob("temp_task_src_*"))
+    assert {"expand", "encode", "voice", "concat", "wall"} <= set(pipeline.timer.summary())
+
+
+async def test_run_skips_restored_segments(services, dirs):
+    segment = dirs / "output" / "temp_task_slide_1.mp4"
+    segment.write_bytes(b"segment")
+    checkpoint = JobCheckpoint("task")
+    checkpoint.save(JobCheckpoint.SEGMENT, 1, str(segment))
+    
+    pipeline = _pipeline(3, checkpoint=JobCheckpoint("task").load())
+    await pipeline.run()
+    
+    assert sorted(index for index, _ in services.encoded) == [0, 2]
+    assert services.assembled[1] == segment
+
+
+async def test_prepared_media_skips_api_calls(services, monkeypatch):
+    async def unexpected(*args, **kwargs):
+        raise AssertionError("prepared media must not call the API")
+    
+    monkeypatch.setattr(pipeline_module.bailian_image_service, "expand_image", unexpected)
+    monkeypatch.setattr(pipeline_module.bailian_tts_service, "generate_speech", unexpected)
+    checkpoint = JobCheckpoint("task")
+    checkpoint.save(JobCheckpoint.EXPANDED, 0, "https://oss/exp_0.png")
+    checkpoint.save(JobCheckpoint.VOICE, 1, "/output/tts_v1.mp3")
+    
+    pipeline = SlidePipeline(
+        [Slide(id=str(i), image_url=f"{i}.jpg", voice_text=f"v{i}") for i in range(2)],
+        VideoConfigRequest(ai_image_expansion=True), "task", JobCheckpoint("task").load(),
+        media_prepared=True
+    )
+    await pipeline.run()
+    
+    # 准备任务没有结果的幻灯片使用原图、没有配音
+    assert dict(services.encoded) == {
+        0: str(services.output_dir / "temp_task_exp_0.jpg"),
+        1: str(services.output_dir / "temp_task_src_1.jpg")
+    }
+    assert [slide.voice_url for slide in pipeline.slides] == [None, "/output/tts_v1.mp3"]
+
+
+async def test_first_failure_cancels_other_nodes(services):
+    services.fail_encode = 0
+    services.block_encode = 1
+    pipeline = _pipeline(2)
+    
+    with pytest.raises(RuntimeError, match="encode failed"):
+        await asyncio.wait_for(pipeline.run(), 5)
+    
+    assert services.blocked_cancelled
+    assert services.assembled is None
+
+
+async def test_report_weights_nodes():
+    reports = []
+    
+    async def progress_callback(progress, message):
+        reports.append((progress, message))
+    
+    pipeline = _pipeline(2, progress_callback)
+    pipeline.progress.min_interval = 0
+    pipeline._plan()
+    
+    await pipeline._update("expand", 0, 1.0)
+    await pipeline._update("encode", 1, 0.5)
+    
+    per_slide = sum(NODE_WEIGHTS[kind] for kind in ("download", "expand", "normalize", "encode", "voice"))
+    done = NODE_WEIGHTS["expand"] + NODE_WEIGHTS["encode"] * 0.5
+    span = ASSEMBLE_START["segments"] - PIPELINE_START
+    progress, message = reports[-1]
+    assert progress == pytest.approx(PIPELINE_START + span * done / (2 * per_slide))
+    assert message == "扩展 1/2 · 预处理 0/2 · 编码 0/2 · 配音 0/2"
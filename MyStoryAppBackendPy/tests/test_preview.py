@@ -0,0 +1,84 @@
+"""
+草稿预览：配置覆盖与单独的预览任务
+"""
+
+import pytest
+
+from app.config import settings
+from app.models.schemas import VideoConfigRequest, VideoResolution
+from app.services.task_status import task_status_store
+from app.services.video_service import make_preview_config, video_service
+from app.tasks import video_tasks
+from app.tasks.video_tasks import generate_preview_task
+
+
+def test_preview_config_overrides(monkeypatch):
+    monkeypatch.setattr(settings, "PREVIEW_RESOLUTION", "480p")
+    monkeypatch.setattr(settings, "PREVIEW_FRAME_RATE", 10)
+    config = VideoConfigRequest(resolution="1080p", frame_rate=30, ai_image_expansion=True, voice_speed=1.5)
+    
+    preview = make_preview_config(config)
+    assert preview.resolution == VideoResolution.SD
+    assert preview.frame_rate == 10
+    assert preview.ai_image_expansion is False
+    # 其他配置保持不变，原配置不受影响
+    assert preview.voice_speed == 1.5
+    assert config.resolution == VideoResolution.FHD
+
+
+def test_preview_keeps_lower_frame_rate(monkeypatch):
+    monkeypatch.setattr(settings, "PREVIEW_FRAME_RATE", 10)
+    assert make_preview_config(VideoConfigRequest(frame_rate=5)).frame_rate == 5
+
+
+def test_invalid_preview_resolution_falls_back(monkeypatch):
+    monkeypatch.setattr(settings, "PREVIEW_RESOLUTION", "8k")
+    assert make_preview_config(VideoConfigRequest()).resolution == VideoResolution.SD
+
+
+def test_draft_uses_preview_preset(monkeypatch):
+    monkeypatch.setattr(settings, "PREVIEW_PRESET", "ultrafast")
+    assert video_service._encoder_options(VideoConfigRequest(), draft=True)["preset"] == "ultrafast"
+    assert "preset" not in video_service._encoder_options(VideoConfigRequest())
+
+
+@pytest.fixture
+def compose(redis, monkeypatch):
+    """代替 compose_video：记录参数并返回预览 URL"""
+    calls = []
+    
+    async def fake_compose(slides, config, task_id, progress_callback=None, draft=False, checkpoint=None):
+        calls.append({"config": config, "draft": draft})
+        await progress_callback(0.5, "编码中")
+        return f"/output/preview_{task_id}.mp4"
+    
+    monkeypatch.setattr(video_tasks.video_service, "compose_video", fake_compose)
+    monkeypatch.setattr(generate_preview_task, "update_state", lambda **kwargs: None)
+    return calls
+
+
+SLIDES = [{"id": "0", "image_url": "a.jpg", "caption": "hi"}]
+
+
+def test_standalone_preview_task(compose):
+    task_status_store.create("task")
+    result = generate_preview_task.run("task", SLIDES, VideoConfigRequest(resolution="1080p").model_dump())
+    
+    assert result["preview_url"] == "/output/preview_task.mp4"
+    assert compose[0]["draft"] is True
+    assert compose[0]["config"].resolution == VideoResolution(settings.PREVIEW_RESOLUTION)
+    
+    record = task_status_store.get("task")
+    assert record["status"] == "completed"
+    assert record["output_url"] == record["preview_url"] == "/output/preview_task.mp4"
+
+
+def test_preview_alongside_video_keeps_video_status(compose):
+    task_status_store.create("task", preview_status="pending")
+    generate_preview_task.run("task", SLIDES, VideoConfigRequest().model_dump(), standalone=False)
+    
+    record = task_status_store.get("task")
+    assert record["status"] == "pending"
+    assert record["preview_status"] == "completed"
+    assert record["preview_url"] == "/output/preview_task.mp4"
+    assert "output_url" not in record
@@ -0,0 +1,149 @@
+"""
+百炼限流（fakeredis 执行 Lua 脚本）：令牌桶、排队顺序、并发槽位与 429
+"""
+
+import asyncio
+
+import httpx
+import pytest
+
+from app.config import settings
+from app.services.rate_limiter import DashScopeRateLimiter, RateLimit
+
+
+@pytest.fixture
+def limiter(redis, monkeypatch):
+    monkeypatch.setattr(settings, "DASHSCOPE_RATE_LIMIT_ENABLED", True)
+    monkeypatch.setattr(settings, "DASHSCOPE_RATE_LIMIT_RETRIES", 3)
+    limiter = DashScopeRateLimiter()
+    limiter.limits = {
+        "image": RateLimit("image", 5, 0),
+        "slow": RateLimit("slow", 1, 0),
+        "tts": RateLimit("tts", 0, 2),
+        "tasks": RateLimit("tasks", 50, 0)
+    }
+    return limiter
+
+
+def _too_many_requests(retry_after: str = "0") -> httpx.HTTPStatusError:
+    request = httpx.Request("POST", "https://dashscope.test/api")
+    response = httpx.Response(429, headers={"retry-after": retry_after}, request=request)
+    return httpx.HTTPStatusError("429", request=request, response=response)
+
+
+def test_burst_then_wait(limiter):
+    image = limiter.limits["image"]
+    assert [limiter._try_acquire(image, f"w{i}") for i in range(5)] == [0.0] * 5
+    
+    wait = limiter._try_acquire(image, "w5")
+    assert 0 < wait <= 0.2
+
+
+def test_waiters_are_served_in_arrival_order(limiter, redis):
+    image = limiter.limits["image"]
+    for i in range(5):
+        limiter._try_acquire(image, f"w{i}")
+    assert limiter._try_acquire(image, "a") > 0
+    assert limiter._try_acquire(image, "b") > 0
+    
+    # 令牌补足后，后到的 b 仍然要等 a
+    redis.hset(limiter._key(image, "bucket"), "tokens", 5)
+    assert limiter._try_acquire(image, "b") == pytest.approx(0.05)
+    assert limiter._try_acquire(image, "a") == 0.0
+    assert limiter._try_acquire(image, "b") == 0.0
+    assert redis.zcard(limiter._key(image, "queue")) == 0
+
+
+async def test_concurrency_cap(limiter, redis):
+    running = 0
+    peak = 0
+    
+    async def call():
+        nonlocal running, peak
+        async with limiter.limit("tts"):
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0.05)
+            running -= 1
+    
+    await asyncio.gather(*(call() for _ in range(5)))
+    
+    assert peak == 2
+    assert limiter.stats()["acquired"] == 5
+    # 结束后释放全部槽位
+    assert redis.zcard(limiter._key(limiter.limits["tts"], "slots")) == 0
+
+
+async def test_429_halves_rate_and_pauses(limiter, redis):
+    image = limiter.limits["image"]
+    with pytest.raises(httpx.HTTPStatusError):
+        async with limiter.limit("image"):
+            raise _too_many_requests("0.5")
+    
+    assert float(redis.hget(limiter._key(image, "bucket"), "factor")) == pytest.approx(0.5)
+    assert limiter.stats()["rate_limited"] == 1
+    # 在 Retry-After 内不发放令牌
+    assert 0.3 < limiter._try_acquire(image, "next") <= 0.5
+
+
+async def test_other_errors_are_not_penalized(limiter, redis):
+    request = httpx.Request("GET", "https://dashscope.test/api")
+    error = httpx.HTTPStatusError("500", request=request, response=httpx.Response(500, request=request))
+    with pytest.raises(httpx.HTTPStatusError):
+        async with limiter.limit("image"):
+            raise error
+    
+    assert limiter.stats()["rate_limited"] == 0
+    assert redis.hget(limiter._key(limiter.limits["image"], "bucket"), "factor") == "1"
+
+
+async def test_run_requeues_after_429(limiter):
+    calls = []
+    
+    async def call(value):
+        calls.append(value)
+        if len(calls) < 3:
+            raise _too_many_requests()
+        return value
+    
+    assert await limiter.run("tasks", None, call, "ok") == "ok"
+    assert calls == ["ok"] * 3
+    assert limiter.stats()["rate_limited"] == 2
+
+
+async def test_run_gives_up_after_retries(limiter, monkeypatch):
+    monkeypatch.setattr(settings, "DASHSCOPE_RATE_LIMIT_RETRIES", 1)
+    calls = []
+    
+    async def call():
+        calls.append(1)
+        raise _too_many_requests()
+    
+    with pytest.raises(httpx.HTTPStatusError):
+        await limiter.run("tasks", None, call)
+    assert len(calls) == 2
+
+
+async def test_cancelled_waiter_leaves_queue(limiter, redis):
+    slow = limiter.limits["slow"]
+    assert limiter._try_acquire(slow, "first") == 0.0
+    
+    async def call():
+        async with limiter.limit("slow"):
+            pass
+    
+    waiter = asyncio.create_task(call())
+    await asyncio.sleep(0.05)
+    assert redis.zcard(limiter._key(slow, "queue")) == 1
+    
+    waiter.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await waiter
+    assert redis.zcard(limiter._key(slow, "queue")) == 0
+    assert redis.zcard(limiter._key(slow, "alive")) == 0
+
+
+async def test_unlimited_endpoint_passes_through(limiter, redis):
+    async with limiter.limit("unknown"):
+        pass
+    assert limiter.stats()["acquired"] == 0
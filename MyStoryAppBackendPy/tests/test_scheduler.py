@@ -0,0 +1,194 @@
+"""
+公平调度：通道加权轮转、用户并发上限、释放、取消与租约
+"""
+
+import pytest
+
+from app.config import settings
+from app.tasks import scheduler
+from app.tasks.scheduler import FairScheduler
+
+
+class Clock:
+    """可控的 time.time()"""
+    
+    def __init__(self, now: float):
+        self.now = now
+    
+    def time(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def sched(redis, monkeypatch):
+    """调度器与提交给 Celery 的任务"""
+    submitted = []
+    monkeypatch.setattr(scheduler, "_submit", lambda job: submitted.append(job["task_id"]))
+    monkeypatch.setattr(settings, "SCHED_MAX_ACTIVE", 8)
+    monkeypatch.setattr(settings, "SCHED_USER_MAX_ACTIVE", 2)
+    monkeypatch.setattr(settings, "SCHED_LEASE_SECONDS", 100)
+    
+    fair = FairScheduler()
+    fair.lane_weights = {"preview": 4, "paid": 2, "standard": 1}
+    fair.paid_users = {"user:vip"}
+    return fair, submitted
+
+
+def _enqueue(fair: FairScheduler, job_id: str, user_key: str, kind: str = "video"):
+    fair.enqueue(job_id, job_id, user_key, kind, {}, f"celery-{job_id}")
+
+
+def test_lanes_use_smooth_weighted_round_robin(sched, monkeypatch):
+    fair, submitted = sched
+    monkeypatch.setattr(settings, "SCHED_USER_MAX_ACTIVE", 100)
+    for i in range(7):
+        _enqueue(fair, f"preview{i}", "user:a", "preview")
+        _enqueue(fair, f"paid{i}", "user:vip")
+        _enqueue(fair, f"standard{i}", "user:b")
+    
+    monkeypatch.setattr(settings, "SCHED_MAX_ACTIVE", 7)
+    assert fair.dispatch() == 7
+    
+    # 权重 4:2:1，高优先级通道不会连续占满
+    assert submitted == ["preview0", "paid0", "preview1", "standard0", "preview2", "paid1", "preview3"]
+
+
+def test_users_take_turns_within_lane(sched):
+    fair, submitted = sched
+    for i in range(3):
+        _enqueue(fair, f"a{i}", "user:a")
+    _enqueue(fair, "b0", "user:b")
+    
+    fair.dispatch()
+    assert submitted == ["a0", "b0", "a1"]
+
+
+def test_user_limit_holds_jobs_until_release(sched):
+    fair, submitted = sched
+    for i in range(4):
+        _enqueue(fair, f"a{i}", "user:a")
+    
+    fair.dispatch()
+    assert submitted == ["a0", "a1"]
+    assert fair.position("a2") is not None
+    
+    fair.release("a0")
+    assert submitted == ["a0", "a1", "a2"]
+    assert fair.position("a2") is None
+    assert fair.stats()["active"] == 2
+
+
+def test_release_frees_global_slot(sched, monkeypatch):
+    fair, submitted = sched
+    monkeypatch.setattr(settings, "SCHED_MAX_ACTIVE", 1)
+    _enqueue(fair, "a0", "user:a")
+    _enqueue(fair, "b0", "user:b")
+    
+    fair.dispatch()
+    assert submitted == ["a0"]
+    
+    fair.release("a0")
+    assert submitted == ["a0", "b0"]
+    # 未经过调度器的任务无副作用
+    fair.release("unknown")
+    assert fair.stats()["active"] == 1
+
+
+def test_cancel_queued_job(sched, monkeypatch):
+    fair, submitted = sched
+    monkeypatch.setattr(settings, "SCHED_MAX_ACTIVE", 1)
+    _enqueue(fair, "b0", "user:b")
+    fair.dispatch()
+    _enqueue(fair, "a0", "user:a")
+    _enqueue(fair, "a1", "user:a")
+    
+    assert fair.cancel("a0") == ["celery-a0"]
+    assert fair.position("a0") is None
+    assert fair.stats()["waiting"] == 1
+    
+    fair.release("b0")
+    assert submitted == ["b0", "a1"]
+
+
+def test_cancel_running_job_dispatches_next(sched, monkeypatch):
+    fair, submitted = sched
+    monkeypatch.setattr(settings, "SCHED_MAX_ACTIVE", 1)
+    _enqueue(fair, "a0", "user:a")
+    _enqueue(fair, "b0", "user:b")
+    fair.dispatch()
+    
+    assert fair.cancel("a0") == ["celery-a0"]
+    assert submitted == ["a0", "b0"]
+    assert fair.cancel("a0") == []
+
+
+def test_expired_lease_is_reclaimed(sched, monkeypatch):
+    fair, submitted = sched
+    clock = Clock(1000.0)
+    monkeypatch.setattr(scheduler, "time", clock)
+    monkeypatch.setattr(settings, "SCHED_MAX_ACTIVE", 1)
+    _enqueue(fair, "a0", "user:a")
+    _enqueue(fair, "b0", "user:b")
+    fair.dispatch()
+    
+    clock.now = 1099.0
+    fair.dispatch()
+    assert submitted == ["a0"]
+    
+    # Worker 崩溃，租约到期后槽位被回收
+    clock.now = 1101.0
+    fair.dispatch()
+    assert submitted == ["a0", "b0"]
+
+
+def test_expired_lease_frees_user_limit(sched, monkeypatch):
+    fair, submitted = sched
+    clock = Clock(1000.0)
+    monkeypatch.setattr(scheduler, "time", clock)
+    monkeypatch.setattr(settings, "SCHED_USER_MAX_ACTIVE", 1)
+    _enqueue(fair, "a0", "user:a")
+    _enqueue(fair, "a1", "user:a")
+    fair.dispatch()
+    assert submitted == ["a0"]
+    
+    clock.now = 1101.0
+    fair.dispatch()
+    assert submitted == ["a0", "a1"]
+
+
+def test_renew_extends_lease(sched, monkeypatch):
+    fair, submitted = sched
+    clock = Clock(1000.0)
+    monkeypatch.setattr(scheduler, "time", clock)
+    monkeypatch.setattr(settings, "SCHED_MAX_ACTIVE", 1)
+    _enqueue(fair, "a0", "user:a")
+    _enqueue(fair, "b0", "user:b")
+    fair.dispatch()
+    
+    clock.now = 1050.0
+    fair.renew("a0")
+    # 限频：租约十分之一时间内的重复续期被忽略
+    clock.now = 1055.0
+    fair.renew("a0")
+    
+    clock.now = 1120.0
+    fair.dispatch()
+    assert submitted == ["a0"]
+    
+    clock.now = 1151.0
+    fair.dispatch()
+    assert submitted == ["a0", "b0"]
+
+
+def test_renew_does_not_revive_reclaimed_job(sched, monkeypatch):
+    fair, submitted = sched
+    clock = Clock(1000.0)
+    monkeypatch.setattr(scheduler, "time", clock)
+    monkeypatch.setattr(settings, "SCHED_MAX_ACTIVE", 1)
+    _enqueue(fair, "a0", "user:a")
+    fair.dispatch()
+    
+    clock.now = 1101.0
+    fair.dispatch()
+    fair.renew("a0")
+    assert fair.stats()["active"] == 0
@@ -0,0 +1,77 @@
+"""
+幻灯片片段缓存：并发淘汰
+"""
+
+import pytest
+
+from app.models.schemas import Slide, VideoConfigRequest
+from app.services import disk_cache, video_service as video_module
+from app.services.disk_cache import DiskCache
+from app.services.video_service import video_service
+
+
+class FakeFFmpeg:
+    """代替 run_ffmpeg：把输出文件写成固定内容并计数"""
+    
+    def __init__(self):
+        self.calls = 0
+    
+    async def __call__(self, cmd, *args, **kwargs):
+        self.calls += 1
+        output = next(arg for arg in reversed(cmd) if arg.endswith(".mp4"))
+        with open(output, "wb") as f:
+            f.write(b"segment")
+
+
+@pytest.fixture
+def render(dirs, monkeypatch):
+    cache = DiskCache("segments", str(dirs / "cache"), 1024 ** 2)
+    fake = FakeFFmpeg()
+    monkeypatch.setattr(video_module, "segment_cache", cache)
+    monkeypatch.setattr(video_module, "run_ffmpeg", fake)
+    
+    image = dirs / "image.png"
+    image.write_bytes(b"image")
+    
+    async def create(index: int = 0):
+        return await video_service.create_slide_video(
+            Slide(id="1", image_url=str(image), caption="hi"),
+            1280, 720, VideoConfigRequest(), index, "task", image_path=str(image)
+        )
+    
+    return cache, fake, create
+
+
+async def test_hit_skips_encoding(render):
+    cache, fake, create = render
+    await create(0)
+    output = await create(1)
+    assert fake.calls == 1
+    assert output.read_bytes() == b"segment"
+    assert (cache.stats()["hits"], cache.stats()["misses"]) == (1, 1)
+
+
+async def test_evicted_after_lookup_is_a_miss(render, monkeypatch):
+    cache, fake, create = render
+    await create(0)
+    
+    link = disk_cache.link_or_copy
+    
+    def evict_then_link(src, dst):
+        # 刷新访问时间后、链接前被其他进程淘汰
+        src.unlink(missing_ok=True)
+        link(src, dst)
+    
+    monkeypatch.setattr(disk_cache, "link_or_copy", evict_then_link)
+    output = await create(1)
+    assert fake.calls == 2
+    assert output.read_bytes() == b"segment"
+    assert (cache.stats()["hits"], cache.stats()["misses"]) == (0, 2)
+
+
+async def test_evicted_right_after_commit(render):
+    cache, fake, create = render
+    cache.max_bytes = 1
+    output = await create(0)
+    assert output.read_bytes() == b"segment"
+    assert cache.stats()["evictions"] == 1
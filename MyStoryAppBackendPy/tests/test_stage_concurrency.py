@@ -0,0 +1,123 @@
+"""
+逐阶段执行：图片扩展与配音的并发上限和结果顺序
+"""
+
+import asyncio
+
+import pytest
+
+from app.config import settings
+from app.models.schemas import Slide, VideoConfigRequest
+from app.services.checkpoint import JobCheckpoint
+from app.tasks import video_tasks
+
+
+class FakeTask:
+    """代替 CallbackTask：记录上报的进度"""
+    
+    def __init__(self):
+        self.reports = []
+    
+    def report(self, task_id, state, meta):
+        self.reports.append((state, meta["progress"]))
+
+
+class Gauge:
+    """统计同时进行的调用数"""
+    
+    def __init__(self):
+        self.active = 0
+        self.peak = 0
+    
+    async def run(self, seconds: float):
+        self.active += 1
+        self.peak = max(self.peak, self.active)
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            self.active -= 1
+
+
+def _slides(count: int):
+    return [Slide(id=str(i), image_url=f"{i}.jpg", voice_text=f"第{i}页") for i in range(count)]
+
+
+@pytest.fixture
+def expand(redis, monkeypatch):
+    gauge = Gauge()
+    
+    async def fake_expand(image_url, style):
+        index = int(image_url.split(".")[0])
+        # 序号越小完成越晚，完成顺序与提交顺序相反
+        await gauge.run(0.01 * (6 - index))
+        if index == 3:
+            raise RuntimeError("expand failed")
+        return f"exp_{index}.png"
+    
+    monkeypatch.setattr(video_tasks.bailian_image_service, "expand_image", fake_expand)
+    monkeypatch.setattr(settings, "IMAGE_EXPANSION_CONCURRENCY", 2)
+    return gauge
+
+
+async def test_expand_images_concurrency_and_order(expand):
+    slides = _slides(6)
+    checkpoint = JobCheckpoint("task")
+    task = FakeTask()
+    
+    await video_tasks._expand_images(task, slides, VideoConfigRequest(), checkpoint)
+    
+    assert expand.peak == 2
+    for i, slide in enumerate(slides):
+        assert slide.expanded_image_url == (None if i == 3 else f"exp_{i}.png")
+    assert checkpoint.items(JobCheckpoint.EXPANDED) == {
+        i: f"exp_{i}.png" for i in range(6) if i != 3
+    }
+    progress = [value for _, value in task.reports]
+    assert progress == sorted(progress)
+    assert progress[-1] == pytest.approx(0.4)
+
+
+async def test_expand_images_skips_checkpointed(expand):
+    slides = _slides(3)
+    checkpoint = JobCheckpoint("task")
+    checkpoint.save(JobCheckpoint.EXPANDED, 1, "restored.png")
+    
+    await video_tasks._expand_images(FakeTask(), slides, VideoConfigRequest(), checkpoint)
+    
+    assert [slide.expanded_image_url for slide in slides] == ["exp_0.png", "restored.png", "exp_2.png"]
+
+
+@pytest.fixture
+def synthesize(redis, monkeypatch):
+    gauge = Gauge()
+    
+    async def fake_speech(text, voice, speed):
+        index = int(text[1:-1])
+        await gauge.run(0.01 * (6 - index))
+        if index == 2:
+            raise RuntimeError("tts failed")
+        return {"url": f"/output/tts_{index}.mp3"}
+    
+    monkeypatch.setattr(video_tasks.bailian_tts_service, "generate_speech", fake_speech)
+    monkeypatch.setattr(settings, "TTS_CONCURRENCY", 3)
+    return gauge
+
+
+async def test_generate_voices_concurrency_and_order(synthesize):
+    slides = _slides(6)
+    # 没有配音文本的幻灯片不参与合成
+    slides[4].voice_text = ""
+    checkpoint = JobCheckpoint("task")
+    task = FakeTask()
+    
+    await video_tasks._generate_voices(task, slides, VideoConfigRequest(), checkpoint)
+    
+    assert synthesize.peak == 3
+    assert [slide.voice_url for slide in slides] == [
+        "/output/tts_0.mp3", "/output/tts_1.mp3", None, "/output/tts_3.mp3", None, "/output/tts_5.mp3"
+    ]
+    assert sorted(checkpoint.items(JobCheckpoint.VOICE)) == [0, 1, 3, 5]
+    progress = [value for _, value in task.reports]
+    assert progress == sorted(progress)
+    assert progress[-1] == pytest.approx(0.6)
+    assert len(task.reports) == 1 + 5
@@ -0,0 +1,94 @@
+"""
+任务状态批量持久化
+"""
+
+import time
+
+import pytest
+from sqlalchemy import create_engine, event, insert, select
+from sqlalchemy.engine import Engine
+
+from app.config import settings
+from app.db import models  # noqa: F401  注册 users 表（外键）
+from app.db.database import Base
+from app.db.material import VideoTaskDB
+from app.services.task_recorder import TaskRecorder
+
+
+@pytest.fixture
+def database(tmp_path, monkeypatch):
+    """sqlite 中的 video_tasks 表，统计 executemany 次数"""
+    url = f"sqlite:///{tmp_path / 'tasks.db'}"
+    monkeypatch.setattr(settings, "DATABASE_URL", url)
+    engine = create_engine(url)
+    Base.metadata.create_all(engine)
+    table = VideoTaskDB.__table__
+    with engine.begin() as conn:
+        for i in range(3):
+            conn.execute(insert(table).values(user_id=1, task_id=f"task{i}", status="pending"))
+    
+    batches = []
+    
+    def on_execute(conn, cursor, statement, parameters, context, executemany):
+        if statement.startswith("UPDATE"):
+            batches.append(len(parameters) if executemany else 1)
+    
+    event.listen(Engine, "before_cursor_execute", on_execute)
+    yield engine, batches
+    event.remove(Engine, "before_cursor_execute", on_execute)
+    engine.dispose()
+
+
+def _rows(engine) -> dict:
+    table = VideoTaskDB.__table__
+    with engine.connect() as conn:
+        return {
+            row.task_id: row
+            for row in conn.execute(select(table.c.task_id, table.c.status, table.c.progress, table.c.message))
+        }
+
+
+@pytest.fixture
+def recorder():
+    recorder = TaskRecorder(interval=3600)
+    yield recorder
+    recorder.close()
+
+
+def test_updates_are_merged_into_one_executemany(database, recorder):
+    engine, batches = database
+    for step in range(1, 11):
+        for i in range(3):
+            recorder.record(f"task{i}", {"status": "processing", "progress": step / 10, "message": f"步骤 {step}"})
+    recorder.flush()
+    
+    assert batches == [3]
+    rows = _rows(engine)
+    for i in range(3):
+        assert (rows[f"task{i}"].status, rows[f"task{i}"].progress, rows[f"task{i}"].message) == (
+            "processing", 100, "步骤 10"
+        )
+
+
+def test_status_fields_are_dropped(database, recorder):
+    """不对应 video_tasks 列的字段不产生更新"""
+    engine, batches = database
+    recorder.record("task0", {"celery_task_id": "abc", "updated_at": 1.0})
+    recorder.flush()
+    assert batches == []
+
+
+@pytest.mark.parametrize("status", ["completed", "failed", "cancelled"])
+def test_terminal_status_flushes_immediately(database, recorder, status):
+    engine, batches = database
+    recorder.record("task1", {"status": "processing", "progress": 0.5})
+    recorder.record("task1", {"status": status, "message": "结束"})
+    
+    # 刷新间隔为一小时，只有终止状态会唤醒后台线程
+    deadline = time.monotonic() + 5
+    while _rows(engine)["task1"].status != status and time.monotonic() < deadline:
+        time.sleep(0.02)
+    
+    row = _rows(engine)["task1"]
+    assert (row.status, row.progress, row.message) == (status, 50, "结束")
+    assert batches == [1]
@@ -0,0 +1,79 @@
+"""
+配音缓存：命中、未命中，淘汰后已交出的 URL 仍然可用
+"""
+
+import os
+from pathlib import Path
+
+import pytest
+
+from app.config import settings
+from app.services import tts_cache as tts_cache_module
+from app.services.disk_cache import DiskCache
+from app.services.tts_cache import STATS_KEY, tts_cache
+
+
+@pytest.fixture
+def cache(redis, dirs, monkeypatch):
+    """临时目录中的磁盘缓存（容量 10 字节）"""
+    disk_cache = DiskCache("tts", str(dirs / "cache"), 10)
+    monkeypatch.setattr(tts_cache_module, "tts_disk_cache", disk_cache)
+    monkeypatch.setattr(settings, "TTS_CACHE_ENABLED", True)
+    monkeypatch.setattr(settings, "STORAGE_TYPE", "local")
+    return disk_cache
+
+
+def _key(text: str) -> str:
+    return tts_cache.make_key(text, "longxiaochun", 1.0, "cosyvoice-v1")
+
+
+async def test_miss(cache, redis):
+    assert await tts_cache.get(_key("你好")) is None
+    assert redis.hget(STATS_KEY, "misses") == "1"
+
+
+async def test_hit_links_audio_into_output(cache, redis, dirs):
+    key = _key("你好")
+    url = await tts_cache.put(key, b"audio")
+    
+    assert await tts_cache.get(key) == url
+    assert url.startswith("/output/tts_")
+    assert Path(tts_cache.local_path(url)).read_bytes() == b"audio"
+    assert redis.hget(STATS_KEY, "hits") == "1"
+    # 相同配音的任务共用输出目录中的同一个文件
+    assert len(list((dirs / "output").iterdir())) == 1
+
+
+def test_normalized_text_shares_key():
+    assert _key("你好，  世界") == _key("你好, 世界")
+    assert _key("你好") != tts_cache.make_key("你好", "longxiaochun", 1.2, "cosyvoice-v1")
+
+
+async def test_handed_out_url_survives_eviction(cache, dirs):
+    first = _key("第一段")
+    first_url = await tts_cache.put(first, b"12345678")
+    os.utime(cache.get(first, ".mp3"), (1, 1))
+    second_url = await tts_cache.put(_key("第二段"), b"abcdefgh")
+    
+    # 超出容量，最久未访问的一项被淘汰，已交给任务的 URL 仍然可用
+    assert cache.stats()["evictions"] == 1
+    assert await tts_cache.get(first) is None
+    assert Path(tts_cache.local_path(first_url)).read_bytes() == b"12345678"
+    assert Path(tts_cache.local_path(second_url)).read_bytes() == b"abcdefgh"
+
+
+async def test_evicted_right_after_commit(cache):
+    cache.max_bytes = 1
+    url = await tts_cache.put(_key("你好"), b"audio")
+    assert cache.stats()["evictions"] == 1
+    assert Path(tts_cache.local_path(url)).read_bytes() == b"audio"
+
+
+async def test_disabled_cache_writes_to_output(cache, dirs, monkeypatch):
+    monkeypatch.setattr(settings, "TTS_CACHE_ENABLED", False)
+    key = _key("你好")
+    url = await tts_cache.put(key, b"audio")
+    
+    assert url.startswith("/output/tts_")
+    assert Path(tts_cache.local_path(url)).read_bytes() == b"audio"
+    assert await tts_cache.get(key) is None
@@ -0,0 +1,134 @@
+"""
+视频 API：取消任务的权限与清理、匿名请求去重
+"""
+
+from types import SimpleNamespace
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.api import video
+from app.auth.utils import get_optional_user
+from app.models.schemas import VideoConfigRequest
+from app.services import cancellation
+from app.services.cancellation import is_cancelled
+from app.services.checkpoint import JobCheckpoint
+from app.services.task_status import task_status_store
+from app.tasks import scheduler
+from app.tasks.scheduler import fair_scheduler
+from app.tasks.workflow_tasks import WorkflowProgress, merge_video_task
+
+
+@pytest.fixture
+def submitted(redis, monkeypatch):
+    """记录调度器提交给 Celery 的任务"""
+    jobs = []
+    monkeypatch.setattr(scheduler, "_submit", jobs.append)
+    return jobs
+
+
+@pytest.fixture
+def client(submitted):
+    """挂载视频路由的应用，current["user"] 为当前登录用户"""
+    app = FastAPI()
+    app.include_router(video.router, prefix="/api/v1/video")
+    current = {"user": None}
+    app.dependency_overrides[get_optional_user] = lambda: current["user"]
+    with TestClient(app) as test_client:
+        yield test_client, current
+
+
+def _create(owner_id=None, status="processing") -> str:
+    task_status_store.create("task", owner_id=owner_id, celery_task_id="celery-1")
+    task_status_store.update("task", status)
+    return "task"
+
+
+def test_owner_cancels_task(client):
+    test_client, current = client
+    current["user"] = SimpleNamespace(id=1)
+    _create(owner_id=1)
+    
+    response = test_client.delete("/api/v1/video/task")
+    assert response.status_code == 200
+    assert response.json()["data"]["status"] == "cancelled"
+    assert task_status_store.get("task")["status"] == "cancelled"
+    assert is_cancelled("task")
+
+
+@pytest.mark.parametrize("user", [None, SimpleNamespace(id=2)])
+def test_other_users_cannot_cancel(client, user):
+    test_client, current = client
+    current["user"] = user
+    _create(owner_id=1)
+    
+    response = test_client.delete("/api/v1/video/task")
+    assert response.status_code == 403
+    assert task_status_store.get("task")["status"] == "processing"
+    assert not is_cancelled("task")
+
+
+def test_anonymous_task_cancelled_by_task_id(client):
+    test_client, _ = client
+    _create()
+    assert test_client.delete("/api/v1/video/task").status_code == 200
+
+
+def test_cancelled_fanout_job_is_cleaned_up_by_merge_task(client, submitted, redis, dirs, monkeypatch):
+    test_client, _ = client
+    deleted = []
+    
+    async def delete_file(url):
+        deleted.append(url)
+        return True
+    
+    monkeypatch.setattr(cancellation, "get_storage", lambda: SimpleNamespace(delete_file=delete_file))
+    
+    # 已提交给 Worker 的分布式工作流：片段 0 已上传，合并任务的 ID 为 celery-1
+    _create()
+    fair_scheduler.enqueue("task", "task", "ip:test", "video", {}, "celery-1")
+    fair_scheduler.dispatch()
+    assert [job["celery_task_id"] for job in submitted] == ["celery-1"]
+    JobCheckpoint("task").save(JobCheckpoint.SEGMENT_URL, 0, "https://oss/segment_task_0.mp4")
+    WorkflowProgress("task").init({"expand": 0, "encode": 2, "voice": 0})
+    temp = dirs / "output" / "temp_task_src_1.jpg"
+    temp.write_bytes(b"image")
+    
+    assert test_client.delete("/api/v1/video/task").status_code == 200
+    
+    # 合并任务没有被撤销，chord 完成后照常运行并走取消分支清理
+    slides = [{"id": str(i), "image_url": f"{i}.jpg"} for i in range(2)]
+    results = [{"index": 0, "segment_url": "https://oss/segment_task_0.mp4"}, {"index": 1, "cancelled": True}]
+    result = merge_video_task.run(results, "task", slides, VideoConfigRequest().model_dump())
+    
+    assert result["cancelled"]
+    assert deleted == ["https://oss/segment_task_0.mp4"]
+    assert not temp.exists()
+    assert not JobCheckpoint("task").load().count(JobCheckpoint.SEGMENT_URL)
+    assert not redis.exists(WorkflowProgress("task").key)
+    assert task_status_store.get("task")["status"] == "cancelled"
+
+
+def test_cancel_unknown_or_finished_task(client):
+    test_client, current = client
+    current["user"] = SimpleNamespace(id=1)
+    assert test_client.delete("/api/v1/video/missing").status_code == 404
+    
+    _create(owner_id=1, status="completed")
+    assert test_client.delete("/api/v1/video/task").status_code == 409
+
+
+def test_anonymous_retry_with_idempotency_key_is_deduplicated(client):
+    test_client, _ = client
+    body = {"title": "旅行", "slides": [{"image_url": "a.jpg", "caption": "第一天"}], "config": {}}
+    
+    first = test_client.post("/api/v1/video/create", json=body, headers={"Idempotency-Key": "abc"})
+    second = test_client.post("/api/v1/video/create", json=body, headers={"Idempotency-Key": "abc"})
+    assert first.status_code == second.status_code == 200
+    assert second.json()["data"]["deduplicated"]
+    assert second.json()["data"]["task_id"] == first.json()["data"]["task_id"]
+    
+    # 没有 Idempotency-Key 的匿名请求不按内容去重
+    third = test_client.post("/api/v1/video/create", json=body)
+    assert third.json()["data"]["task_id"] != first.json()["data"]["task_id"]
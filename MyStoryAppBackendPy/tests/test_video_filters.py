@@ -0,0 +1,111 @@
+"""
+幻灯片滤镜链：字幕转义
+"""
+
+import shutil
+import subprocess
+
+import pytest
+
+from app.models.schemas import Slide, VideoConfigRequest
+from app.services.video_service import escape_filter_value, video_service
+
+
+HOSTILE_CAPTIONS = [
+    "it's",
+    "a:b=c,d;e[f]g\\h",
+    "100% %{pts} %{eif\\:n\\:d}",
+    "':textfile=/etc/passwd:text='",
+    "x\\':textfile=/etc/passwd",
+    "end\\",
+    "[out];[0:v]null",
+    "中文，字幕：测试",
+]
+
+WHITESPACE = " \n\t\r"
+
+
+def _get_token(buf: str, terminators: str):
+    """按 ffmpeg av_get_token 的规则读取一个 token，返回 (token, 剩余部分)"""
+    i = 0
+    while i < len(buf) and buf[i] in WHITESPACE:
+        i += 1
+    out = []
+    end = 0
+    while i < len(buf) and buf[i] not in terminators:
+        c = buf[i]
+        if c == "\\" and i + 1 < len(buf):
+            out.append(buf[i + 1])
+            i += 2
+            end = len(out)
+        elif c == "'":
+            i += 1
+            while i < len(buf) and buf[i] != "'":
+                out.append(buf[i])
+                i += 1
+            i += 1
+            end = len(out)
+        else:
+            out.append(c)
+            i += 1
+            if c not in WHITESPACE:
+                end = len(out)
+    return "".join(out[:end]), buf[i:]
+
+
+def _parse_chain(chain: str):
+    """按滤镜图与滤镜选项两层规则解析滤镜链，返回 [(滤镜名, {选项: 值})]"""
+    filters = []
+    while chain:
+        name, _, rest = chain.partition("=")
+        if "," in name:
+            name, _, rest = chain.partition(",")
+            filters.append((name, {}))
+            chain = rest
+            continue
+        args, chain = _get_token(rest, "[],;")
+        assert chain[:1] in ("", ","), f"滤镜链被截断: {chain!r}"
+        chain = chain[1:]
+        
+        options = {}
+        while args:
+            key, _, args = args.partition("=")
+            value, args = _get_token(args, ":")
+            options[key] = value
+            args = args[1:]
+        filters.append((name, options))
+    return filters
+
+
+@pytest.mark.parametrize("caption", HOSTILE_CAPTIONS)
+def test_caption_cannot_change_drawtext_options(caption):
+    slide = Slide(id="1", image_url="x.jpg", caption=caption)
+    chain = video_service._build_slide_filter(slide, 1280, 720, VideoConfigRequest())
+    
+    filters = _parse_chain(chain)
+    assert [name for name, _ in filters] == ["fps", "scale", "pad", "fade", "fade", "drawtext"]
+    options = filters[-1][1]
+    assert options["text"] == caption
+    assert options["expansion"] == "none"
+    assert "textfile" not in options
+
+
+@pytest.mark.skipif(shutil.which("ffmpeg") is None, reason="需要 ffmpeg")
+@pytest.mark.parametrize("caption", HOSTILE_CAPTIONS)
+def test_escaped_value_round_trips_through_ffmpeg(caption, tmp_path):
+    """用 metadata 滤镜回显转义后的值，验证 ffmpeg 实际解析结果与原文一致"""
+    out = tmp_path / "meta.txt"
+    graph = (
+        f"metadata=mode=add:key=caption:value={escape_filter_value(caption)},"
+        f"metadata=mode=print:file={out}"
+    )
+    subprocess.run(
+        [
+            "ffmpeg", "-hide_banner", "-v", "error",
+            "-f", "lavfi", "-i", "color=s=32x32:d=0.04",
+            "-vf", graph, "-frames:v", "1", "-f", "null", "-"
+        ],
+        check=True
+    )
+    lines = out.read_text(encoding="utf-8").splitlines()
+    assert f"caption={caption}" in lines
@@ -0,0 +1,100 @@
+"""
+Worker 队列：任务路由、启动参数与拆分执行的提交
+"""
+
+import pytest
+from celery.canvas import Signature
+
+from app.config import settings
+from app.tasks import celery_app, video_tasks, worker
+
+
+def _queue(name: str) -> str:
+    return celery_app.amqp.router.route({}, name)["queue"].name
+
+
+@pytest.mark.parametrize("name, queue", [
+    ("app.tasks.video_tasks.prepare_media_task", settings.CELERY_IO_QUEUE),
+    ("app.tasks.workflow_tasks.expand_slide_task", settings.CELERY_IO_QUEUE),
+    ("app.tasks.workflow_tasks.voice_slide_task", settings.CELERY_IO_QUEUE),
+    ("app.tasks.video_tasks.generate_video_task", settings.CELERY_CPU_QUEUE),
+    ("app.tasks.video_tasks.generate_preview_task", settings.CELERY_CPU_QUEUE),
+    ("app.tasks.workflow_tasks.encode_slide_task", settings.CELERY_CPU_QUEUE),
+    ("app.tasks.workflow_tasks.merge_video_task", settings.CELERY_CPU_QUEUE),
+])
+def test_task_routes(name, queue):
+    assert _queue(name) == queue
+
+
+def test_worker_argv(monkeypatch):
+    monkeypatch.setattr(settings, "CELERY_CPU_CONCURRENCY", 3)
+    
+    io = worker.worker_argv("io")
+    assert io[io.index("--queues") + 1] == settings.CELERY_IO_QUEUE
+    assert io[io.index("--pool") + 1] == settings.CELERY_IO_POOL
+    assert io[io.index("--concurrency") + 1] == str(settings.CELERY_IO_CONCURRENCY)
+    
+    cpu = worker.worker_argv("cpu")
+    assert cpu[cpu.index("--queues") + 1] == settings.CELERY_CPU_QUEUE
+    assert cpu[cpu.index("--pool") + 1] == "prefork"
+    assert cpu[cpu.index("--concurrency") + 1] == "3"
+    
+    with pytest.raises(ValueError):
+        worker.worker_argv("gpu")
+
+
+@pytest.mark.parametrize("configured, cores, slots, expected", [
+    (5, 16, 4, 5),
+    (0, 16, 4, 4),
+    (0, 2, 4, 1),
+    (0, None, 1, 1),
+])
+def test_cpu_concurrency(monkeypatch, configured, cores, slots, expected):
+    monkeypatch.setattr(settings, "CELERY_CPU_CONCURRENCY", configured)
+    monkeypatch.setattr(worker.os, "cpu_count", lambda: cores)
+    monkeypatch.setattr(worker, "get_render_slots", lambda: slots)
+    assert worker.cpu_concurrency() == expected
+
+
+class FakeChain:
+    """代替 celery.chain：记录各签名的任务名和任务ID"""
+    
+    def __init__(self, submitted: list):
+        self.submitted = submitted
+    
+    def __call__(self, *signatures):
+        self.signatures = signatures
+        return self
+    
+    def apply_async(self):
+        self.submitted.append([(sig.task, sig.options.get("task_id")) for sig in self.signatures])
+
+
+@pytest.fixture
+def submitted(monkeypatch):
+    """提交的 chain 与单独提交的签名"""
+    submitted = []
+    monkeypatch.setattr(video_tasks, "chain", FakeChain(submitted))
+    monkeypatch.setattr(
+        Signature, "apply_async",
+        lambda sig: submitted.append([(sig.task, sig.options.get("task_id"), sig.kwargs)])
+    )
+    return submitted
+
+
+def test_split_workflow_prepares_media_on_io_queue(submitted):
+    slides = [{"id": "1", "image_url": "1.jpg", "voice_text": "hi"}]
+    video_tasks.start_split_workflow("task", slides, {"ai_image_expansion": False}, root_id="root")
+    
+    # 合成任务使用调度器记录的 celery_task_id，取消时能撤销
+    assert submitted == [[
+        ("app.tasks.video_tasks.prepare_media_task", None),
+        ("app.tasks.video_tasks.generate_video_task", "root")
+    ]]
+
+
+def test_split_workflow_without_media_composes_directly(submitted):
+    slides = [{"id": "1", "image_url": "1.jpg"}]
+    video_tasks.start_split_workflow("task", slides, {"ai_image_expansion": False}, root_id="root")
+    
+    assert submitted == [[("app.tasks.video_tasks.generate_video_task", "root", {"prepared": True})]]
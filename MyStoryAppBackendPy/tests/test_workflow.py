@@ -0,0 +1,130 @@
+"""
+分布式工作流：子任务失败与合并时缺少片段
+"""
+
+import pytest
+
+from app.models.schemas import VideoConfigRequest
+from app.services.cancellation import JobCancelled
+from app.services.task_status import task_status_store
+from app.tasks import workflow_tasks
+from app.tasks.scheduler import fair_scheduler
+from app.tasks.workflow_tasks import (
+    WorkflowIncomplete, _merge_video, encode_slide_task, expand_slide_task, merge_video_task
+)
+
+
+SLIDES = [{"id": str(i), "image_url": f"{i}.jpg"} for i in range(3)]
+CONFIG = VideoConfigRequest(ai_image_expansion=False).model_dump()
+
+
+class FakeTask:
+    def report(self, task_id, state, meta):
+        pass
+
+
+@pytest.fixture
+def released(redis, monkeypatch):
+    """记录释放的调度槽位"""
+    calls = []
+    monkeypatch.setattr(fair_scheduler, "release", lambda job_id, dispatch=True: calls.append(job_id))
+    return calls
+
+
+@pytest.fixture
+def failing_encode(monkeypatch):
+    async def fail(*args):
+        raise RuntimeError("ffmpeg crashed")
+    
+    monkeypatch.setattr(workflow_tasks, "_encode_slide", fail)
+
+
+async def test_merge_reports_missing_segments(redis):
+    results = [
+        {"index": 0, "segment_url": "https://oss/seg_0.mp4"},
+        {"index": 1, "error": "ffmpeg crashed"},
+        {"index": 0, "voice_url": "https://oss/voice_0.mp3"}
+    ]
+    with pytest.raises(WorkflowIncomplete) as info:
+        await _merge_video(FakeTask(), results, "task", SLIDES, CONFIG)
+    assert info.value.missing == [1, 2]
+    assert "幻灯片 1: ffmpeg crashed" in str(info.value)
+
+
+async def test_merge_after_cancelled_subtask_is_cancelled(redis):
+    results = [
+        {"index": 0, "segment_url": "https://oss/seg_0.mp4"},
+        {"index": 1, "cancelled": True},
+        {"index": 2, "cancelled": True}
+    ]
+    with pytest.raises(JobCancelled):
+        await _merge_video(FakeTask(), results, "task", SLIDES, CONFIG)
+
+
+def test_merge_task_fails_job_without_retry(released):
+    task_status_store.create("task")
+    result = merge_video_task.run([{"index": 0, "segment_url": "https://oss/seg_0.mp4"}], "task", SLIDES, CONFIG)
+    
+    assert result["success"] is False
+    assert released == ["task"]
+    record = task_status_store.get("task")
+    assert record["status"] == "failed"
+    assert "[1, 2]" in record["error"]
+
+
+def test_encode_retry_leaves_job_alone(released, failing_encode):
+    task_status_store.create("task")
+    # 直接调用时 retry() 抛出原异常
+    with pytest.raises(RuntimeError):
+        encode_slide_task.run({"image_url": "1.jpg"}, "task", 1, SLIDES[1], CONFIG, "root")
+    
+    assert task_status_store.get("task")["status"] == "pending"
+    assert released == []
+
+
+def test_encode_retries_exhausted_returns_error(released, failing_encode):
+    task_status_store.create("task")
+    encode_slide_task.push_request(retries=encode_slide_task.max_retries)
+    try:
+        result = encode_slide_task.run({"image_url": "1.jpg"}, "task", 1, SLIDES[1], CONFIG, "root")
+    finally:
+        encode_slide_task.pop_request()
+    
+    assert result == {"index": 1, "error": "ffmpeg crashed"}
+    assert task_status_store.get("task")["status"] == "pending"
+    assert released == []
+
+
+async def test_expand_download_failure_keeps_original(redis, monkeypatch):
+    async def fail(*args):
+        raise OSError("download failed")
+    
+    monkeypatch.setattr(workflow_tasks.video_service, "download_image", fail)
+    image_url = await workflow_tasks._expand_slide("task", 1, SLIDES[1], CONFIG)
+    assert image_url == "1.jpg"
+
+
+@pytest.fixture
+def failing_expand(monkeypatch):
+    async def fail(*args):
+        raise RuntimeError("redis down")
+    
+    monkeypatch.setattr(workflow_tasks, "_expand_slide", fail)
+    monkeypatch.setattr(workflow_tasks, "_report", lambda *args: None)
+
+
+def test_expand_retries_then_falls_back_to_original(released, failing_expand):
+    task_status_store.create("task")
+    with pytest.raises(RuntimeError):
+        expand_slide_task.run("task", 1, SLIDES[1], CONFIG, "root")
+    
+    expand_slide_task.push_request(retries=expand_slide_task.max_retries)
+    try:
+        result = expand_slide_task.run("task", 1, SLIDES[1], CONFIG, "root")
+    finally:
+        expand_slide_task.pop_request()
+    
+    # 编码任务照常使用原图，chord 与合并任务不受影响
+    assert result == {"index": 1, "error": "redis down", "image_url": "1.jpg"}
+    assert task_status_store.get("task")["status"] == "pending"
+    assert released == []